@@ -0,0 +1,20 @@
+from anthrotrace.core.parquet_archive import ParquetArchive, archive_closed_partitions
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+import argparse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move prompt logs older than the retention window to Parquet")
+    parser.add_argument("--db-path", default="data/prompt_logs.db", help="Hot SQLite DB")
+    parser.add_argument("--archive-dir", default="data/archive", help="Root of the day-partitioned Parquet archive")
+    parser.add_argument("--retain-days", type=int, default=30, help="Full UTC days to keep in SQLite")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip the VACUUM that returns freed space")
+    args = parser.parse_args()
+
+    repo = SQLiteRepository(db_path=args.db_path)
+    archive = ParquetArchive(args.archive_dir)
+    archived = archive_closed_partitions(repo, archive, retain_days=args.retain_days, vacuum=not args.no_vacuum)
+    for day, rows in archived.items():
+        print(f"[ARCHIVE] {day}: {rows} rows -> {archive.partition_path(day)}")
+    print(f"[ARCHIVE] {sum(archived.values())} rows from {len(archived)} days archived to {args.archive_dir}")
+    repo.close()
@@ -8,55 +8,53 @@ from datetime import datetime
 def generate_metrics_report(output_format="table", filter_category=None, since=None, until=None):
     client = clickhouse_connect.get_client(host='localhost', port=8123)
     repo = ClickHousePromptLogRepository(clickhouse_client=client)
-    stats = repo.get_aggregated_stats()
+    # One grouped query; ClickHouse merges the rollup's t-digests into per-category quantiles
+    summaries = repo.get_category_summaries(start_time=since, end_time=until)
+    overall = repo.aggregate_summary(start_time=since, end_time=until)
 
     if filter_category:
-        stats = [row for row in stats if row[0] == filter_category]
+        summaries = [row for row in summaries if row["category"] == filter_category]
+        overall = summaries[0] if summaries else None
 
-    if since or until:
-        def in_date_range(row):
-            timestamp = row[4] if len(row) > 4 else None  # assuming timestamp is at index 4 if present
-            if timestamp:
-                if since and timestamp < since:
-                    return False
-                if until and timestamp > until:
-                    return False
-            return True
-
-        stats = [row for row in stats if in_date_range(row)]
+    rows = [report_row(summary["category"], summary) for summary in summaries]
+    total = report_row("All Categories", overall) if overall else None
 
     if output_format == "table":
-        print("Category           | Total Tokens | Total Cost (USD) | Avg Duration (s)")
-        print("-------------------|--------------|-------------------|-----------------")
-        for category, total_tokens, total_cost, avg_duration in stats:
-            print(f"{category:<19} | {total_tokens:<12} | {total_cost:<17} | {avg_duration:<15}")
-
-        # Summary totals
-        total_tokens_sum = sum(row[1] for row in stats)
-        total_cost_sum = round(sum(row[2] for row in stats), 5)
-        avg_duration_avg = round(sum(row[3] for row in stats) / len(stats), 2) if stats else 0
-        print(f"\n[SUMMARY] Total Tokens: {total_tokens_sum} | Total Cost (USD): {total_cost_sum} | Avg Duration (s): {avg_duration_avg}")
+        print("Category           | Total Tokens | Total Cost (USD) | Avg Duration (s) | Latency p50/p90/p99 (s) | Cost p50/p90/p99 (USD)")
+        print("-------------------|--------------|------------------|------------------|-------------------------|------------------------")
+        for row in rows:
+            print(format_table_row(row))
+        if total:
+            print(f"\n[SUMMARY] {format_table_row(total)}")
 
     elif output_format == "json":
-        json_output = [
-            {
-                "category": category,
-                "total_tokens": total_tokens,
-                "total_cost_usd": total_cost,
-                "avg_duration_seconds": avg_duration
-            }
-            for category, total_tokens, total_cost, avg_duration in stats
-        ]
-        summary = {
-            "total_tokens_sum": sum(row[1] for row in stats),
-            "total_cost_usd_sum": round(sum(row[2] for row in stats), 5),
-            "avg_duration_seconds_avg": round(sum(row[3] for row in stats) / len(stats), 2) if stats else 0
-        }
-        print(json.dumps({"data": json_output, "summary": summary}, indent=2))
+        print(json.dumps({"data": rows, "summary": total}, indent=2))
     else:
         print(f"Unsupported format: {output_format}")
 
 
+def report_row(category, summary):
+    return {
+        "category": category,
+        "total_tokens": summary["input_tokens"] + summary["output_tokens"],
+        "total_cost_usd": round(summary["cost"], 5),
+        "avg_duration_seconds": round(summary["duration_sum"] / summary["total_runs"], 2),
+        "latency_p50_sec": round(summary["latency_p50_sec"], 2),
+        "latency_p90_sec": round(summary["latency_p90_sec"], 2),
+        "latency_p99_sec": round(summary["latency_p99_sec"], 2),
+        "cost_p50_usd": round(summary["cost_p50_usd"], 5),
+        "cost_p90_usd": round(summary["cost_p90_usd"], 5),
+        "cost_p99_usd": round(summary["cost_p99_usd"], 5),
+    }
+
+
+def format_table_row(row):
+    latency = f"{row['latency_p50_sec']}/{row['latency_p90_sec']}/{row['latency_p99_sec']}"
+    cost = f"{row['cost_p50_usd']}/{row['cost_p90_usd']}/{row['cost_p99_usd']}"
+    return (f"{row['category']:<19} | {row['total_tokens']:<12} | {row['total_cost_usd']:<16} | "
+            f"{row['avg_duration_seconds']:<16} | {latency:<23} | {cost}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate metrics report from ClickHouse")
     parser.add_argument("--format", choices=["table", "json"], default="table", help="Output format")
@@ -65,4 +63,4 @@ if __name__ == "__main__":
     parser.add_argument("--until", type=lambda s: datetime.strptime(s, '%Y-%m-%d'), help="Filter records until this date (YYYY-MM-DD)")
     args = parser.parse_args()
 
-    generate_metrics_report(output_format=args.format, filter_category=args.category, since=args.since, until=args.until)
\ No newline at end of file
+    generate_metrics_report(output_format=args.format, filter_category=args.category, since=args.since, until=args.until)
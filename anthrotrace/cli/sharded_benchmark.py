@@ -0,0 +1,65 @@
+from anthrotrace.core.sharded_executor import ShardedBenchmarkExecutor, merge_shards, run_shard
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.benchmark_results import DEFAULT_MODEL
+import argparse
+import glob
+import os
+
+
+def build_target_repository(target, db_path):
+    if target == "clickhouse":
+        import clickhouse_connect
+        from anthrotrace.core.clickhouse_prompt_log_repository import ClickHousePromptLogRepository
+        client = clickhouse_connect.get_client(host='localhost', port=8123)
+        return ClickHousePromptLogRepository(clickhouse_client=client)
+    return SQLiteRepository(db_path=db_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a prompt suite in shards and merge the per-shard results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_run_arguments(subparser):
+        subparser.add_argument("--prompts", default="anthrotrace/data/anthrotrace_common_prompts.yaml", help="Prompt suite YAML")
+        subparser.add_argument("--shard-count", type=int, required=True, help="Total number of shards")
+        subparser.add_argument("--output-dir", default="data/shards", help="Directory for per-shard SQLite files")
+        subparser.add_argument("--model", default=DEFAULT_MODEL, help="Model to benchmark")
+        subparser.add_argument("--max-concurrency", type=int, default=100, help="In-flight requests per shard")
+        subparser.add_argument("--run-id", help="Run id shared by every shard; reuse it to resume")
+        subparser.add_argument("--text-storage", choices=["plain", "zlib", "zstd", "hash"], default="plain",
+                               help="How shard files store prompt/response text (see SQLiteRepository)")
+
+    run_shard_parser = subparsers.add_parser("run-shard", help="Run a single shard (one per host)")
+    add_run_arguments(run_shard_parser)
+    run_shard_parser.add_argument("--shard-index", type=int, required=True, help="Shard to run, 0-based")
+
+    run_all_parser = subparsers.add_parser("run-all", help="Run every shard in its own local process")
+    add_run_arguments(run_all_parser)
+    run_all_parser.add_argument("--metrics-port", type=int, help="Serve aggregated Prometheus metrics on this port")
+    run_all_parser.add_argument("--merge", action="store_true", help="Merge the shards into --db-path when done")
+    run_all_parser.add_argument("--db-path", default="data/prompt_logs.db", help="Main SQLite DB for --merge")
+
+    merge_parser = subparsers.add_parser("merge", help="Bulk-load shard files into the main store")
+    merge_parser.add_argument("shards", nargs="*", help="Shard DB files (default: every file in --output-dir)")
+    merge_parser.add_argument("--output-dir", default="data/shards", help="Directory holding the shard files")
+    merge_parser.add_argument("--target", choices=["sqlite", "clickhouse"], default="sqlite", help="Where to merge")
+    merge_parser.add_argument("--db-path", default="data/prompt_logs.db", help="Main SQLite DB")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if args.command == "run-shard":
+        run_shard(args.prompts, args.shard_index, args.shard_count, output_dir=args.output_dir, model=args.model,
+                  api_key=api_key, max_concurrency=args.max_concurrency, run_id=args.run_id,
+                  text_storage=args.text_storage)
+    elif args.command == "run-all":
+        executor = ShardedBenchmarkExecutor(args.prompts, args.shard_count, output_dir=args.output_dir,
+                                            model=args.model, api_key=api_key, max_concurrency=args.max_concurrency,
+                                            run_id=args.run_id, metrics_port=args.metrics_port,
+                                            text_storage=args.text_storage)
+        print(f"[SHARD] Run id: {executor.run_id}")
+        shard_paths = executor.run()
+        if args.merge:
+            executor.merge(shard_paths, SQLiteRepository(db_path=args.db_path))
+    else:
+        shard_paths = args.shards or sorted(glob.glob(os.path.join(args.output_dir, "shard-*.db")))
+        merge_shards(shard_paths, build_target_repository(args.target, args.db_path))
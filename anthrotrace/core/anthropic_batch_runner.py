@@ -0,0 +1,169 @@
+import time
+
+from anthrotrace.core.cost_calculator import calculate_cost
+from anthrotrace.core.run_manifest import make_prompt_id
+from anthrotrace.core.benchmark_results import (
+    DEFAULT_MODEL, DEFAULT_SYSTEM_PROMPT, build_message_params, build_result, build_failure_result,
+    emit_result_metrics, flush_metrics, response_text, usage_counts
+)
+
+# Limits of a single Message Batch (https://docs.anthropic.com/en/docs/build-with-claude/batch-processing)
+MAX_REQUESTS_PER_BATCH = 100_000
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+
+
+class AnthropicBatchBenchmarkRunner:
+    """
+    Runs large, latency-insensitive prompt suites through the Message Batches API.
+
+    Prompts (as returned by load_prompts_with_categories) are split into batches, submitted,
+    polled with exponential backoff until processing ends, and the streamed results are
+    bulk-inserted into the repository `insert_log_batch_size` rows at a time. Costs are computed
+    with `batch=True` so the cost calculator applies the batch discount, and rows are stored
+    with execution_mode 'batch' since they carry no per-request latency.
+
+    Point `base_url` (or inject `client`) at a local fake batches endpoint to test without the API.
+
+    Usage:
+        runner = AnthropicBatchBenchmarkRunner(api_key, repository=SQLiteRepository())
+        results = runner.run(prompts)
+    """
+
+    def __init__(self, api_key=None, repository=None, metrics_exporter=None, cost_calculator=None, client=None,
+                 base_url=None, batch_size=10_000, poll_interval=10.0, max_poll_interval=300.0,
+                 insert_log_batch_size=1000, system_prompt=DEFAULT_SYSTEM_PROMPT, prefix_messages=None,
+                 prompt_caching=False):
+        if client is None:
+            import anthropic
+            client = anthropic.Anthropic(api_key=api_key, base_url=base_url)
+        self.client = client
+        self.repository = repository
+        self.metrics = metrics_exporter  # Injected externally (shared instance)
+        self.cost_calculator = cost_calculator or calculate_cost
+        self.batch_size = min(batch_size, MAX_REQUESTS_PER_BATCH)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.insert_log_batch_size = insert_log_batch_size
+        self.system_prompt = system_prompt
+        self.prefix_messages = prefix_messages
+        self.prompt_caching = prompt_caching
+
+    def build_request(self, custom_id, prompt, model=DEFAULT_MODEL):
+        return {
+            "custom_id": custom_id,
+            "params": build_message_params(prompt["prompt_text"], model=model, system_prompt=self.system_prompt,
+                                           prefix_messages=self.prefix_messages, prompt_caching=self.prompt_caching)
+        }
+
+    def split_into_batches(self, prompts, model=DEFAULT_MODEL):
+        """
+        Yield lists of (custom_id, prompt, request) that respect both the request-count and the
+        payload-size limits of a single batch.
+        """
+        batch, batch_bytes = [], 0
+        for index, prompt in enumerate(prompts):
+            request = self.build_request(f"req-{index}", prompt, model=model)
+            # Rough payload size: the prompt dominates, plus a fixed allowance for the envelope
+            request_bytes = len(prompt["prompt_text"].encode("utf-8")) + 512
+            if batch and (len(batch) >= self.batch_size or batch_bytes + request_bytes > MAX_BATCH_BYTES):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append((request["custom_id"], prompt, request))
+            batch_bytes += request_bytes
+        if batch:
+            yield batch
+
+    def submit(self, batch):
+        message_batch = self.client.messages.batches.create(requests=[request for _, _, request in batch])
+        print(f"[BATCH] Submitted batch {message_batch.id} with {len(batch)} requests")
+        return message_batch.id
+
+    def wait(self, batch_id):
+        """Poll until the batch has ended, backing off exponentially between polls."""
+        interval = self.poll_interval
+        while True:
+            message_batch = self.client.messages.batches.retrieve(batch_id)
+            if message_batch.processing_status == "ended":
+                return message_batch
+            time.sleep(interval)
+            interval = min(self.max_poll_interval, interval * 2)
+
+    def collect(self, batch_id, prompts_by_id, model=DEFAULT_MODEL, run_id=None):
+        """Stream the results file of an ended batch and yield (result dict, success) per request."""
+        for entry in self.client.messages.batches.results(batch_id):
+            prompt = prompts_by_id[entry.custom_id]
+            category, prompt_text = prompt["category"], prompt["prompt_text"]
+            run_tags = {"run_id": run_id, "prompt_id": make_prompt_id(category, prompt_text, model)}
+            if entry.result.type != "succeeded":
+                print(f"[ERROR] Batch request {entry.custom_id} for category {category} {entry.result.type}")
+                result = build_failure_result(category, model, prompt_text, execution_mode="batch")
+                result.update(run_tags)
+                yield result, False
+                continue
+
+            try:
+                result = self._build_success(entry.result.message, category, model, prompt_text)
+            except Exception as e:
+                # E.g. a model missing from the pricing table; the rest of the batch is still collected
+                print(f"[ERROR] Batch request {entry.custom_id} for category {category} failed: {e}")
+                result = build_failure_result(category, model, prompt_text, execution_mode="batch")
+                result.update(run_tags)
+                yield result, False
+                continue
+            result.update(run_tags)
+            yield result, True
+
+    def _build_success(self, message, category, model, prompt_text):
+        tokens = usage_counts(message.usage)
+        cost = self.cost_calculator({
+            "model": model,
+            **tokens,
+            "category": category,
+            "prompt_text": prompt_text,
+            "response": response_text(message),
+            "batch": True,
+        })
+        return build_result(category, model, prompt_text, response_text(message), tokens["input_tokens"],
+                            tokens["output_tokens"], 0.0, cost, execution_mode="batch",
+                            cache_creation_input_tokens=tokens["cache_creation_input_tokens"],
+                            cache_read_input_tokens=tokens["cache_read_input_tokens"])
+
+    def run(self, prompts, model=DEFAULT_MODEL, run_id=None, checkpointer=None):
+        """
+        Submit every batch up front so they process in parallel, then wait for and collect
+        each one in turn. Returns all result dicts. With a RunCheckpointer, prompts the run
+        already completed are not resubmitted.
+        """
+        if checkpointer is not None:
+            prompts = checkpointer.pending(prompts, model)
+            run_id = checkpointer.run_id
+        submitted = []
+        for batch in self.split_into_batches(prompts, model=model):
+            batch_id = self.submit(batch)
+            submitted.append((batch_id, {custom_id: prompt for custom_id, prompt, _ in batch}))
+
+        results = []
+        for batch_id, prompts_by_id in submitted:
+            self.wait(batch_id)
+            pending = []
+            for result, success in self.collect(batch_id, prompts_by_id, model=model, run_id=run_id):
+                emit_result_metrics(self.metrics, result, success=success)
+                results.append(result)
+                pending.append(result)
+                if len(pending) >= self.insert_log_batch_size:
+                    self._insert_results(pending, checkpointer)
+                    pending = []
+            self._insert_results(pending, checkpointer)
+            print(f"[BATCH] Collected results for batch {batch_id}")
+        flush_metrics(self.metrics)
+        return results
+
+    def _insert_results(self, results, checkpointer=None):
+        if not results:
+            return
+        if self.repository:
+            self.repository.insert_results(results)
+        if checkpointer is not None:
+            for result in results:
+                checkpointer.record_result(result)
+            checkpointer.flush()
@@ -1,121 +1,212 @@
 import time
-import anthropic
-from datetime import datetime, timezone
 
 from anthrotrace.core.sqlite_repository import SQLiteRepository
 from anthrotrace.core.cost_calculator import calculate_cost
+from anthrotrace.core.async_anthropic_benchmark_runner import estimate_input_tokens
+from anthrotrace.core.rate_governor import RateLimitExhausted, is_throttle_error
+from anthrotrace.core.run_manifest import make_prompt_id
+from anthrotrace.core.benchmark_results import (
+    DEFAULT_MODEL, DEFAULT_SYSTEM_PROMPT, build_message_params, build_result, build_cached_result,
+    build_failure_result, emit_result_metrics, flush_metrics, response_text, streaming_stats, usage_counts
+)
 
 class AnthropicBenchmarkWithSQLite:
-    def __init__(self, api_key, db_path="data/prompt_logs.db", metrics_exporter=None, cost_calculator=None):
-        self.client = anthropic.Anthropic(api_key=api_key)
-        self.sqlite_repo = SQLiteRepository(db_path=db_path)
+    def __init__(self, api_key, db_path="data/prompt_logs.db", metrics_exporter=None, cost_calculator=None, stream=False,
+                 response_cache=None, system_prompt=DEFAULT_SYSTEM_PROMPT, prefix_messages=None, prompt_caching=False,
+                 client=None, base_url=None, write_behind=False, pipeline=None, governor=None):
+        # `client` / `base_url` let a load test target the offline mock API (core/mock_anthropic.py)
+        self.client = client or self._build_client(api_key, base_url, max_retries=0 if governor else 2)
+        # Optional RateGovernor pacing requests and retrying 429/529s (the SDK's own retries are then off)
+        self.governor = governor
+        # With a ResultPipeline, results are published to its sinks instead of this runner's own SQLite file
+        self.pipeline = pipeline
+        # write_behind queues rows for a background writer thread; call close() when done
+        self.sqlite_repo = SQLiteRepository(db_path=db_path, write_behind=write_behind) if pipeline is None else None
         self.metrics = metrics_exporter  # Injected externally (shared instance)
         self.cost_calculator = cost_calculator or calculate_cost
-
-    def run_and_return(self, category, prompt_text, model="claude-sonnet-4-20250514"):
+        self.stream = stream  # Use messages.stream and record time-to-first-token / inter-token latency
+        self.response_cache = response_cache  # Optional ResponseCache for deterministic (temperature 0) requests
+        # Shared prefix sent with every prompt; with prompt_caching it is cached server-side after the first call
+        self.system_prompt = system_prompt
+        self.prefix_messages = prefix_messages
+        self.prompt_caching = prompt_caching
+
+    def run(self, prompts, model=DEFAULT_MODEL, run_id=None, checkpointer=None):
+        """
+        Run every prompt (dicts with 'category' and 'prompt_text', as returned by
+        load_prompts_with_categories) in turn and return the results in input order.
+        With a checkpointer, prompts the run already completed are skipped and not returned.
+        """
+        if checkpointer is not None:
+            prompts = checkpointer.pending(prompts, model)
         try:
-            start_time = time.time()
-            response = self.client.messages.create(
-                model=model,
-                max_tokens=300,
-                temperature=0,
-                system="You are a helpful assistant.",
-                messages=[{"role": "user", "content": prompt_text}]
-            )
-            duration = time.time() - start_time
-            usage = response.usage
-
-            input_tokens = usage.input_tokens if usage else 0
-            output_tokens = usage.output_tokens if usage else 0
+            return [self.run_and_return(prompt["category"], prompt["prompt_text"], model=model, run_id=run_id,
+                                        checkpointer=checkpointer)
+                    for prompt in prompts]
+        finally:
+            # Checkpoints queue behind their rows, so flushing afterwards commits both
+            if checkpointer is not None:
+                checkpointer.flush()
+            self.flush()
+
+    def run_and_return(self, category, prompt_text, model=DEFAULT_MODEL, run_id=None, checkpointer=None):
+        if checkpointer is not None:
+            run_id = checkpointer.run_id
+        run_tags = {"run_id": run_id, "prompt_id": make_prompt_id(category, prompt_text, model)}
+        try:
+            params = build_message_params(prompt_text, model=model, system_prompt=self.system_prompt,
+                                          prefix_messages=self.prefix_messages, prompt_caching=self.prompt_caching)
+            cache_key = None
+            if self.response_cache:
+                lookup_start = time.perf_counter()
+                cache_key, entry = self.response_cache.lookup(params, self.metrics, {"category": category})
+                if entry:
+                    result = build_cached_result(category, model, prompt_text, entry,
+                                                 time.perf_counter() - lookup_start,
+                                                 execution_mode=self.execution_mode)
+                    result.update(run_tags)
+                    if self.metrics:
+                        self._emit_metrics(result, success=True)
+                    self._insert_into_sqlite(result, checkpointer)
+                    return result
+
+            if self.stream:
+                response, chunk_times, start_time, end_time = self._stream_message(params, category)
+                duration = end_time - start_time
+            else:
+                response, duration = self._create_message(params, category)
+            tokens = usage_counts(response.usage)
+            input_tokens = tokens["input_tokens"]
+            output_tokens = tokens["output_tokens"]
             cost = self.cost_calculator({
                 "model": model,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
+                **tokens,
                 "category": category,
                 "prompt_text": prompt_text,
-                "response": response.content[0].text if response.content else None,
+                "response": response_text(response),
                 # Add more fields as needed for custom calculators
             })
 
-            result = {
-                "category": category,
-                "model": model or "unknown",
-                "prompt_text": prompt_text,
-                "response": response.content[0].text if response.content else None,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
-                "duration": duration,
-                "cost": cost,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
+            result = build_result(category, model, prompt_text, response_text(response),
+                                  input_tokens, output_tokens, duration, cost,
+                                  execution_mode=self.execution_mode,
+                                  cache_creation_input_tokens=tokens["cache_creation_input_tokens"],
+                                  cache_read_input_tokens=tokens["cache_read_input_tokens"])
+            if self.stream:
+                result.update(streaming_stats(start_time, chunk_times, end_time, output_tokens))
+            result.update(run_tags)
 
             print(f"[SUCCESS] Benchmark completed for category: {category}")
 
+            if cache_key is not None:
+                self.response_cache.put(cache_key, result["response"], input_tokens, output_tokens)
+
             if self.metrics:
                 self._emit_metrics(result, success=True)
 
-            self._insert_into_sqlite(result)
+            self._insert_into_sqlite(result, checkpointer)
             return result
 
         except Exception as e:
             print(f"[ERROR] Benchmark run failed for category {category}: {e}")
 
-            fail_result = {
-                "category": category,
-                "model": model or "unknown",
-                "prompt_text": prompt_text,
-                "response": None,
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "duration": 0.0,
-                "cost": 0.0,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
+            # A request the governor gave up on is still a throttle, not a failure of the model
+            status = "throttled" if isinstance(e, RateLimitExhausted) or is_throttle_error(e) else "failure"
+            fail_result = build_failure_result(category, model, prompt_text, status=status,
+                                               execution_mode=self.execution_mode)
+            fail_result.update(run_tags)
 
             if self.metrics:
                 self._emit_metrics(fail_result, success=False)
 
-            self._insert_into_sqlite(fail_result)
+            self._insert_into_sqlite(fail_result, checkpointer)
             return fail_result
 
-    def _insert_into_sqlite(self, result):
-        if not self.sqlite_repo:
-            return  # Skip if SQLite is disabled
-
-        insert_sql = """
-        INSERT INTO prompt_logs
-        (category, model, prompt_text, response, input_tokens, output_tokens, duration, cost, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        self.sqlite_repo.conn.execute(insert_sql, (
-            result["category"],
-            result["model"],
-            result["prompt_text"],
-            result["response"],
-            result["input_tokens"],
-            result["output_tokens"],
-            result["duration"],
-            result["cost"],
-            result["timestamp"]
-        ))
-        self.sqlite_repo.conn.commit()
-
-    def _emit_metrics(self, result, success=True):
-        if not self.metrics:
+    @staticmethod
+    def _build_client(api_key, base_url, max_retries):
+        import anthropic
+        return anthropic.Anthropic(api_key=api_key, base_url=base_url, max_retries=max_retries)
+
+    def _create_message(self, params, category):
+        """Send one Messages API request and return (response, duration of the successful attempt)."""
+        if self.governor is None:
+            start_time = time.perf_counter()
+            response = self.client.messages.create(**params)
+            return response, time.perf_counter() - start_time
+
+        timing = {}
+
+        def send():
+            timing["start"] = time.perf_counter()
+            raw = self.client.messages.with_raw_response.create(**params)
+            timing["end"] = time.perf_counter()
+            return raw
+
+        estimated_input_tokens = estimate_input_tokens(params)
+        response = self.governor.execute_blocking(send, estimated_input_tokens=estimated_input_tokens,
+                                                  max_output_tokens=params["max_tokens"],
+                                                  labels={"category": category}).parse()
+        self._record_usage(estimated_input_tokens, params, response.usage)
+        return response, timing["end"] - timing["start"]
+
+    def _stream_message(self, params, category):
+        """Stream one request and return (final message, chunk arrival times, start time, end time)."""
+        def consume():
+            chunk_times = []
+            append = chunk_times.append
+            clock = time.perf_counter
+            start_time = clock()
+            with self.client.messages.stream(**params) as stream:
+                for _ in stream.text_stream:
+                    append(clock())
+                response = stream.get_final_message()
+            return response, chunk_times, start_time, clock()
+
+        if self.governor is None:
+            return consume()
+        estimated_input_tokens = estimate_input_tokens(params)
+        streamed = self.governor.execute_blocking(consume, estimated_input_tokens=estimated_input_tokens,
+                                                  max_output_tokens=params["max_tokens"],
+                                                  labels={"category": category})
+        self._record_usage(estimated_input_tokens, params, streamed[0].usage)
+        return streamed
+
+    def _record_usage(self, estimated_input_tokens, params, usage):
+        if not usage:
             return
+        tokens = usage_counts(usage)
+        # Cache reads still count towards the input-token rate limit, so reconcile with the full prompt size
+        input_tokens = tokens["input_tokens"] + tokens["cache_creation_input_tokens"] + tokens["cache_read_input_tokens"]
+        self.governor.record_usage(estimated_input_tokens, input_tokens, params["max_tokens"], tokens["output_tokens"])
+
+    def _insert_into_sqlite(self, result, checkpointer=None):
+        if self.pipeline is not None:
+            self.pipeline.publish(result)
+        elif self.sqlite_repo:
+            self.sqlite_repo.insert_result(result)
+        # Checkpoint only after the row is stored (or queued ahead of the checkpoint), so a resume never skips it
+        if checkpointer is not None:
+            checkpointer.record_result(result)
+
+    def flush(self):
+        """Block until every result so far is stored and the metrics are pushed."""
+        flush_metrics(self.metrics)
+        if self.pipeline is not None:
+            self.pipeline.flush()
+        if self.sqlite_repo:
+            self.sqlite_repo.flush()
+
+    def close(self):
+        """Flush any rows still queued for SQLite and close the database; a shared pipeline is only flushed."""
+        flush_metrics(self.metrics)
+        if self.pipeline is not None:
+            self.pipeline.flush()
+        if self.sqlite_repo:
+            self.sqlite_repo.close()
+
+    @property
+    def execution_mode(self):
+        return "stream" if self.stream else "standard"
 
-        category = result["category"]
-        total_tokens = result["input_tokens"] + result["output_tokens"]
-
-        self.metrics.emit_metric("prompt_total_tokens", total_tokens, {"category": category})
-        self.metrics.emit_metric("prompt_total_cost_usd", result["cost"], {"category": category})
-        self.metrics.emit_metric("prompt_avg_duration_seconds", result["duration"], {"category": category})
-
-        if success:
-            self.metrics.emit_metric("prompt_success_total", 1, {"category": category})
-        else:
-            self.metrics.emit_metric("prompt_failure_total", 1, {"category": category})
-
-        self.metrics.emit_histogram("prompt_latency_seconds", result["duration"], None, {"category": category})
-        self.metrics.emit_histogram("prompt_cost_per_run_usd", result["cost"], None, {"category": category})
-        self.metrics.emit_histogram("prompt_total_tokens_histogram", total_tokens, None, {"category": category})
+    def _emit_metrics(self, result, success=True):
+        emit_result_metrics(self.metrics, result, success=success)
@@ -0,0 +1,336 @@
+import asyncio
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from anthrotrace.core.cost_calculator import calculate_cost
+from anthrotrace.core.rate_governor import RateLimitExhausted, is_throttle_error
+from anthrotrace.core.run_manifest import make_prompt_id
+from anthrotrace.core.benchmark_results import (
+    DEFAULT_MODEL, DEFAULT_SYSTEM_PROMPT, build_message_params, build_result, build_cached_result,
+    build_failure_result, emit_result_metrics, flush_metrics, response_text, streaming_stats, usage_counts
+)
+
+
+class AsyncAnthropicBenchmarkRunner:
+    """
+    Asyncio counterpart of AnthropicBenchmarkWithSQLite.
+
+    All requests share one AsyncAnthropic client (and therefore one pooled HTTP client);
+    a semaphore bounds how many of them are in flight at once. Results have the same shape
+    as the blocking runner's and go through the same cost, metrics and persistence hooks.
+    Repository writes are handed to a single background thread so a slow store never
+    blocks the event loop. Pass a ResultPipeline as `repository` to fan results out to
+    several sinks.
+
+    Pass a RateGovernor to pace requests to the account's rate limits. The SDK's own
+    retries are then disabled so every 429/529 reaches the governor, and requests that
+    stay throttled are recorded with status 'throttled' instead of 'failure'.
+
+    With stream=True each request goes through messages.stream and the result also
+    carries time-to-first-token, output tokens/sec and inter-token latency percentiles.
+
+    An optional ResponseCache serves repeated deterministic requests from disk; such
+    results are flagged `cached` and cost nothing. `system_prompt` and `prefix_messages`
+    form a prefix shared by every request; with prompt_caching=True it is marked for
+    Anthropic prompt caching and the cache read/write tokens are recorded and priced.
+
+    Every result carries a stable `prompt_id` and the `run_id` it belongs to. Passing a
+    RunCheckpointer to run/run_all skips prompts the run already completed and records a
+    checkpoint after each result is persisted, so an interrupted run can be resumed.
+
+    run() can be called again on the same runner; an injected client stays open until aclose().
+
+    Usage:
+        prompts = load_prompts_with_categories("anthrotrace/data/anthrotrace_common_prompts.yaml")
+        runner = AsyncAnthropicBenchmarkRunner(api_key, repository=SQLiteRepository(), max_concurrency=500)
+        results = runner.run(prompts)
+    """
+
+    def __init__(self, api_key=None, repository=None, metrics_exporter=None, cost_calculator=None,
+                 max_concurrency=100, client=None, max_retries=2, governor=None, stream=False,
+                 response_cache=None, system_prompt=DEFAULT_SYSTEM_PROMPT, prefix_messages=None, prompt_caching=False,
+                 base_url=None):
+        if governor is not None:
+            max_retries = 0
+        # A client the runner builds is rebuilt after each run(); its connections belong to that run's loop
+        self._client_options = (api_key, max_concurrency, max_retries, base_url) if client is None else None
+        self.client = client or self._build_client(*self._client_options)
+        self.governor = governor
+        self.stream = stream
+        self.response_cache = response_cache
+        self.system_prompt = system_prompt
+        self.prefix_messages = prefix_messages
+        self.prompt_caching = prompt_caching
+        self.repository = repository
+        self.metrics = metrics_exporter  # Injected externally (shared instance)
+        self.cost_calculator = cost_calculator or calculate_cost
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._writer = None
+        self._closed = False
+
+    @staticmethod
+    def _build_client(api_key, max_concurrency, max_retries, base_url=None):
+        import anthropic
+        import httpx
+
+        # Size the connection pool to the concurrency limit so requests never queue on the pool
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        return anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=limits),
+        )
+
+    @property
+    def semaphore(self):
+        # Created lazily so it binds to the event loop that actually runs the benchmark
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run_and_return(self, category, prompt_text, model=DEFAULT_MODEL, run_id=None, checkpointer=None):
+        if checkpointer is not None:
+            run_id = checkpointer.run_id
+        run_tags = {"run_id": run_id, "prompt_id": make_prompt_id(category, prompt_text, model)}
+        params = build_message_params(prompt_text, model=model, system_prompt=self.system_prompt,
+                                      prefix_messages=self.prefix_messages, prompt_caching=self.prompt_caching)
+        cache_key = None
+        if self.response_cache:
+            lookup_start = time.perf_counter()
+            cache_key, entry = self.response_cache.lookup(params, self.metrics, {"category": category})
+            if entry:
+                result = build_cached_result(category, model, prompt_text, entry, time.perf_counter() - lookup_start,
+                                             execution_mode=self.execution_mode)
+                result.update(run_tags)
+                self._emit_metrics(result, success=True)
+                await self._persist(result, checkpointer=checkpointer)
+                return result
+
+        async with self.semaphore:
+            try:
+                if self.stream:
+                    response, duration, timing = await self._stream_message(params, category)
+                else:
+                    response, duration = await self._create_message(params, category)
+                tokens = usage_counts(response.usage)
+                input_tokens = tokens["input_tokens"]
+                output_tokens = tokens["output_tokens"]
+                cost = self.cost_calculator({
+                    "model": model,
+                    **tokens,
+                    "category": category,
+                    "prompt_text": prompt_text,
+                    "response": response_text(response),
+                })
+
+                result = build_result(category, model, prompt_text, response_text(response),
+                                      input_tokens, output_tokens, duration, cost,
+                                      execution_mode=self.execution_mode,
+                                      cache_creation_input_tokens=tokens["cache_creation_input_tokens"],
+                                      cache_read_input_tokens=tokens["cache_read_input_tokens"])
+                if self.stream:
+                    result.update(streaming_stats(timing.start, timing.chunk_times, timing.end, output_tokens))
+                success = True
+
+            except RateLimitExhausted as e:
+                print(f"[THROTTLED] Benchmark run for category {category} gave up: {e}")
+                result = build_failure_result(category, model, prompt_text, status="throttled",
+                                              execution_mode=self.execution_mode)
+                success = False
+
+            except Exception as e:
+                print(f"[ERROR] Benchmark run failed for category {category}: {e}")
+                status = "throttled" if is_throttle_error(e) else "failure"
+                result = build_failure_result(category, model, prompt_text, status=status,
+                                              execution_mode=self.execution_mode)
+                success = False
+
+        result.update(run_tags)
+        self._emit_metrics(result, success=success)
+        await self._persist(result, cache_key=cache_key if success else None, checkpointer=checkpointer)
+        return result
+
+    async def _create_message(self, params, category):
+        """Send one Messages API request and return (response, duration of the successful attempt)."""
+        if self.governor is None:
+            start_time = time.perf_counter()
+            response = await self.client.messages.create(**params)
+            return response, time.perf_counter() - start_time
+
+        timing = {}
+
+        async def send():
+            timing["start"] = time.perf_counter()
+            raw = await self.client.messages.with_raw_response.create(**params)
+            timing["end"] = time.perf_counter()
+            return raw
+
+        estimated_input_tokens = estimate_input_tokens(params)
+        raw = await self.governor.execute(
+            send,
+            estimated_input_tokens=estimated_input_tokens,
+            max_output_tokens=params["max_tokens"],
+            labels={"category": category}
+        )
+        response = raw.parse()
+        if inspect.isawaitable(response):
+            response = await response
+
+        self._record_usage(estimated_input_tokens, params, response.usage)
+        return response, timing["end"] - timing["start"]
+
+    async def _stream_message(self, params, category):
+        """
+        Stream one Messages API request and return (final message, duration, chunk timing).
+        The per-chunk work is a single timestamp append so the event loop stays hot.
+        """
+        async def consume():
+            chunk_times = []
+            append = chunk_times.append
+            clock = time.perf_counter
+            start = clock()
+            async with self.client.messages.stream(**params) as stream:
+                async for _ in stream.text_stream:
+                    append(clock())
+                message = await stream.get_final_message()
+            end = clock()
+            headers = getattr(getattr(stream, "response", None), "headers", None) or {}
+            return SimpleNamespace(message=message, headers=headers, start=start, end=end, chunk_times=chunk_times)
+
+        if self.governor is None:
+            timing = await consume()
+        else:
+            estimated_input_tokens = estimate_input_tokens(params)
+            timing = await self.governor.execute(
+                consume,
+                estimated_input_tokens=estimated_input_tokens,
+                max_output_tokens=params["max_tokens"],
+                labels={"category": category}
+            )
+            self._record_usage(estimated_input_tokens, params, timing.message.usage)
+        return timing.message, timing.end - timing.start, timing
+
+    def _record_usage(self, estimated_input_tokens, params, usage):
+        if not usage:
+            return
+        tokens = usage_counts(usage)
+        # Cache reads still count towards the input-token rate limit, so reconcile with the full prompt size
+        input_tokens = tokens["input_tokens"] + tokens["cache_creation_input_tokens"] + tokens["cache_read_input_tokens"]
+        self.governor.record_usage(estimated_input_tokens, input_tokens, params["max_tokens"], tokens["output_tokens"])
+
+    @property
+    def writer(self):
+        # One thread keeps inserts and checkpoints in order; created per run, so run() can be called again
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="anthrotrace-writer")
+        return self._writer
+
+    async def run_all(self, prompts, model=DEFAULT_MODEL, run_id=None, checkpointer=None):
+        """
+        Run every prompt (dicts with 'category' and 'prompt_text', as returned by
+        load_prompts_with_categories) concurrently and return the results in input order.
+        With a checkpointer, prompts the run already completed are skipped and not returned.
+        """
+        self._check_open()
+        if checkpointer is not None:
+            prompts = checkpointer.pending(prompts, model)
+        tasks = [
+            self.run_and_return(prompt["category"], prompt["prompt_text"], model=model, run_id=run_id,
+                                checkpointer=checkpointer)
+            for prompt in prompts
+        ]
+        return await asyncio.gather(*tasks)
+
+    def run(self, prompts, model=DEFAULT_MODEL, run_id=None, checkpointer=None):
+        """Blocking entry point: run all prompts on a fresh event loop. The runner can run again afterwards."""
+        self._check_open()
+
+        async def _main():
+            try:
+                return await self.run_all(prompts, model=model, run_id=run_id, checkpointer=checkpointer)
+            finally:
+                await self._end_loop()
+                # The writer thread has drained, so every persisted result is in the checkpoint buffer
+                if checkpointer is not None:
+                    checkpointer.flush()
+                # Write-behind repositories: the run's rows are committed by the time run() returns
+                if hasattr(self.repository, "flush"):
+                    self.repository.flush()
+                flush_metrics(self.metrics)
+
+        return asyncio.run(_main())
+
+    async def _persist(self, result, cache_key=None, checkpointer=None):
+        if not self.repository and cache_key is None and checkpointer is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.writer, self._insert_result, result, cache_key, checkpointer)
+        except Exception as e:
+            print(f"[ERROR] Could not persist result for category {result['category']}: {e}")
+
+    def _insert_result(self, result, cache_key=None, checkpointer=None):
+        if cache_key is not None:
+            self.response_cache.put(cache_key, result["response"], result["input_tokens"], result["output_tokens"])
+        if self.repository:
+            self.repository.insert_result(result)
+        # Checkpoint only after the row is stored, so a resumed run never skips a lost result
+        if checkpointer is not None:
+            checkpointer.record_result(result)
+
+    @property
+    def execution_mode(self):
+        return "stream" if self.stream else "standard"
+
+    def _emit_metrics(self, result, success=True):
+        emit_result_metrics(self.metrics, result, success=success)
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("AsyncAnthropicBenchmarkRunner is closed")
+
+    def _shutdown_writer(self):
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+    async def _end_loop(self):
+        """Release what belongs to the event loop run() created; an injected client is left to aclose()."""
+        self._shutdown_writer()
+        self._semaphore = None
+        if self._client_options is not None:
+            await self.client.close()
+            self.client = self._build_client(*self._client_options)
+
+    async def aclose(self):
+        self._closed = True
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+        self._shutdown_writer()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+def estimate_input_tokens(params):
+    """Rough pre-flight input token estimate (about four characters per token) for rate budgeting."""
+    characters = len(_text_of(params.get("system")))
+    for message in params.get("messages", []):
+        characters += len(_text_of(message.get("content")))
+    return max(1, characters // 4)
+
+
+def _text_of(content):
+    if not content:
+        return ""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
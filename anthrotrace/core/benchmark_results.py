@@ -0,0 +1,197 @@
+from datetime import datetime, timezone
+
+DEFAULT_MODEL = "claude-sonnet-4-20250514"
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+DEFAULT_MAX_TOKENS = 300
+
+# Marks the end of a reusable prompt prefix for Anthropic prompt caching
+EPHEMERAL_CACHE_CONTROL = {"type": "ephemeral"}
+
+TIME_TO_FIRST_TOKEN_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0]
+INTER_TOKEN_LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+OUTPUT_TOKENS_PER_SECOND_BUCKETS = [5, 10, 25, 50, 100, 200, 400]
+
+
+def response_text(response):
+    """Return the text of the first content block of a Messages API response, if any."""
+    return response.content[0].text if response.content else None
+
+
+def _with_cache_control(content):
+    """Return message content as a list of blocks with a cache breakpoint on the last one."""
+    blocks = [{"type": "text", "text": content}] if isinstance(content, str) else [dict(block) for block in content]
+    blocks[-1]["cache_control"] = EPHEMERAL_CACHE_CONTROL
+    return blocks
+
+
+def build_message_params(prompt_text, model=DEFAULT_MODEL, system_prompt=DEFAULT_SYSTEM_PROMPT,
+                         prefix_messages=None, prompt_caching=False, max_tokens=DEFAULT_MAX_TOKENS, temperature=0):
+    """
+    Build the Messages API request shared by every runner.
+
+    `prefix_messages` (e.g. few-shot examples) are sent ahead of the prompt on every call. With
+    `prompt_caching` the system prompt and the end of the prefix are marked with cache_control,
+    so the shared prefix is written to the prompt cache once and then read at the cache-read rate.
+    """
+    messages = [dict(message) for message in (prefix_messages or [])]
+    system = system_prompt
+    if prompt_caching:
+        if system:
+            system = _with_cache_control(system)
+        if messages:
+            messages[-1]["content"] = _with_cache_control(messages[-1]["content"])
+    messages.append({"role": "user", "content": prompt_text})
+
+    params = {
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "messages": messages
+    }
+    if system:
+        params["system"] = system
+    return params
+
+
+def usage_counts(usage):
+    """Token counts from a Messages API usage object, with the prompt-cache counters defaulting to 0."""
+    if not usage:
+        return {"input_tokens": 0, "output_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+    return {
+        "input_tokens": usage.input_tokens or 0,
+        "output_tokens": usage.output_tokens or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+    }
+
+
+def build_result(category, model, prompt_text, response, input_tokens, output_tokens, duration, cost,
+                 status="success", execution_mode="standard", cache_creation_input_tokens=0,
+                 cache_read_input_tokens=0):
+    """
+    Build the result dict returned by the benchmark runners and persisted by the repositories.
+    `status` is 'success', 'failure' or 'throttled' (still rate limited after all retries);
+    `execution_mode` is 'standard', 'stream' or 'batch'. `input_tokens` excludes the
+    prompt-cache tokens, which are reported separately as in the API's usage block.
+    """
+    return {
+        "category": category,
+        "model": model or "unknown",
+        "prompt_text": prompt_text,
+        "response": response,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cache_creation_input_tokens": cache_creation_input_tokens,
+        "cache_read_input_tokens": cache_read_input_tokens,
+        "duration": duration,
+        "cost": cost,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "status": status,
+        "execution_mode": execution_mode,
+        "cached": 0
+    }
+
+
+def build_cached_result(category, model, prompt_text, entry, duration, execution_mode="standard"):
+    """
+    Build a result for a response served from the ResponseCache. Token counts describe the
+    cached response; cost is zero because no API call was billed, and `duration` is the
+    lookup time, which summaries and latency metrics leave out.
+    """
+    result = build_result(category, model, prompt_text, entry["response"], entry["input_tokens"],
+                          entry["output_tokens"], duration, 0.0, execution_mode=execution_mode)
+    result["cached"] = 1
+    return result
+
+
+def build_failure_result(category, model, prompt_text, status="failure", execution_mode="standard"):
+    return build_result(category, model, prompt_text, None, 0, 0, 0.0, 0.0,
+                        status=status, execution_mode=execution_mode)
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def streaming_stats(start_time, chunk_times, end_time, output_tokens):
+    """
+    Derive streaming latency fields from the arrival time of every text chunk.
+
+    All times are time.perf_counter() readings. Time-to-first-token runs from the request
+    start to the first chunk; output tokens/sec is measured over the generation phase only
+    (first chunk to end of stream). The gaps between consecutive chunks are returned in
+    'inter_token_latencies' for the metrics exporter; only their percentiles are stored.
+    """
+    if not chunk_times:
+        return {
+            "time_to_first_token": None,
+            "output_tokens_per_sec": None,
+            "inter_token_latency_p50": None,
+            "inter_token_latency_p95": None,
+            "inter_token_latency_max": None,
+            "inter_token_latencies": [],
+        }
+
+    generation_time = end_time - chunk_times[0]
+    gaps = [later - earlier for earlier, later in zip(chunk_times, chunk_times[1:])]
+    ordered = sorted(gaps)
+    return {
+        "time_to_first_token": chunk_times[0] - start_time,
+        "output_tokens_per_sec": output_tokens / generation_time if generation_time > 0 else None,
+        "inter_token_latency_p50": _percentile(ordered, 0.50) if ordered else None,
+        "inter_token_latency_p95": _percentile(ordered, 0.95) if ordered else None,
+        "inter_token_latency_max": ordered[-1] if ordered else None,
+        "inter_token_latencies": gaps,
+    }
+
+
+def emit_result_metrics(metrics, result, success=True):
+    """
+    Emit the per-request Prometheus metrics for a single benchmark result. Exporters with an
+    emit_result fast path (PrometheusMetricsExporter) record the same metrics through it.
+    """
+    if not metrics:
+        return
+    if hasattr(metrics, "emit_result"):
+        metrics.emit_result(result, success=success)
+        return
+
+    category = result["category"]
+    total_tokens = result["input_tokens"] + result["output_tokens"]
+
+    # Batch results and cache hits carry no API latency, so they stay out of the latency series
+    has_latency = result.get("execution_mode") != "batch" and not result.get("cached")
+
+    metrics.emit_metric("prompt_total_tokens", total_tokens, {"category": category}, metric_type="counter")
+    metrics.emit_metric("prompt_total_cost_usd", result["cost"], {"category": category}, metric_type="counter")
+    if has_latency:
+        metrics.emit_metric("prompt_avg_duration_seconds", result["duration"], {"category": category})
+
+    if result.get("status") == "throttled":
+        # Rate limiting is a capacity signal, not a model failure; keep it out of the failure count
+        metrics.emit_metric("prompt_throttled_total", 1, {"category": category}, metric_type="counter")
+    elif success:
+        metrics.emit_metric("prompt_success_total", 1, {"category": category}, metric_type="counter")
+    else:
+        metrics.emit_metric("prompt_failure_total", 1, {"category": category}, metric_type="counter")
+
+    if has_latency:
+        metrics.emit_histogram("prompt_latency_seconds", result["duration"], None, {"category": category})
+    metrics.emit_histogram("prompt_cost_per_run_usd", result["cost"], None, {"category": category})
+    metrics.emit_histogram("prompt_total_tokens_histogram", total_tokens, None, {"category": category})
+
+    if result.get("time_to_first_token") is not None:
+        labels = {"category": category}
+        metrics.emit_histogram("prompt_time_to_first_token_seconds", result["time_to_first_token"],
+                               TIME_TO_FIRST_TOKEN_BUCKETS, labels)
+        if result.get("output_tokens_per_sec") is not None:
+            metrics.emit_histogram("prompt_output_tokens_per_second", result["output_tokens_per_sec"],
+                                   OUTPUT_TOKENS_PER_SECOND_BUCKETS, labels)
+        for gap in result.get("inter_token_latencies", ()):
+            metrics.emit_histogram("prompt_inter_token_latency_seconds", gap, INTER_TOKEN_LATENCY_BUCKETS, labels)
+
+
+def flush_metrics(metrics):
+    """Apply the results an exporter has queued (PrometheusMetricsExporter.flush); other exporters need nothing."""
+    if metrics and hasattr(metrics, "flush"):
+        metrics.flush()
@@ -1,44 +1,144 @@
 from datetime import datetime
 
+from anthrotrace.core.quantile_sketch import QuantileSketch, add_sketch_quantiles, quantile_name
+
+# Latency and cost quantiles a summary reports, when the repository's totals include them
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
 class BenchmarkSummaryService:
     def __init__(self, repository):
         self.repo = repository
 
     def get_summary(self, category=None, model=None, start_time=None, end_time=None):
-        logs = self.repo.query_logs(
-            category=category,
-            model=model,
-            start_time=start_time,
-            end_time=end_time
-        )
-
-        if not logs:
-            return None
-
-        total_runs = len(logs)
-        successes = sum(1 for log in logs if log.get('response'))
-        failures = total_runs - successes
+        filters = {"category": category, "model": model, "start_time": start_time, "end_time": end_time}
+        # Repositories that can aggregate in the database return one row instead of every log
+        aggregate_summary = getattr(self.repo, "aggregate_summary", None)
+        if aggregate_summary is not None:
+            totals = aggregate_summary(**filters)
+        else:
+            query_logs = getattr(self.repo, "query_logs", None)
+            if query_logs is None:
+                # A bare prompt log repository (e.g. MockRepository) rather than a RepositoryAdapter
+                from anthrotrace.core.repository_adapter import RepositoryAdapter
+                query_logs = RepositoryAdapter(self.repo).query_logs
+            totals = reduce_logs(query_logs(**filters))
 
-        avg_input_tokens = sum(log.get('input_tokens', 0) for log in logs) / total_runs
-        avg_output_tokens = sum(log.get('output_tokens', 0) for log in logs) / total_runs
-        avg_cost = sum(log.get('cost', 0.0) for log in logs) / total_runs
-        avg_latency = sum(log.get('duration', 0.0) for log in logs) / total_runs
+        if not totals:
+            return None
 
-        last_run = max(
-            datetime.fromisoformat(str(log.get('timestamp')).replace('Z', '+00:00')).replace(tzinfo=None)
-            for log in logs if log.get('timestamp')
-        )
+        total_runs = totals["total_runs"]
+        successes = totals["success_count"]
+        # Rate-limited runs say nothing about the model, so they are neither successes nor failures
+        throttled = totals["throttled_count"]
+        failures = totals["failure_count"]
+        attempted = successes + failures
+        last_run = _naive_datetime(totals["last_timestamp"])
 
-        return {
+        summary = {
             "category": category or "All Categories",
             "model": model or "All Models",
             "total_runs": total_runs,
             "success_count": successes,
             "failure_count": failures,
-            "success_ratio": round((successes / total_runs) * 100, 2),
-            "average_input_tokens": round(avg_input_tokens, 2),
-            "average_output_tokens": round(avg_output_tokens, 2),
-            "average_cost_usd": round(avg_cost, 4),
-            "average_latency_sec": round(avg_latency, 2),
-            "last_run_timestamp": last_run.isoformat(),
-        } 
\ No newline at end of file
+            "throttled_count": throttled,
+            "cached_count": totals["cached_count"],
+            "success_ratio": round((successes / attempted) * 100, 2) if attempted else 0.0,
+            "average_input_tokens": round(totals["input_tokens"] / total_runs, 2),
+            "average_output_tokens": round(totals["output_tokens"] / total_runs, 2),
+            "average_cost_usd": round(totals["cost"] / total_runs, 4),
+            "average_latency_sec": round(totals["average_latency_sec"], 2),
+            "last_run_timestamp": last_run.isoformat() if last_run else None,
+        }
+        if totals.get("min_latency") is not None:
+            summary["min_latency_sec"] = round(totals["min_latency"], 2)
+            summary["max_latency_sec"] = round(totals["max_latency"], 2)
+        for level in SUMMARY_QUANTILES:
+            for prefix, unit, digits in (("latency", "sec", 2), ("cost", "usd", 4)):
+                name = quantile_name(prefix, level, unit)
+                if name in totals:
+                    summary[name] = round(totals[name], digits)
+        return summary
+
+
+def reduce_logs(logs):
+    """
+    Streaming equivalent of a repository's aggregate_summary for repositories that can only
+    return rows: one pass over `logs` (any iterable), memory bounded by the latency and cost
+    sketches. None if there are no rows.
+    """
+    totals = {
+        "total_runs": 0, "success_count": 0, "throttled_count": 0, "cached_count": 0,
+        "input_tokens": 0, "output_tokens": 0, "cost": 0.0, "duration_sum": 0.0,
+        "latency_sum": 0.0, "latency_count": 0, "last_timestamp": None, "min_latency": None, "max_latency": None,
+        "latency_sketch": QuantileSketch(), "cost_sketch": QuantileSketch(),
+    }
+    for log in logs:
+        totals["total_runs"] += 1
+        totals["success_count"] += 1 if log.get('response') else 0
+        totals["throttled_count"] += 1 if log.get('status') == 'throttled' else 0
+        totals["cached_count"] += 1 if log.get('cached') else 0
+        totals["input_tokens"] += log.get('input_tokens') or 0
+        totals["output_tokens"] += log.get('output_tokens') or 0
+        totals["cost"] += log.get('cost') or 0.0
+        totals["duration_sum"] += log.get('duration') or 0.0
+        # Batch-mode rows and cache hits have no API latency and would drag the average towards zero
+        if log.get('execution_mode') != 'batch' and not log.get('cached'):
+            totals["latency_sum"] += log.get('duration') or 0.0
+            totals["latency_count"] += 1
+            totals["latency_sketch"].add(log.get('duration'))
+            duration = log.get('duration')
+            if duration is not None:
+                totals["min_latency"] = duration if totals["min_latency"] is None else min(totals["min_latency"], duration)
+                totals["max_latency"] = duration if totals["max_latency"] is None else max(totals["max_latency"], duration)
+        totals["cost_sketch"].add(log.get('cost'))
+        timestamp = _naive_datetime(log.get('timestamp'))
+        if timestamp and (totals["last_timestamp"] is None or timestamp > totals["last_timestamp"]):
+            totals["last_timestamp"] = timestamp
+    if not totals["total_runs"]:
+        return None
+    totals["failure_count"] = totals["total_runs"] - totals["success_count"] - totals["throttled_count"]
+    totals["average_latency_sec"] = (totals["latency_sum"] / totals["latency_count"]
+                                     if totals["latency_count"] else 0.0)
+    return add_sketch_quantiles(totals)
+
+
+# Columns reduce_frame needs from a repository's fetch_logs_df
+SUMMARY_FRAME_COLUMNS = ["success", "status", "cached", "execution_mode", "input_tokens", "output_tokens",
+                         "cost", "duration", "timestamp"]
+
+
+def reduce_frame(frame):
+    """reduce_logs over a columnar fetch_logs_df result, vectorized per column. None if it is empty."""
+    if frame.empty:
+        return None
+    cached = frame["cached"].fillna(0).astype(bool)
+    latency = frame["duration"][(frame["execution_mode"] != "batch") & ~cached]
+    totals = {
+        "total_runs": len(frame),
+        "success_count": int(frame["success"].sum()),
+        "throttled_count": int((frame["status"] == "throttled").sum()),
+        "cached_count": int(cached.sum()),
+        "input_tokens": int(frame["input_tokens"].fillna(0).sum()),
+        "output_tokens": int(frame["output_tokens"].fillna(0).sum()),
+        "cost": float(frame["cost"].fillna(0).sum()),
+        "duration_sum": float(frame["duration"].fillna(0).sum()),
+        "latency_sum": float(latency.fillna(0).sum()),
+        "latency_count": len(latency),
+        "last_timestamp": frame["timestamp"].max().to_pydatetime(),
+        "min_latency": float(latency.min()) if latency.notna().any() else None,
+        "max_latency": float(latency.max()) if latency.notna().any() else None,
+    }
+    totals["failure_count"] = totals["total_runs"] - totals["success_count"] - totals["throttled_count"]
+    totals["average_latency_sec"] = totals["latency_sum"] / totals["latency_count"] if totals["latency_count"] else 0.0
+    totals["latency_sketch"], totals["cost_sketch"] = QuantileSketch(), QuantileSketch()
+    totals["latency_sketch"].add_many(latency.to_numpy())
+    totals["cost_sketch"].add_many(frame["cost"].to_numpy())
+    return add_sketch_quantiles(totals)
+
+
+def _naive_datetime(value):
+    if not value:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return value.replace(tzinfo=None)
@@ -1,19 +1,107 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from anthrotrace.core.clickhouse_rollups import (
+    CREATE_ROLLUP_TABLE, DROP_ROLLUP_VIEW_FILTER, RAW_AGGREGATES, ROLLUP_AGGREGATES, ROLLUP_TABLE, ROLLUP_VIEW,
+    ROLLUP_VIEW_FILTERED, create_rollup_view, rollup_select
+)
+from anthrotrace.core.durable_spool import DurableSpool
+from anthrotrace.core.prompt_log_schema import ALL_COLUMNS, ensure_clickhouse_columns, projected_columns, result_row
+from anthrotrace.core.quantile_sketch import LATENCY_QUANTILES, quantile_name
+
+TIMESTAMP_INDEX = ALL_COLUMNS.index("timestamp")
+
+# Repeated and bulky text: per-part dictionaries for the few distinct categories, models and
+# prompts of a benchmark suite, zstd for response bodies
+TEXT_COLUMN_TYPES = {
+    "category": "LowCardinality(String)",
+    "model": "LowCardinality(String)",
+    "prompt_text": "LowCardinality(String) CODEC(ZSTD(3))",
+    "response": "String CODEC(ZSTD(3))",
+}
+
+# Unique key of a row that went through the spool, so a replay after a crash can skip rows already inserted
+SPOOL_KEY_COLUMN = "spool_key"
+
+# name -> expression for computed columns that fetch_logs_df/fetch_logs_arrow can return alongside the stored ones
+DERIVED_COLUMNS = {
+    "success": "CAST(response != '' AS Bool)",
+}
+
+
 class ClickHousePromptLogRepository:
-    def __init__(self, clickhouse_client=None):
+    """
+    ClickHouse storage for prompt logs and run checkpoints.
+
+    With `buffered=True`, inserts append rows to an in-memory buffer, and a background thread
+    writes them with one columnar `client.insert` (one part) every `flush_rows` rows or
+    `flush_interval` seconds. Once `max_buffer_rows` rows are pending, inserting threads
+    block until the buffer drains; the time they wait, the buffer depth and flush latency
+    are reported through `metrics_exporter`. `async_insert=True` additionally lets the
+    server batch inserts (async_insert with wait_for_async_insert). Reads see rows once
+    they are flushed; call flush() to force it and close() at shutdown.
+
+    With `spool_dir`, inserts are appended to a DurableSpool on local disk instead, so
+    results survive ClickHouse being down (and the process restarting). A background
+    replayer drains the spool in batches of `flush_rows` whenever ClickHouse accepts them.
+    Each spooled row carries a unique spool_key; after a failed or interrupted insert the
+    replayer first looks up which keys already landed, so every row is inserted exactly
+    once. Spool depth is reported as clickhouse_spool_rows/bytes/segments gauges.
+    `buffered` and `spool_dir` are alternatives.
+
+    Usage:
+        repo = ClickHousePromptLogRepository(client, buffered=True, flush_rows=5000)
+        repo.insert_result(result)  # buffered; shared safely across worker threads
+        repo.close()
+    """
+
+    def __init__(self, clickhouse_client=None, buffered=False, flush_rows=1000, flush_interval=1.0,
+                 max_buffer_rows=100_000, async_insert=False, metrics_exporter=None, spool_dir=None,
+                 spool_fsync_interval=1.0):
         self.client = clickhouse_client
         if not self.client:
             raise NotImplementedError("ClickHouse client is required.")
+        if buffered and spool_dir:
+            raise ValueError("buffered and spool_dir are alternatives; the spool already batches inserts")
+        self.spool = DurableSpool(spool_dir, fsync_interval=spool_fsync_interval) if spool_dir else None
+        self.rollup_enabled = False
         self._create_table_if_not_exists()
+
+        self.buffered = buffered
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_buffer_rows = max_buffer_rows
+        self.insert_settings = {"async_insert": 1, "wait_for_async_insert": 1} if async_insert else None
+        self.metrics = metrics_exporter  # Injected externally (shared instance)
+        self.stats = {"rows_inserted": 0, "flushes": 0, "insert_errors": 0, "rows_dropped": 0,
+                      "backpressure_seconds": 0.0, "rows_deduplicated": 0}
+        self._buffer = []
+        self._buffer_started = None
+        self._condition = threading.Condition()
+        self._insert_lock = threading.Lock()  # One insert at a time through the shared client
+        self._flusher = None
+        if buffered:
+            self._flusher = threading.Thread(target=self._flush_loop, name="anthrotrace-clickhouse-flusher",
+                                             daemon=True)
+            self._flusher.start()
+        if self.spool is not None:
+            self._spooled_rows = 0
+            self._verify_spool = True  # The previous process may have died between an insert and its commit
+            self._flusher = threading.Thread(target=self._replay_loop, name="anthrotrace-clickhouse-replayer",
+                                             daemon=True)
+            self._flusher.start()
     
     def _create_table_if_not_exists(self):
         """Create the prompt_logs table if it doesn't exist"""
-        create_table_query = """
+        create_table_query = f"""
         CREATE TABLE IF NOT EXISTS prompt_logs (
             id UInt32,
-            category String,
-            model String,
-            prompt_text String,
-            response String,
+            category {TEXT_COLUMN_TYPES["category"]},
+            model {TEXT_COLUMN_TYPES["model"]},
+            prompt_text {TEXT_COLUMN_TYPES["prompt_text"]},
+            response {TEXT_COLUMN_TYPES["response"]},
             input_tokens UInt32,
             output_tokens UInt32,
             duration Float64,
@@ -22,94 +110,471 @@ class ClickHousePromptLogRepository:
         ) ENGINE = MergeTree()
         ORDER BY (timestamp, category)
         """
+        # Latest status per (run_id, prompt_id) wins once parts merge; reads use argMax to be exact before that
+        create_checkpoints_query = """
+        CREATE TABLE IF NOT EXISTS run_checkpoints (
+            run_id String,
+            prompt_id String,
+            status LowCardinality(String),
+            updated_at DateTime64(3, 'UTC')
+        ) ENGINE = ReplacingMergeTree(updated_at)
+        ORDER BY (run_id, prompt_id)
+        """
         try:
             self.client.command(create_table_query)
+            self.client.command(create_checkpoints_query)
+            ensure_clickhouse_columns(self.client)
+            if self.spool is not None:
+                self.client.command(
+                    f"ALTER TABLE prompt_logs ADD COLUMN IF NOT EXISTS {SPOOL_KEY_COLUMN} String DEFAULT ''")
         except Exception as e:
             print(f"[ClickHouse] Warning: Could not create table: {e}")
+        self._create_rollup_if_not_exists()
+
+    def _create_rollup_if_not_exists(self):
+        """Create the per-minute rollup and, when its materialized view is missing, rebuild the rollup."""
+        try:
+            self.client.command(CREATE_ROLLUP_TABLE)
+            if (not int(self.client.command(f"EXISTS TABLE {ROLLUP_VIEW}") or 0)
+                    or int(self.client.command(ROLLUP_VIEW_FILTERED) or 0)):
+                self._rebuild_rollup()
+            self.rollup_enabled = True
+        except Exception as e:
+            print(f"[ClickHouse] Warning: Could not create rollup, queries will read raw rows: {e}")
+
+    def _rebuild_rollup(self):
+        # While the backfill runs, the view takes rows stamped from the cutoff on and the backfill
+        # everything before it, so a row inserted meanwhile is counted once. Afterwards the view drops
+        # its filter, so late and backdated rows (merged shards, spool replays) are folded in as well.
+        # Only a backdated row inserted during the backfill itself is missed. Rows an earlier view fed
+        # are rebuilt too.
+        cutoff = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        self.client.command(f"DROP VIEW IF EXISTS {ROLLUP_VIEW}")
+        self.client.command(f"TRUNCATE TABLE {ROLLUP_TABLE}")
+        self.client.command(create_rollup_view(cutoff))
+        try:
+            where_clause, params = _filter_clause(end_time=cutoff, end_exclusive=True)
+            self.client.command(f"INSERT INTO {ROLLUP_TABLE} {rollup_select(where_clause)}", parameters=params)
+            self.client.command(DROP_ROLLUP_VIEW_FILTER)
+        except Exception:
+            self.client.command(f"DROP VIEW IF EXISTS {ROLLUP_VIEW}")  # So the next start rebuilds it again
+            raise
+
+    def compact_text_columns(self):
+        """
+        Give a prompt_logs table created before TEXT_COLUMN_TYPES existed the same column types.
+        Each ALTER ... MODIFY COLUMN is a mutation that rewrites the table's parts in the
+        background; reads keep working meanwhile.
+        """
+        for name, column_type in TEXT_COLUMN_TYPES.items():
+            self.client.command(f"ALTER TABLE prompt_logs MODIFY COLUMN {name} {column_type}")
+
+    def backfill_rollup(self, start_time=None, end_time=None):
+        """Fold a window of raw rows into the rollup, e.g. one whose rollup rows were dropped to repair them."""
+        where_clause, params = _filter_clause(start_time=start_time, end_time=end_time)
+        self.client.command(f"INSERT INTO {ROLLUP_TABLE} {rollup_select(where_clause)}", parameters=params)
     
-    def insert_log(self, category, model, prompt_text, response, input_tokens, output_tokens, duration, cost=0):
-        query = """
+    def insert_log(self, category, model, prompt_text, response, input_tokens, output_tokens, duration, cost=0, timestamp=None):
+        if self.buffered or self.spool is not None:
+            self.insert_result({
+                "category": category, "model": model, "prompt_text": prompt_text, "response": response,
+                "input_tokens": input_tokens, "output_tokens": output_tokens, "duration": duration, "cost": cost,
+                "timestamp": timestamp
+            })
+            return
+        # Keep the runner's own completion time when it is supplied; otherwise let the server stamp the row
+        timestamp_expr = "parseDateTime64BestEffort(%s, 3, 'UTC')" if timestamp else "NOW()"
+        query = f"""
         INSERT INTO prompt_logs (category, model, prompt_text, response, input_tokens, output_tokens, duration, cost, timestamp)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW())
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, {timestamp_expr})
         """
+        params = [
+            category,
+            model,
+            prompt_text,
+            response,
+            input_tokens,
+            output_tokens,
+            duration,
+            cost
+        ]
+        if timestamp:
+            params.append(str(timestamp))
         try:
-            self.client.command(query, parameters=[
-                category,
-                model,
-                prompt_text,
-                response,
-                input_tokens,
-                output_tokens,
-                duration,
-                cost
-            ])
+            self.client.command(query, parameters=params)
         except Exception as e:
             print(f"[ClickHouse] Insert Error: {e}")
     
-    def fetch_logs(self, category=None, model=None, start_time=None, end_time=None, limit=100):
-        conditions = []
-        params = []
-
-        if category:
-            conditions.append("category = %s")
-            params.append(category)
-        if model:
-            conditions.append("model = %s")
-            params.append(model)
-        if start_time:
-            conditions.append("timestamp >= %s")
-            params.append(start_time)
-        if end_time:
-            conditions.append("timestamp <= %s")
-            params.append(end_time)
-
-        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    def insert_result(self, result):
+        """Insert a result dict as returned by the benchmark runners, including the extended columns."""
+        self.insert_results([result])
+
+    def insert_results(self, results):
+        """Insert runner result dicts; unbuffered, they go out as one columnar INSERT (one part)."""
+        rows = [_storage_row(result) for result in results]
+        if not rows:
+            return
+        if self.spool is not None:
+            self._spool(rows)
+            return
+        if self.buffered:
+            self._append(rows)
+            return
+        with self._insert_lock:
+            self._insert_rows(rows)
+
+    def _insert_rows(self, rows, column_names=ALL_COLUMNS):
+        """Write rows with a single column-oriented client.insert. Returns True on success."""
+        columns = [list(column) for column in zip(*rows)]
+        start = time.perf_counter()
+        try:
+            self.client.insert("prompt_logs", columns, column_names=column_names, column_oriented=True,
+                               settings=self.insert_settings)
+        except Exception as e:
+            self.stats["insert_errors"] += 1
+            self._emit("clickhouse_insert_errors_total", 1, "counter")
+            print(f"[ClickHouse] Bulk Insert Error: {e}")
+            return False
+        self.stats["rows_inserted"] += len(rows)
+        self.stats["flushes"] += 1
+        self._emit("clickhouse_insert_rows_total", len(rows), "counter")
+        if self.metrics:
+            self.metrics.emit_histogram("clickhouse_insert_flush_seconds", time.perf_counter() - start, None,
+                                        {"table": "prompt_logs"})
+        return True
+
+    def _append(self, rows):
+        with self._condition:
+            if self._flusher is None:
+                raise RuntimeError("ClickHousePromptLogRepository is closed.")
+            if len(self._buffer) >= self.max_buffer_rows:
+                # Back-pressure: wait for the flusher rather than growing the buffer without bound
+                waited_from = time.perf_counter()
+                self._condition.notify_all()
+                while len(self._buffer) >= self.max_buffer_rows and self._flusher is not None:
+                    self._condition.wait()
+                waited = time.perf_counter() - waited_from
+                self.stats["backpressure_seconds"] += waited
+                self._emit("clickhouse_insert_backpressure_seconds_total", waited, "counter")
+            if not self._buffer:
+                self._buffer_started = time.monotonic()
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.flush_rows:
+                self._condition.notify_all()
+
+    def _take_buffer(self):
+        rows, self._buffer, self._buffer_started = self._buffer, [], None
+        self._condition.notify_all()  # Wake producers blocked on a full buffer
+        return rows
+
+    def _flush_loop(self):
+        while True:
+            with self._condition:
+                while self._flusher is not None:
+                    if len(self._buffer) >= self.flush_rows:
+                        break
+                    if self._buffer and time.monotonic() - self._buffer_started >= self.flush_interval:
+                        break
+                    timeout = self.flush_interval
+                    if self._buffer:
+                        timeout = max(0.0, self._buffer_started + self.flush_interval - time.monotonic())
+                    self._condition.wait(timeout)
+                stopping = self._flusher is None
+            if not self._flush_once() and not stopping:
+                time.sleep(self.flush_interval)  # ClickHouse is failing; don't retry in a tight loop
+            if stopping:
+                return
+
+    def _spool(self, rows):
+        records = []
+        for row in rows:
+            row[TIMESTAMP_INDEX] = row[TIMESTAMP_INDEX].isoformat()
+            records.append((uuid.uuid4().hex, row))
+        with self._condition:
+            if self._flusher is None:
+                raise RuntimeError("ClickHousePromptLogRepository is closed.")
+            self.spool.append(records)
+            self._spooled_rows += len(records)
+            if self._spooled_rows >= self.flush_rows:
+                self._condition.notify_all()
+
+    def _replay_loop(self):
+        while True:
+            with self._condition:
+                if self._flusher is not None and self._spooled_rows < self.flush_rows:
+                    self._condition.wait(self.flush_interval)
+                self._spooled_rows = 0
+                stopping = self._flusher is None
+            if not self._replay() and not stopping:
+                time.sleep(self.flush_interval)  # ClickHouse is failing; the rows are safe on disk meanwhile
+            if stopping:
+                return
+
+    def _replay(self):
+        """Insert every spooled row, oldest first. Returns False if ClickHouse failed; the rest stays spooled."""
+        with self._insert_lock:
+            try:
+                while True:
+                    records, position = self.spool.read_batch(self.flush_rows)
+                    if not records:
+                        return True
+                    if self._verify_spool:
+                        landed = self._landed_spool_keys(records)
+                        if landed is None:
+                            return False
+                        if landed:
+                            self.stats["rows_deduplicated"] += len(landed)
+                            self._emit("clickhouse_spool_duplicates_skipped_total", len(landed), "counter")
+                    else:
+                        landed = set()
+                    rows = [row + [key] for key, row in records if key not in landed]
+                    for row in rows:
+                        row[TIMESTAMP_INDEX] = _to_datetime(row[TIMESTAMP_INDEX])
+                    # A failed insert may still have been applied (e.g. a timeout after the server committed)
+                    self._verify_spool = True
+                    if rows and not self._insert_rows(rows, column_names=ALL_COLUMNS + [SPOOL_KEY_COLUMN]):
+                        return False
+                    self.spool.commit(position, len(records))
+                    self._verify_spool = False
+                    self._emit("clickhouse_spool_replayed_rows_total", len(rows), "counter")
+            except OSError as e:
+                print(f"[ClickHouse] Spool Error: {e}")
+                return False
+            finally:
+                for name, value in self.spool.depth().items():
+                    self._emit(f"clickhouse_spool_{name}", value, "gauge")
+
+    def _landed_spool_keys(self, records):
+        """Keys of spooled records that are already in prompt_logs, or None if ClickHouse can't be asked."""
+        timestamps = [_to_datetime(row[TIMESTAMP_INDEX]) for _, row in records]
+        query = f"""
+        SELECT {SPOOL_KEY_COLUMN}
+        FROM prompt_logs
+        WHERE timestamp >= %s AND timestamp < %s AND {SPOOL_KEY_COLUMN} IN %s
+        """
+        # Parameters are bound with whole-second precision, so widen the window to whole seconds
+        start, end = min(timestamps).astimezone(timezone.utc), max(timestamps).astimezone(timezone.utc)
+        params = [start, end + timedelta(seconds=1), tuple(key for key, _ in records)]
+        try:
+            return {row[0] for row in self.client.query(query, parameters=params).result_rows}
+        except Exception as e:
+            print(f"[ClickHouse] Spool Replay Check Error: {e}")
+            return None
+
+    def flush(self):
+        """Write every buffered (or spooled) row now. A no-op without buffering."""
+        if self.spool is not None:
+            self.spool.sync()
+            self._replay()
+            return
+        self._flush_once()
+
+    def _flush_once(self):
+        with self._insert_lock:
+            with self._condition:
+                depth = len(self._buffer)
+                rows = self._take_buffer()
+            if not rows:
+                return True
+            self._emit("clickhouse_insert_buffer_rows", depth, "gauge")
+            if self._insert_rows(rows):
+                return True
+            self._requeue(rows)
+            return False
 
+    def _requeue(self, rows):
+        # Keep failed rows for the next flush, dropping the oldest if that would overflow the buffer
+        with self._condition:
+            room = max(0, self.max_buffer_rows - len(self._buffer))
+            dropped = max(0, len(rows) - room)
+            if dropped:
+                self.stats["rows_dropped"] += dropped
+                self._emit("clickhouse_insert_rows_dropped_total", dropped, "counter")
+                print(f"[ClickHouse] Buffer full: dropped {dropped} rows after a failed insert")
+            self._buffer[:0] = rows[dropped:]
+            if self._buffer and self._buffer_started is None:
+                self._buffer_started = time.monotonic()
+            depth = len(self._buffer)
+        self._emit("clickhouse_insert_buffer_rows", depth, "gauge")
+
+    def close(self):
+        """Flush buffered rows and stop the background flusher; rows ClickHouse refused stay spooled."""
+        with self._condition:
+            flusher, self._flusher = self._flusher, None
+            self._condition.notify_all()
+        if flusher is not None:
+            flusher.join()
+        if self.spool is not None:
+            self.spool.close()
+            pending = self.spool.depth()["rows"]
+            if pending:
+                print(f"[ClickHouse] {pending} rows stay spooled in {self.spool.directory} until the next start")
+
+    def _emit(self, name, value, metric_type):
+        if self.metrics:
+            self.metrics.emit_metric(name, value, {"table": "prompt_logs"}, metric_type=metric_type)
+
+    def record_checkpoints(self, run_id, rows):
+        """Insert (prompt_id, status, updated_at) checkpoint rows for a run as a single part."""
+        if self.buffered or self.spool is not None:
+            self.flush()  # A checkpoint must never land before the result rows it vouches for
+        data = [[run_id, prompt_id, status, _to_datetime(updated_at)] for prompt_id, status, updated_at in rows]
+        if not data:
+            return
+        try:
+            self.client.insert("run_checkpoints", data, column_names=["run_id", "prompt_id", "status", "updated_at"])
+        except Exception as e:
+            print(f"[ClickHouse] Checkpoint Insert Error: {e}")
+
+    def fetch_checkpoints(self, run_id):
+        """Return {prompt_id: status} for every checkpointed prompt of a run."""
+        query = """
+        SELECT prompt_id, argMax(status, updated_at)
+        FROM run_checkpoints
+        WHERE run_id = %s
+        GROUP BY prompt_id
+        """
+        try:
+            return dict(self.client.query(query, parameters=[run_id]).result_rows)
+        except Exception as e:
+            print(f"[ClickHouse] Checkpoint Fetch Error: {e}")
+            return {}
+
+    def fetch_logs(self, category=None, model=None, start_time=None, end_time=None, limit=100):
+        where_clause, params = _filter_clause(category, model, start_time, end_time)
         query = f"""
-        SELECT category, model, prompt_text, response, input_tokens, output_tokens, duration, cost, timestamp
+        SELECT {', '.join(ALL_COLUMNS)}
         FROM prompt_logs
         {where_clause}
         ORDER BY timestamp DESC
-        LIMIT {limit}
+        LIMIT {int(limit)}
         """
         try:
             rows = self.client.query(query, parameters=params).result_rows
-            columns = ["category", "model", "prompt_text", "response", "input_tokens", "output_tokens", "duration", "cost", "timestamp"]
-            return [dict(zip(columns, row)) for row in rows]
+            return [dict(zip(ALL_COLUMNS, row)) for row in rows]
         except Exception as e:
             print(f"[ClickHouse] Fetch Error: {e}")
             return []
 
+    def iter_logs(self, category=None, model=None, start_time=None, end_time=None, batch_size=10_000, columns=None):
+        """
+        Yield every log matching the filters as a dict, newest first, from a single streaming
+        query: rows arrive in blocks of at most `batch_size`, so memory stays bounded however
+        large the window is. `columns` restricts the fetched columns (e.g. to leave out
+        prompt_text and response).
+        """
+        columns = projected_columns(columns)
+        where_clause, params = _filter_clause(category, model, start_time, end_time)
+        query = f"""
+        SELECT {', '.join(columns)}
+        FROM prompt_logs
+        {where_clause}
+        ORDER BY timestamp DESC
+        """
+        with self.client.query_row_block_stream(query, parameters=params,
+                                                settings={"max_block_size": int(batch_size)}) as stream:
+            for block in stream:
+                for row in block:
+                    yield dict(zip(columns, row))
+
+    def fetch_logs_df(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        """
+        Every log matching the filters (or the newest `limit`) as a pandas DataFrame built by
+        clickhouse_connect straight from the native columnar response, with numpy dtypes.
+        `columns` may also name the derived boolean column "success".
+        """
+        query, params = self._frame_query(category, model, start_time, end_time, columns, limit)
+        return self.client.query_df(query, parameters=params)
+
+    def fetch_logs_arrow(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        """fetch_logs_df as a pyarrow Table, read in ClickHouse's Arrow output format."""
+        query, params = self._frame_query(category, model, start_time, end_time, columns, limit)
+        return self.client.query_arrow(query, parameters=params)
+
+    def _frame_query(self, category, model, start_time, end_time, columns, limit):
+        columns = projected_columns(columns, available=ALL_COLUMNS + list(DERIVED_COLUMNS))
+        where_clause, params = _filter_clause(category, model, start_time, end_time)
+        select = ", ".join(f"{DERIVED_COLUMNS[column]} AS {column}" if column in DERIVED_COLUMNS else column
+                           for column in columns)
+        query = f"SELECT {select} FROM prompt_logs {where_clause} ORDER BY timestamp DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return query, params
 
     def get_aggregated_stats(self, start_time=None, end_time=None):
-        conditions = []
-        params = []
-        
-        if start_time:
-            conditions.append("timestamp >= %s")
-            params.append(start_time)
-        if end_time:
-            conditions.append("timestamp <= %s")
-            params.append(end_time)
-        
-        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._aggregate(["input_tokens", "output_tokens", "cost", "duration_sum", "total_runs"],
+                               group_by=["category"], start_time=start_time, end_time=end_time)
+        return [
+            (row["category"], row["input_tokens"] + row["output_tokens"], round(row["cost"], 5),
+             round(row["duration_sum"] / row["total_runs"], 2) if row["total_runs"] else 0.0)
+            for row in rows
+        ]
+
+    def get_category_summaries(self, start_time=None, end_time=None):
+        """aggregate_summary per category (with its "category" key), ordered by category; one grouped query."""
+        rows = self._aggregate(list(ROLLUP_AGGREGATES), group_by=["category"], start_time=start_time,
+                               end_time=end_time)
+        return [_derive_stats(row) for row in rows if row["total_runs"]]
+
+    def aggregate_summary(self, category=None, model=None, start_time=None, end_time=None):
+        """Counts, totals, average latency and latency/cost quantiles for a filter window as one dict (None if empty)."""
+        rows = self._aggregate(list(ROLLUP_AGGREGATES), category=category, model=model,
+                               start_time=start_time, end_time=end_time)
+        if not rows or not rows[0]["total_runs"]:
+            return None
+        return _derive_stats(rows[0])
+
+    def get_time_series(self, bucket_seconds=60, category=None, model=None, start_time=None, end_time=None):
+        """Per-bucket stats ordered by bucket; served from the rollup for whole-minute buckets."""
+        rows = self._aggregate(list(ROLLUP_AGGREGATES), category=category, model=model, start_time=start_time,
+                               end_time=end_time, bucket_seconds=bucket_seconds)
+        return [_derive_stats(row) for row in rows]
 
+    def _uses_rollup(self, start_time=None, end_time=None, bucket_seconds=None):
+        # The rollup answers exactly when every bucket and window edge falls on a whole minute
+        return (self.rollup_enabled and (bucket_seconds or 60) % 60 == 0
+                and _minute_aligned(start_time) and _minute_aligned(end_time))
+
+    def _aggregate(self, names, group_by=(), category=None, model=None, start_time=None, end_time=None,
+                   bucket_seconds=None):
+        use_rollup = self._uses_rollup(start_time, end_time, bucket_seconds)
+        aggregates = ROLLUP_AGGREGATES if use_rollup else RAW_AGGREGATES
+        time_column = "bucket" if use_rollup else "timestamp"
+        keys = list(group_by)
+        select = list(keys)
+        if bucket_seconds:
+            keys.insert(0, "bucket_start")
+            select.insert(0, f"toStartOfInterval({time_column}, INTERVAL {int(bucket_seconds)} SECOND) AS bucket_start")
+        select += [f"{aggregates[name]} AS {name}" for name in names]
+
+        where_clause, params = _filter_clause(category, model, start_time, end_time, time_column=time_column,
+                                              end_exclusive=use_rollup)
+        source = ROLLUP_TABLE if use_rollup else "prompt_logs"
+        if use_rollup and end_time:
+            # Rollup buckets cover [minute, minute + 60s), so buckets before the end come from the rollup and
+            # rows stamped exactly at the (inclusive) end from prompt_logs, as the raw path would count them
+            edge_clause, edge_params = _filter_clause(category, model, start_time, end_time)
+            source = f"""(
+            SELECT * FROM {ROLLUP_TABLE} {where_clause}
+            UNION ALL
+            {rollup_select(f"{edge_clause} AND timestamp >= %s")}
+            )"""
+            params = params + edge_params + [end_time]
+            where_clause = ""
+        group_clause = f"GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}" if keys else ""
         query = f"""
-        SELECT 
-            category,
-            SUM(input_tokens + output_tokens) as total_tokens,
-            ROUND(SUM(cost), 5) as total_cost,
-            ROUND(AVG(duration), 2) as avg_duration
-        FROM prompt_logs
+        SELECT {', '.join(select)}
+        FROM {source}
         {where_clause}
-        GROUP BY category
+        {group_clause}
         """
+        columns = keys + list(names)
         try:
-            return self.client.query(query, parameters=params).result_rows
+            return [dict(zip(columns, row)) for row in self.client.query(query, parameters=params).result_rows]
         except Exception as e:
-            print(f"[ClickHouse] Aggregated Stats Error: {e}")
+            print(f"[ClickHouse] Aggregation Error: {e}")
             return []
-    
+
     def convert_logs_to_metrics(self, exporter):
         stats = self.get_aggregated_stats()
         
@@ -136,3 +601,62 @@ class ClickHousePromptLogRepository:
     # Return last 100 logs without filters (default behavior)
         return self.fetch_logs(limit=100)
 
+
+
+def _to_datetime(value):
+    """Normalize ISO strings, epoch milliseconds and naive datetimes to UTC datetimes for DateTime64 columns."""
+    if value is None:
+        return datetime.now(timezone.utc)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, timezone.utc)  # SQLite stores epoch ms (e.g. merged shards)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _filter_clause(category=None, model=None, start_time=None, end_time=None, time_column="timestamp",
+                   end_exclusive=False):
+    conditions = []
+    params = []
+    if category:
+        conditions.append("category = %s")
+        params.append(category)
+    if model:
+        conditions.append("model = %s")
+        params.append(model)
+    if start_time:
+        conditions.append(f"{time_column} >= %s")
+        params.append(start_time)
+    if end_time:
+        conditions.append(f"{time_column} {'<' if end_exclusive else '<='} %s")
+        params.append(end_time)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+def _minute_aligned(value):
+    if not value:
+        return True
+    value = _to_datetime(value)
+    return value.second == 0 and value.microsecond == 0
+
+
+def _derive_stats(row):
+    """Add failure count, averages and named latency and cost quantiles to an aggregate row."""
+    stats = dict(row)
+    total_runs = stats["total_runs"]
+    stats["failure_count"] = total_runs - stats["success_count"] - stats["throttled_count"]
+    stats["average_latency_sec"] = stats["latency_sum"] / stats["latency_count"] if stats["latency_count"] else 0.0
+    for prefix, unit, count in (("latency", "sec", stats["latency_count"]), ("cost", "usd", total_runs)):
+        quantiles = stats.pop(f"{prefix}_quantiles", None) or []
+        for level, value in zip(LATENCY_QUANTILES, quantiles):
+            stats[quantile_name(prefix, level, unit)] = value if count else 0.0
+    return stats
+
+
+def _storage_row(result):
+    """result_row in ALL_COLUMNS order with the timestamp as a UTC datetime."""
+    row = list(result_row(result))
+    row[TIMESTAMP_INDEX] = _to_datetime(row[TIMESTAMP_INDEX])
+    return row
@@ -0,0 +1,114 @@
+"""
+Per-minute pre-aggregation of ClickHouse prompt_logs: the rollup table, the materialized view feeding
+it, and the same named aggregates over the rollup (ROLLUP_AGGREGATES) and over raw rows (RAW_AGGREGATES).
+"""
+
+from anthrotrace.core.prompt_log_schema import LATENCY_CONDITION
+from anthrotrace.core.quantile_sketch import LATENCY_QUANTILES
+
+ROLLUP_TABLE = "prompt_logs_rollup_1m"
+ROLLUP_VIEW = "prompt_logs_rollup_1m_mv"
+
+_QUANTILE_LEVELS = ", ".join(str(level) for level in LATENCY_QUANTILES)
+
+CREATE_ROLLUP_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+    bucket DateTime('UTC'),
+    category String,
+    model String,
+    requests SimpleAggregateFunction(sum, UInt64),
+    successes SimpleAggregateFunction(sum, UInt64),
+    throttled SimpleAggregateFunction(sum, UInt64),
+    cache_hits SimpleAggregateFunction(sum, UInt64),
+    input_tokens SimpleAggregateFunction(sum, UInt64),
+    output_tokens SimpleAggregateFunction(sum, UInt64),
+    cost SimpleAggregateFunction(sum, Float64),
+    duration_sum SimpleAggregateFunction(sum, Float64),
+    latency_sum SimpleAggregateFunction(sum, Float64),
+    latency_count SimpleAggregateFunction(sum, UInt64),
+    last_timestamp SimpleAggregateFunction(max, DateTime64(3, 'UTC')),
+    latency_quantiles AggregateFunction(quantilesTDigest({_QUANTILE_LEVELS}), Float64),
+    cost_quantiles AggregateFunction(quantilesTDigest({_QUANTILE_LEVELS}), Float64)
+) ENGINE = AggregatingMergeTree()
+ORDER BY (bucket, category, model)
+"""
+
+
+def rollup_select(where_clause=""):
+    """SELECT that turns raw prompt_logs rows into rollup rows (used by the view and by backfills)."""
+    return f"""
+    SELECT
+        toStartOfMinute(timestamp) AS bucket,
+        category,
+        model,
+        count() AS requests,
+        countIf(response != '') AS successes,
+        countIf(status = 'throttled') AS throttled,
+        countIf(cached = 1) AS cache_hits,
+        sum(input_tokens) AS input_tokens,
+        sum(output_tokens) AS output_tokens,
+        sum(cost) AS cost,
+        sum(duration) AS duration_sum,
+        sumIf(duration, {LATENCY_CONDITION}) AS latency_sum,
+        countIf({LATENCY_CONDITION}) AS latency_count,
+        max(timestamp) AS last_timestamp,
+        quantilesTDigestStateIf({_QUANTILE_LEVELS})(duration, {LATENCY_CONDITION}) AS latency_quantiles,
+        quantilesTDigestState({_QUANTILE_LEVELS})(prompt_logs.cost) AS cost_quantiles
+    FROM prompt_logs
+    {where_clause}
+    GROUP BY bucket, category, model
+    """
+
+
+def create_rollup_view(cutoff):
+    """
+    CREATE for the view that folds inserted rows stamped at or after `cutoff` (a UTC datetime) into
+    the rollup while rows before the cutoff are backfilled, so no row is counted twice. Once the
+    backfill is done, DROP_ROLLUP_VIEW_FILTER makes the view fold in every inserted row.
+    """
+    where_clause = f"WHERE timestamp >= toDateTime64('{cutoff:%Y-%m-%d %H:%M:%S}', 3, 'UTC')"
+    return f"CREATE MATERIALIZED VIEW IF NOT EXISTS {ROLLUP_VIEW} TO {ROLLUP_TABLE} AS {rollup_select(where_clause)}"
+
+
+DROP_ROLLUP_VIEW_FILTER = f"ALTER TABLE {ROLLUP_VIEW} MODIFY QUERY {rollup_select()}"
+
+# 1 while the view still carries the cutoff filter of create_rollup_view, e.g. after a crash mid-rebuild
+ROLLUP_VIEW_FILTERED = f"""
+SELECT count() FROM system.tables
+WHERE database = currentDatabase() AND name = '{ROLLUP_VIEW}' AND position(as_select, 'WHERE') > 0
+"""
+
+# name -> expression over the rollup table
+ROLLUP_AGGREGATES = {
+    "total_runs": "sum(requests)",
+    "success_count": "sum(successes)",
+    "throttled_count": "sum(throttled)",
+    "cached_count": "sum(cache_hits)",
+    "input_tokens": "sum(input_tokens)",
+    "output_tokens": "sum(output_tokens)",
+    "cost": "sum(cost)",
+    "duration_sum": "sum(duration_sum)",
+    "latency_sum": "sum(latency_sum)",
+    "latency_count": "sum(latency_count)",
+    "last_timestamp": "max(last_timestamp)",
+    "latency_quantiles": f"quantilesTDigestMerge({_QUANTILE_LEVELS})(latency_quantiles)",
+    "cost_quantiles": f"quantilesTDigestMerge({_QUANTILE_LEVELS})(cost_quantiles)",
+}
+
+# name -> the same value computed from raw prompt_logs rows
+RAW_AGGREGATES = {
+    "total_runs": "count()",
+    "success_count": "countIf(response != '')",
+    "throttled_count": "countIf(status = 'throttled')",
+    "cached_count": "countIf(cached = 1)",
+    "input_tokens": "sum(input_tokens)",
+    "output_tokens": "sum(output_tokens)",
+    "cost": "sum(cost)",
+    "duration_sum": "sum(duration)",
+    "latency_sum": f"sumIf(duration, {LATENCY_CONDITION})",
+    "latency_count": f"countIf({LATENCY_CONDITION})",
+    "last_timestamp": "max(timestamp)",
+    "latency_quantiles": f"quantilesTDigestIf({_QUANTILE_LEVELS})(duration, {LATENCY_CONDITION})",
+    # Qualified, so it reads the column rather than the sum aliased as cost
+    "cost_quantiles": f"quantilesTDigest({_QUANTILE_LEVELS})(prompt_logs.cost)",
+}
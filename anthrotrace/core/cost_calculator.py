@@ -1,27 +1,47 @@
-# Anthropic Pricing (as of July 2025)
+# Anthropic Pricing (as of July 2025), USD per million tokens.
+# cache_write is the 5-minute prompt-cache write rate (1.25x input), cache_read the cache hit rate (0.1x input).
 PRICING = {
-    "claude-3-opus-20240229": {"input": 15.00, "output": 75.00},
-    "claude-3-sonnet-20240229": {"input": 3.00, "output": 15.00},
-    "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25},
-    "claude-sonnet-4-20250514": {"input": 3.00, "output": 15.00},
-    "claude-opus-4-20250514": {"input": 15.00, "output": 75.00},
-    "claude-haiku-4-20250514": {"input": 0.25, "output": 1.25},
+    "claude-3-opus-20240229": {"input": 15.00, "output": 75.00, "cache_write": 18.75, "cache_read": 1.50},
+    "claude-3-sonnet-20240229": {"input": 3.00, "output": 15.00, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-3-haiku-20240307": {"input": 0.25, "output": 1.25, "cache_write": 0.30, "cache_read": 0.03},
+    "claude-sonnet-4-20250514": {"input": 3.00, "output": 15.00, "cache_write": 3.75, "cache_read": 0.30},
+    "claude-opus-4-20250514": {"input": 15.00, "output": 75.00, "cache_write": 18.75, "cache_read": 1.50},
+    "claude-haiku-4-20250514": {"input": 0.25, "output": 1.25, "cache_write": 0.30, "cache_read": 0.03},
 }
 
-def calculate_cost(context: dict) -> float:
-    """
-    Calculate cost using the default Anthropic pricing table.
-    Expects context dict with keys: 'model', 'input_tokens', 'output_tokens'.
-    """
+# Fallback cache rates, relative to the input rate, for pricing tables without cache_write/cache_read
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.10
+
+# Message Batches API requests are billed at half the standard rate
+BATCH_DISCOUNT = 0.5
+
+def _cost_from_pricing(pricing_dict, context):
     model = context.get('model', '').lower()
     input_tokens = context.get('input_tokens', 0)
     output_tokens = context.get('output_tokens', 0)
-    if model not in PRICING:
+    if model not in pricing_dict:
         raise ValueError(f"Pricing for model '{model}' not found.")
-    pricing = PRICING[model]
+    pricing = pricing_dict[model]
     input_cost = (input_tokens / 1_000_000) * pricing["input"]
     output_cost = (output_tokens / 1_000_000) * pricing["output"]
-    return input_cost + output_cost
+    cache_write_rate = pricing.get("cache_write", pricing["input"] * CACHE_WRITE_MULTIPLIER)
+    cache_read_rate = pricing.get("cache_read", pricing["input"] * CACHE_READ_MULTIPLIER)
+    cache_write_cost = (context.get('cache_creation_input_tokens', 0) / 1_000_000) * cache_write_rate
+    cache_read_cost = (context.get('cache_read_input_tokens', 0) / 1_000_000) * cache_read_rate
+    cost = input_cost + output_cost + cache_write_cost + cache_read_cost
+    if context.get('batch'):
+        cost *= BATCH_DISCOUNT
+    return cost
+
+def calculate_cost(context: dict) -> float:
+    """
+    Calculate cost using the default Anthropic pricing table.
+    Expects context dict with keys: 'model', 'input_tokens', 'output_tokens', and optionally
+    'cache_creation_input_tokens' / 'cache_read_input_tokens' for prompt caching.
+    Set 'batch': True for requests sent through the Message Batches API to apply BATCH_DISCOUNT.
+    """
+    return _cost_from_pricing(PRICING, context)
 
 def make_cost_calculator(pricing_dict):
     """
@@ -30,16 +50,10 @@ def make_cost_calculator(pricing_dict):
         my_pricing = { ... }
         my_cost_fn = make_cost_calculator(my_pricing)
         runner = AnthropicBenchmarkWithSQLite(api_key, cost_calculator=my_cost_fn)
-    The returned function expects a context dict with keys: 'model', 'input_tokens', 'output_tokens'.
+    The returned function expects a context dict with keys: 'model', 'input_tokens', 'output_tokens'
+    (and optionally the cache token counts and 'batch', as for calculate_cost). Models may set
+    'cache_write' and 'cache_read' rates; otherwise they default to 1.25x and 0.1x the input rate.
     """
     def custom_cost(context: dict) -> float:
-        model = context.get('model', '').lower()
-        input_tokens = context.get('input_tokens', 0)
-        output_tokens = context.get('output_tokens', 0)
-        if model not in pricing_dict:
-            raise ValueError(f"Pricing for model '{model}' not found.")
-        pricing = pricing_dict[model]
-        input_cost = (input_tokens / 1_000_000) * pricing["input"]
-        output_cost = (output_tokens / 1_000_000) * pricing["output"]
-        return input_cost + output_cost
+        return _cost_from_pricing(pricing_dict, context)
     return custom_cost
@@ -0,0 +1,175 @@
+"""
+Append-only, segmented on-disk queue of (key, payload) records waiting for delivery to a remote
+store. Delivery is at-least-once; the keys let the consumer drop records it already has.
+"""
+
+import json
+import os
+import threading
+import time
+
+CURSOR_FILE = "cursor.json"
+
+
+class DurableSpool:
+    """
+    Appends are flushed to the OS at once and fsynced every `fsync_interval` seconds; commit()
+    moves the cursor past delivered records and deletes fully delivered segments.
+
+    Usage:
+        spool = DurableSpool("data/spool/clickhouse")
+        spool.append([(key, payload), ...])
+        records, position = spool.read_batch(1000)
+        ...deliver records...
+        spool.commit(position, len(records))
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, fsync_interval=1.0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._cursor = self._load_cursor()
+
+        segments = []
+        for number in self._segment_numbers():
+            if number < self._cursor[0]:
+                os.unlink(self._segment_path(number))  # Delivered; the previous process stopped before deleting it
+            else:
+                segments.append(number)
+        if segments:
+            self._truncate_torn_tail(segments[-1])
+        self._segments = segments or [self._cursor[0]]
+        self._file = open(self._segment_path(self._segments[-1]), "ab")
+        self._size = self._file.tell()
+        self._rows = self._count_pending_rows()
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"segment-{number:012d}.jsonl")
+
+    def _segment_numbers(self):
+        return sorted(int(name[len("segment-"):-len(".jsonl")]) for name in os.listdir(self.directory)
+                      if name.startswith("segment-") and name.endswith(".jsonl"))
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as handle:
+                cursor = json.load(handle)
+            return cursor["segment"], cursor["offset"]
+        except FileNotFoundError:
+            return 1, 0
+
+    def _truncate_torn_tail(self, number):
+        """Drop a partial last line left by a crash in the middle of an append."""
+        path = self._segment_path(number)
+        with open(path, "rb+") as handle:
+            data = handle.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                handle.truncate(end)
+
+    def _count_pending_rows(self):
+        rows = 0
+        for number in self._segments:
+            with open(self._segment_path(number), "rb") as handle:
+                if number == self._cursor[0]:
+                    handle.seek(self._cursor[1])
+                rows += sum(chunk.count(b"\n") for chunk in iter(lambda: handle.read(1 << 20), b""))
+        return rows
+
+    def append(self, records):
+        """Append (key, payload) records; payloads must be JSON-serializable."""
+        data = b"".join(json.dumps([key, payload], separators=(",", ":")).encode("utf-8") + b"\n"
+                        for key, payload in records)
+        if not data:
+            return
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError("DurableSpool is closed.")
+            if self._size and self._size + len(data) > self.segment_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self._rows += len(records)
+            self._unsynced = True
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _rotate(self):
+        self._sync()
+        self._file.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._file = open(self._segment_path(self._segments[-1]), "ab")
+        self._size = 0
+
+    def _sync(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """fsync every appended record now."""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+
+    def read_batch(self, max_rows):
+        """
+        Up to `max_rows` of the oldest undelivered records, and the position to commit() once
+        they are delivered. Without a commit, the next call returns the same records.
+        """
+        with self._lock:
+            number, offset = self._cursor
+            active, active_size = self._segments[-1], self._size
+        records = []
+        while len(records) < max_rows:
+            with open(self._segment_path(number), "rb") as handle:
+                handle.seek(offset)
+                while len(records) < max_rows and (number != active or offset < active_size):
+                    line = handle.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    key, payload = json.loads(line)
+                    records.append((key, payload))
+            if len(records) >= max_rows or number == active:
+                break
+            number, offset = number + 1, 0  # The rest of a sealed segment has been read
+        return records, (number, offset)
+
+    def commit(self, position, rows):
+        """Mark everything before `position` (from read_batch) as delivered; `rows` records were read."""
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        with open(cursor_path + ".tmp", "w") as handle:
+            json.dump({"segment": position[0], "offset": position[1]}, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(cursor_path + ".tmp", cursor_path)
+        with self._lock:
+            self._cursor = position
+            self._rows -= rows
+            delivered = [number for number in self._segments[:-1] if number < position[0]]
+            self._segments = [number for number in self._segments if number >= position[0]]
+        for number in delivered:
+            os.unlink(self._segment_path(number))
+
+    def depth(self):
+        """Undelivered rows, bytes on disk and segment files, for alerting before the disk fills."""
+        with self._lock:
+            segments = list(self._segments)
+            rows, offset = self._rows, self._cursor[1]
+        size = sum(os.path.getsize(self._segment_path(number)) for number in segments)
+        return {"rows": rows, "bytes": size - offset, "segments": len(segments)}
+
+    def close(self):
+        """fsync and close the active segment; undelivered records stay on disk for the next open."""
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
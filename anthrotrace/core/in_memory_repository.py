@@ -0,0 +1,457 @@
+"""
+Columnar in-memory prompt log repository.
+
+Every column of ALL_COLUMNS is kept in a compact buffer instead of a dict per row:
+
+    TEXT columns (category, model, prompt_text, status, ...)  array('i') codes into an interned dictionary
+    INTEGER columns and the timestamp (epoch ms)             array('q'), NULL stored as 0
+    REAL columns                                             array('d'), NULL stored as NaN
+    response                                                 list of str, plus an array('b') success flag
+
+A row costs a few dozen bytes plus its response text, so tens of millions of rows fit in
+memory. Filters and aggregates run vectorized over zero-copy NumPy views of the buffers
+(numpy is imported lazily; without it row reads still work and aggregates are unavailable).
+
+The repository has the same interface as SQLiteRepository and ClickHousePromptLogRepository,
+so it serves as a fast test double and, with `max_rows`, as a bounded hot cache (e.g. a
+ResultPipeline sink) ahead of the persistent stores.
+"""
+
+import math
+import threading
+from array import array
+from datetime import datetime, timezone
+
+from anthrotrace.core.prompt_log_schema import ALL_COLUMNS, EXTENDED_COLUMNS, from_epoch_ms, projected_columns, to_epoch_ms
+from anthrotrace.core.quantile_sketch import LATENCY_QUANTILES, QuantileSketch, quantile_name
+
+_BASE_TYPES = {"input_tokens": "INTEGER", "output_tokens": "INTEGER", "duration": "REAL", "cost": "REAL",
+               "timestamp": "INTEGER"}
+_DECLARED_TYPES = dict(_BASE_TYPES, **{name: sqlite_type.split()[0] for name, sqlite_type, _ in EXTENDED_COLUMNS})
+CODED_COLUMNS = [column for column in ALL_COLUMNS if _DECLARED_TYPES.get(column, "TEXT") == "TEXT" and column != "response"]
+INTEGER_COLUMNS = [column for column in ALL_COLUMNS if _DECLARED_TYPES.get(column) == "INTEGER"]
+REAL_COLUMNS = [column for column in ALL_COLUMNS if _DECLARED_TYPES.get(column) == "REAL"]
+
+# Computed columns fetch_logs_df can return alongside the stored ones
+DERIVED_COLUMNS = ["success"]
+
+
+class InMemoryPromptLogRepository:
+    """
+    Usage:
+        repo = InMemoryPromptLogRepository(max_rows=5_000_000)
+        repo.insert_results(results)
+        BenchmarkSummaryService(repo).get_summary(category="Summarization")
+    """
+
+    def __init__(self, max_rows=None):
+        self.max_rows = max_rows  # Keep only the newest rows (in insertion order); None keeps everything
+        self._lock = threading.RLock()
+        self._codes = {column: array("i") for column in CODED_COLUMNS}
+        self._dictionaries = {column: [None] for column in CODED_COLUMNS}  # Code 0 is NULL
+        self._code_of = {column: {None: 0} for column in CODED_COLUMNS}
+        self._integers = {column: array("q") for column in INTEGER_COLUMNS}
+        self._reals = {column: array("d") for column in REAL_COLUMNS}
+        self._responses = []
+        self._success = array("b")
+        self._first_id = 1
+        self._checkpoints = {}
+
+    def __len__(self):
+        return len(self._success)
+
+    def insert_log(self, category, model, prompt_text, response, input_tokens, output_tokens, duration, cost=0.0,
+                   timestamp=None):
+        self.insert_result({
+            "category": category, "model": model, "prompt_text": prompt_text, "response": response,
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "duration": duration, "cost": cost,
+            "timestamp": timestamp
+        })
+
+    def insert_result(self, result):
+        self.insert_results([result])
+
+    def insert_results(self, results):
+        """Append runner result dicts column by column."""
+        results = list(results)
+        if not results:
+            return
+        timestamps = [to_epoch_ms(result.get("timestamp")) for result in results]
+        with self._lock:
+            for column in CODED_COLUMNS:
+                code_of = self._code_of[column]
+                values = [result.get(column) for result in results]
+                for value in set(values).difference(code_of):
+                    self._intern(column, value)
+                self._codes[column].extend([code_of[value] for value in values])
+            for column in INTEGER_COLUMNS:
+                if column == "timestamp":
+                    self._integers[column].extend(timestamps)
+                else:
+                    self._integers[column].extend([int(result.get(column) or 0) for result in results])
+            for column in REAL_COLUMNS:
+                values = [result.get(column) for result in results]
+                self._reals[column].extend([math.nan if value is None else value for value in values])
+            responses = [result.get("response") for result in results]
+            self._responses.extend(responses)
+            self._success.extend([1 if response else 0 for response in responses])
+            if self.max_rows and len(self) > self.max_rows + max(1, self.max_rows // 4):
+                self._evict(len(self) - self.max_rows)
+
+    def _intern(self, column, value):
+        code = len(self._dictionaries[column])
+        self._dictionaries[column].append(value)
+        self._code_of[column][value] = code
+        return code
+
+    def _evict(self, count):
+        # Amortized: rows are dropped in chunks of at least max_rows // 4, one memmove per buffer
+        for buffer in (*self._codes.values(), *self._integers.values(), *self._reals.values(), self._responses,
+                       self._success):
+            del buffer[:count]
+        self._first_id += count
+        for column in CODED_COLUMNS:
+            self._compact_dictionary(column)
+
+    def _compact_dictionary(self, column):
+        """Drop dictionary values no remaining row uses (e.g. prompts of evicted rows) and renumber the codes."""
+        dictionary = self._dictionaries[column]
+        try:
+            import numpy as np
+        except ImportError:
+            used = sorted(set(self._codes[column]).union((0,)))
+            if len(used) == len(dictionary):
+                return
+            renumbered = {code: index for index, code in enumerate(used)}
+            self._codes[column] = array("i", [renumbered[code] for code in self._codes[column]])
+        else:
+            codes = np.frombuffer(self._codes[column], dtype=np.int32)
+            in_use = np.bincount(codes, minlength=len(dictionary)) > 0
+            in_use[0] = True  # NULL keeps code 0
+            if in_use.all():
+                return
+            renumbered = np.cumsum(in_use, dtype=np.int32) - 1
+            used = np.flatnonzero(in_use).tolist()
+            self._codes[column] = array("i", renumbered[codes].tobytes())
+            del codes
+        self._dictionaries[column] = [dictionary[code] for code in used]
+        self._code_of[column] = {value: code for code, value in enumerate(self._dictionaries[column])}
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def record_checkpoints(self, run_id, rows):
+        with self._lock:
+            checkpoints = self._checkpoints.setdefault(run_id, {})
+            for prompt_id, status, updated_at in rows:
+                if prompt_id not in checkpoints or to_epoch_ms(updated_at) >= checkpoints[prompt_id][1]:
+                    checkpoints[prompt_id] = (status, to_epoch_ms(updated_at))
+
+    def fetch_checkpoints(self, run_id):
+        with self._lock:
+            return {prompt_id: status for prompt_id, (status, _) in self._checkpoints.get(run_id, {}).items()}
+
+    def _filter_codes(self, category, model):
+        """{column: code} for the category/model filters, or None if a value was never inserted."""
+        codes = {}
+        for column, value in (("category", category), ("model", model)):
+            if value:
+                if value not in self._code_of[column]:
+                    return None
+                codes[column] = self._code_of[column][value]
+        return codes
+
+    def _positions(self, np, category=None, model=None, start_time=None, end_time=None, newest_first=False,
+                   limit=None):
+        """
+        Buffer positions of the rows matching the filters as a NumPy array, optionally newest first
+        (timestamp, then id, descending) and cut to `limit`; slice(None) when every row matches in
+        buffer order. Call with the lock held; the NumPy views pin the buffers and are released
+        when this returns.
+        """
+        codes = self._filter_codes(category, model)
+        if codes is None:
+            return np.empty(0, dtype=np.int64)
+        if not (codes or start_time is not None or end_time is not None or newest_first):
+            return slice(None)
+        timestamps = np.frombuffer(self._integers["timestamp"], dtype=np.int64)
+        mask = np.ones(len(timestamps), dtype=bool)
+        for column, code in codes.items():
+            mask &= np.frombuffer(self._codes[column], dtype=np.int32) == code
+        if start_time is not None:
+            mask &= timestamps >= to_epoch_ms(start_time)
+        if end_time is not None:
+            mask &= timestamps <= to_epoch_ms(end_time)
+        rows = np.flatnonzero(mask)
+        if newest_first:
+            ordered = timestamps[rows]
+            if limit is not None and limit < len(rows):
+                # Only rows at or above the limit-th newest timestamp (ties included) need sorting
+                threshold = np.partition(ordered, len(ordered) - limit)[len(ordered) - limit]
+                rows, ordered = rows[ordered >= threshold], ordered[ordered >= threshold]
+            rows = rows[np.lexsort((-rows, -ordered))]
+        return rows[:limit] if limit is not None else rows
+
+    def _positions_without_numpy(self, category=None, model=None, start_time=None, end_time=None, limit=None):
+        codes = self._filter_codes(category, model)
+        if codes is None:
+            return []
+        start_ms = to_epoch_ms(start_time) if start_time is not None else None
+        end_ms = to_epoch_ms(end_time) if end_time is not None else None
+        timestamps = self._integers["timestamp"]
+        rows = [row for row in range(len(self))
+                if all(self._codes[column][row] == code for column, code in codes.items())
+                and (start_ms is None or timestamps[row] >= start_ms) and (end_ms is None or timestamps[row] <= end_ms)]
+        rows.sort(key=lambda row: (timestamps[row], row), reverse=True)
+        return rows[:limit] if limit is not None else rows
+
+    def _newest_ids(self, filters, limit=None):
+        """Ids (not positions, which shift on eviction) of matching rows, newest first."""
+        with self._lock:
+            try:
+                import numpy as np
+            except ImportError:
+                return [row + self._first_id for row in self._positions_without_numpy(**filters, limit=limit)]
+            return (self._positions(np, **filters, newest_first=True, limit=limit) + self._first_id).tolist()
+
+    def _read_row(self, row, columns):
+        log = {}
+        for column in columns:
+            if column == "id":
+                log["id"] = row + self._first_id
+            elif column == "response":
+                log["response"] = self._responses[row]
+            elif column == "timestamp":
+                log["timestamp"] = from_epoch_ms(self._integers["timestamp"][row])
+            elif column in self._codes:
+                log[column] = self._dictionaries[column][self._codes[column][row]]
+            elif column in self._integers:
+                log[column] = self._integers[column][row]
+            else:
+                value = self._reals[column][row]
+                log[column] = None if math.isnan(value) else value
+        return log
+
+    def fetch_logs(self, category=None, model=None, start_time=None, end_time=None, limit=100):
+        filters = {"category": category, "model": model, "start_time": start_time, "end_time": end_time}
+        return self._read_ids(self._newest_ids(filters, limit=int(limit)), ALL_COLUMNS)
+
+    def iter_logs(self, category=None, model=None, start_time=None, end_time=None, batch_size=1000, columns=None):
+        """Yield every log matching the filters as a dict, newest first; rows evicted meanwhile are skipped."""
+        columns = projected_columns(columns, available=["id"] + ALL_COLUMNS)
+        ids = self._newest_ids({"category": category, "model": model, "start_time": start_time, "end_time": end_time})
+        for start in range(0, len(ids), batch_size):
+            yield from self._read_ids(ids[start:start + batch_size], columns)
+
+    def _read_ids(self, ids, columns):
+        with self._lock:
+            return [self._read_row(row_id - self._first_id, columns) for row_id in ids if row_id >= self._first_id]
+
+    def get_all_logs(self):
+        return self.fetch_logs(limit=100)
+
+    def fetch_logs_df(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        """
+        Every log matching the filters (or the newest `limit`) as a pandas DataFrame gathered
+        column by column from the buffers. `columns` may also name the derived boolean column "success".
+        """
+        import numpy as np
+        import pandas as pd
+        columns = projected_columns(columns, available=["id"] + ALL_COLUMNS + DERIVED_COLUMNS)
+        with self._lock:
+            rows = self._positions(np, category, model, start_time, end_time, newest_first=True,
+                                   limit=int(limit) if limit else None)
+            data = {column: self._gather(np, column, rows) for column in columns}
+        frame = pd.DataFrame(data)
+        if "timestamp" in frame:
+            frame["timestamp"] = pd.to_datetime(frame["timestamp"], unit="ms", utc=True)
+        return frame
+
+    def fetch_logs_arrow(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        """fetch_logs_df as a pyarrow Table."""
+        import pyarrow as pa
+        frame = self.fetch_logs_df(category, model, start_time, end_time, columns=columns, limit=limit)
+        return pa.Table.from_pandas(frame, preserve_index=False)
+
+    def _gather(self, np, column, rows):
+        """Copy of one column for `rows` (from _positions) as a NumPy array."""
+        if isinstance(rows, slice):
+            rows = np.arange(len(self))[rows] if column in ("id", "response") else rows
+        if column == "id":
+            return rows + self._first_id
+        if column == "response":
+            return np.array([self._responses[row] for row in rows.tolist()], dtype=object)
+        if column == "success":
+            return np.frombuffer(self._success, dtype=np.int8)[rows].astype(bool)
+        if column in self._codes:
+            dictionary = np.array(self._dictionaries[column], dtype=object)
+            return dictionary[np.frombuffer(self._codes[column], dtype=np.int32)[rows]]
+        buffer, dtype = (self._integers, np.int64) if column in self._integers else (self._reals, np.float64)
+        values = np.frombuffer(buffer[column], dtype=dtype)[rows]
+        return values.copy() if values.base is not None else values  # A slice is a view of the buffer
+
+    def _summary_columns(self, np, rows):
+        data = {column: self._gather(np, column, rows)
+                for column in ("success", "cached", "input_tokens", "output_tokens", "cost", "duration", "timestamp")}
+        # Compare codes rather than strings
+        for flag, column, value in (("throttled", "status", "throttled"), ("batch", "execution_mode", "batch")):
+            data[flag] = np.frombuffer(self._codes[column], dtype=np.int32)[rows] == self._code_of[column].get(value, -1)
+        return data
+
+    def aggregate_summary(self, category=None, model=None, start_time=None, end_time=None):
+        """
+        Counts, totals, average latency and exact latency/cost quantiles for a filter window (None if empty),
+        with the latency min/max and sketches combine_totals merges across repositories.
+        """
+        import numpy as np
+        with self._lock:
+            data = self._summary_columns(np, self._positions(np, category, model, start_time, end_time))
+        if not len(data["timestamp"]):
+            return None
+        totals = _summarize(np, data, np.zeros(len(data["timestamp"]), dtype=np.int64), 1)[0]
+        latency = data["duration"][_latency_rows(np, data) & ~np.isnan(data["duration"])]
+        totals["min_latency"] = float(latency.min()) if len(latency) else None
+        totals["max_latency"] = float(latency.max()) if len(latency) else None
+        totals["latency_sketch"], totals["cost_sketch"] = QuantileSketch(), QuantileSketch()
+        totals["latency_sketch"].add_many(latency)
+        totals["cost_sketch"].add_many(data["cost"])
+        return totals
+
+    def get_time_series(self, bucket_seconds=60, category=None, model=None, start_time=None, end_time=None):
+        """aggregate_summary per `bucket_seconds` bucket, ordered by bucket_start."""
+        import numpy as np
+        with self._lock:
+            data = self._summary_columns(np, self._positions(np, category, model, start_time, end_time))
+        bucket_ms = int(bucket_seconds) * 1000
+        starts, groups = _bucket_groups(np, data["timestamp"] // bucket_ms)
+        series = _summarize(np, data, groups, len(starts))
+        for stats, bucket in zip(series, starts.tolist()):
+            stats["bucket_start"] = datetime.fromtimestamp(bucket * bucket_ms / 1000, timezone.utc)
+        return series
+
+    def get_aggregated_stats(self, start_time=None, end_time=None):
+        """(category, total tokens, cost, average duration) per category, as ClickHousePromptLogRepository returns."""
+        import numpy as np
+        with self._lock:
+            rows = self._positions(np, start_time=start_time, end_time=end_time)
+            # One grouping pass over the category codes instead of a filtered summary per category
+            codes, groups = np.unique(np.frombuffer(self._codes["category"], dtype=np.int32)[rows], return_inverse=True)
+            categories = [self._dictionaries["category"][code] for code in codes.tolist()]
+            tokens = self._gather(np, "input_tokens", rows) + self._gather(np, "output_tokens", rows)
+            cost, duration = self._gather(np, "cost", rows), self._gather(np, "duration", rows)
+        runs = np.bincount(groups, minlength=len(codes))
+        tokens = np.bincount(groups, weights=tokens, minlength=len(codes)).round().astype(np.int64)
+        cost = np.bincount(groups, weights=np.where(np.isnan(cost), 0.0, cost), minlength=len(codes))
+        duration = np.bincount(groups, weights=np.where(np.isnan(duration), 0.0, duration), minlength=len(codes))
+        stats = [(category, int(tokens[group]), round(float(cost[group]), 5),
+                  round(float(duration[group] / runs[group]), 2))
+                 for group, category in enumerate(categories) if category is not None]
+        return sorted(stats)
+
+    def convert_logs_to_metrics(self, exporter):
+        duration_buckets = [0.1, 0.5, 1.0, 2.0, 5.0, 10.0]
+        token_buckets = [100, 500, 1000, 2000, 5000, 10000]
+        stats = self.get_aggregated_stats()
+        for category, total_tokens, total_cost, avg_duration in stats:
+            labels = {'category': category}
+            exporter.emit_metric("prompt_total_tokens", total_tokens, labels, metric_type="counter")
+            exporter.emit_metric("prompt_total_cost_usd", total_cost, labels, metric_type="counter")
+            exporter.emit_metric("prompt_avg_duration_seconds", avg_duration, labels, metric_type="gauge")
+            exporter.emit_histogram("prompt_duration_seconds", avg_duration, duration_buckets, labels)
+            exporter.emit_histogram("prompt_total_tokens_histogram", total_tokens, token_buckets, labels)
+        print(f"[METRICS] Emitted {len(stats)} metric sets from the in-memory repository")
+
+
+def _bucket_groups(np, buckets):
+    """(sorted distinct buckets, group index of every row), like np.unique(return_inverse=True) without sorting."""
+    if not len(buckets):
+        return buckets, buckets
+    first = buckets.min()
+    offsets = buckets - first
+    span = int(offsets.max()) + 1
+    if span > 4 * len(buckets):  # Sparse buckets: a lookup table would outgrow the rows
+        return np.unique(buckets, return_inverse=True)
+    present = np.flatnonzero(np.bincount(offsets, minlength=span))
+    lookup = np.zeros(span, dtype=np.int64)
+    lookup[present] = np.arange(len(present))
+    return present + first, lookup[offsets]
+
+
+def _summarize(np, data, groups, count):
+    """aggregate_summary dicts for `count` groups of gathered rows; groups[i] is the group of row i."""
+    def total(values):
+        if count == 1:
+            return np.array([values.sum()])
+        return np.bincount(groups, weights=values, minlength=count)
+
+    def tally(flags):
+        if count == 1:
+            return np.array([np.count_nonzero(flags)])
+        return np.bincount(groups[flags], minlength=count)
+
+    duration = data["duration"]
+    has_duration = ~np.isnan(duration)
+    known_duration = np.where(has_duration, duration, 0.0)
+    latency_rows = _latency_rows(np, data)
+    columns = {
+        "success_count": tally(data["success"]),
+        "throttled_count": tally(data["throttled"]),
+        "cached_count": tally(data["cached"] == 1),
+        "input_tokens": total(data["input_tokens"]).round().astype(np.int64),
+        "output_tokens": total(data["output_tokens"]).round().astype(np.int64),
+        "cost": total(np.where(np.isnan(data["cost"]), 0.0, data["cost"])),
+        "duration_sum": total(known_duration),
+        "latency_sum": total(np.where(latency_rows, known_duration, 0.0)),
+        "latency_count": tally(latency_rows),
+    }
+    runs = np.array([len(groups)]) if count == 1 else np.bincount(groups, minlength=count)
+    if count == 1:
+        last_timestamps = np.array([data["timestamp"].max()])
+    else:
+        last_timestamps = np.full(count, np.iinfo(np.int64).min)
+        np.maximum.at(last_timestamps, groups, data["timestamp"])
+    latency_quantiles = _group_quantiles(np, duration[latency_rows & has_duration],
+                                         groups[latency_rows & has_duration], count)
+    has_cost = ~np.isnan(data["cost"])
+    cost_quantiles = _group_quantiles(np, data["cost"][has_cost], groups[has_cost], count)
+
+    summaries = []
+    for group in range(count):
+        totals = {"total_runs": int(runs[group])}
+        totals.update({name: values[group].item() for name, values in columns.items()})
+        totals["last_timestamp"] = from_epoch_ms(int(last_timestamps[group]))
+        totals["failure_count"] = totals["total_runs"] - totals["success_count"] - totals["throttled_count"]
+        totals["average_latency_sec"] = (totals["latency_sum"] / totals["latency_count"]
+                                         if totals["latency_count"] else 0.0)
+        for level, latency, cost in zip(LATENCY_QUANTILES, latency_quantiles, cost_quantiles):
+            totals[quantile_name("latency", level, "sec")] = latency[group]
+            totals[quantile_name("cost", level, "usd")] = cost[group]
+        summaries.append(totals)
+    return summaries
+
+
+def _latency_rows(np, data):
+    # Batch results and cache hits have no API latency (LATENCY_CONDITION in SQL)
+    return ~data["batch"] & (data["cached"] == 0)
+
+
+def _group_quantiles(np, values, groups, count):
+    """Exact nearest-rank quantiles of `values` per group (0.0 for groups without values), one list per level."""
+    quantiles = [[0.0] * count for _ in LATENCY_QUANTILES]
+    if count > 1:
+        # Group the values together; a stable sort on small integer keys is a linear radix sort
+        order = np.argsort(groups.astype(np.uint16) if count <= 1 << 16 else groups, kind="stable")
+        values = values[order]
+    sizes = np.bincount(groups, minlength=count).tolist()
+    start = 0
+    for group, size in enumerate(sizes):
+        if size:
+            ranks = [min(size - 1, int(level * size)) for level in LATENCY_QUANTILES]
+            segment = np.partition(values[start:start + size], sorted(set(ranks)))  # Linear time, no full sort
+            for level_values, rank in zip(quantiles, ranks):
+                level_values[group] = float(segment[rank])
+        start += size
+    return quantiles
@@ -0,0 +1,371 @@
+"""
+Offline stand-in for the Anthropic Messages API, for load-testing the benchmark pipeline.
+
+MockAnthropicBehavior decides what each request gets back: a latency drawn from a
+LatencyDistribution, token counts, injected 429 / 500 / 529 errors and, for streaming
+requests, the timing of every text chunk. The replies can be served two ways:
+
+- MockAnthropicTransport plugs into the SDK's httpx client in-process (no sockets), which
+  is the fastest way to push very high request rates through runner -> cost -> metrics -> storage.
+- MockAnthropicServer listens on localhost, so a runner in another process can target it
+  through `base_url`.
+
+Both speak the real wire format (JSON bodies, SSE events, error envelopes and rate-limit
+headers), so the SDK parses responses exactly as it would against the API.
+"""
+
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MESSAGES_PATH = "/v1/messages"
+
+# HTTP status -> Anthropic error type
+ERROR_TYPES = {
+    400: "invalid_request_error",
+    404: "not_found_error",
+    429: "rate_limit_error",
+    500: "api_error",
+    529: "overloaded_error",
+}
+
+
+class LatencyDistribution:
+    """A latency model in seconds. Build one with constant(), lognormal() or bimodal()."""
+
+    def __init__(self, sampler, description):
+        self._sampler = sampler
+        self.description = description
+
+    @classmethod
+    def constant(cls, seconds):
+        return cls(lambda rng: seconds, f"constant({seconds})")
+
+    @classmethod
+    def lognormal(cls, median, sigma=0.5):
+        """Right-skewed latencies around `median`; a larger sigma gives a longer tail."""
+        mu = math.log(median)
+        return cls(lambda rng: rng.lognormvariate(mu, sigma), f"lognormal(median={median}, sigma={sigma})")
+
+    @classmethod
+    def bimodal(cls, fast_median, slow_median, slow_fraction=0.1, sigma=0.25):
+        """Mostly fast requests plus a `slow_fraction` of slow ones (e.g. cold paths or long queues)."""
+        fast, slow = math.log(fast_median), math.log(slow_median)
+
+        def sample(rng):
+            return rng.lognormvariate(slow if rng.random() < slow_fraction else fast, sigma)
+        return cls(sample, f"bimodal(fast={fast_median}, slow={slow_median}, slow_fraction={slow_fraction})")
+
+    def sample(self, rng):
+        return max(0.0, self._sampler(rng))
+
+    def __repr__(self):
+        return f"LatencyDistribution.{self.description}"
+
+
+class MockReply:
+    """What the mock sends back for one request: wait `delay`, then reply with `body` or stream `events`."""
+
+    def __init__(self, status, headers, delay, body=None, events=None):
+        self.status = status
+        self.headers = headers
+        self.delay = delay
+        self.body = body
+        self.events = events  # [(seconds to wait before the event, encoded SSE event)] for streaming replies
+
+    def encoded_body(self):
+        return json.dumps(self.body).encode("utf-8")
+
+
+class MockAnthropicBehavior:
+    """
+    Configures the mock API.
+
+    `latency` is the time to the full response (or to the first chunk when streaming) and
+    `chunk_interval` the gap between streamed chunks of `tokens_per_chunk` tokens.
+    `output_tokens` is an int or an inclusive (low, high) range; `input_tokens=None` estimates
+    from the request text. `error_rates` maps a status (429, 500, 529) to the probability that
+    a request fails with it. `time_scale` multiplies every delay; 0 removes them entirely to
+    measure only the pipeline's own overhead. A `seed` makes a run reproducible.
+
+    Usage:
+        behavior = MockAnthropicBehavior(latency=LatencyDistribution.bimodal(0.4, 3.0),
+                                         error_rates={429: 0.02, 529: 0.005})
+        client = mock_async_anthropic_client(behavior)
+    """
+
+    def __init__(self, latency=None, chunk_interval=None, input_tokens=None, output_tokens=(50, 400),
+                 tokens_per_chunk=4, error_rates=None, retry_after=1, time_scale=1.0, seed=None):
+        self.latency = latency or LatencyDistribution.lognormal(median=0.8, sigma=0.5)
+        self.chunk_interval = chunk_interval or LatencyDistribution.lognormal(median=0.012, sigma=0.4)
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.tokens_per_chunk = max(1, tokens_per_chunk)
+        self.error_rates = dict(error_rates or {})
+        self.retry_after = retry_after
+        self.time_scale = time_scale
+        self.rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.status_counts = {}
+
+    def _draw_status(self):
+        roll = self.rng.random()
+        for status, rate in self.error_rates.items():
+            if roll < rate:
+                return status
+            roll -= rate
+        return 200
+
+    def _draw_output_tokens(self, max_tokens):
+        if isinstance(self.output_tokens, int):
+            tokens = self.output_tokens
+        else:
+            tokens = self.rng.randint(*self.output_tokens)
+        return max(1, min(tokens, max_tokens or tokens))
+
+    def _count(self, status):
+        with self._lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def reply(self, params, path=MESSAGES_PATH):
+        """Plan the reply to one request body (already decoded from JSON)."""
+        if path.split("?")[0] != MESSAGES_PATH:
+            self._count(404)
+            return error_reply(404, 0.0)
+
+        status = self._draw_status()
+        delay = self.latency.sample(self.rng) * self.time_scale
+        self._count(status)
+        if status != 200:
+            headers = {"retry-after": str(self.retry_after)} if status == 429 else {}
+            return error_reply(status, delay, headers)
+
+        input_tokens = self.input_tokens or estimate_prompt_tokens(params)
+        output_tokens = self._draw_output_tokens(params.get("max_tokens"))
+        message_id = f"msg_mock_{next(self._ids):012d}"
+        if not params.get("stream"):
+            body = message_body(message_id, params.get("model"), input_tokens, output_tokens)
+            return MockReply(200, {"content-type": "application/json"}, delay, body=body)
+
+        events = [(0.0, event) for event in stream_prologue(message_id, params.get("model"), input_tokens)]
+        words = response_words(output_tokens)
+        for start in range(0, output_tokens, self.tokens_per_chunk):
+            gap = 0.0 if start == 0 else self.chunk_interval.sample(self.rng) * self.time_scale
+            text = "".join(words[start:start + self.tokens_per_chunk])
+            events.append((gap, sse_event("content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}
+            })))
+        events.extend((0.0, event) for event in stream_epilogue(output_tokens))
+        return MockReply(200, {"content-type": "text/event-stream"}, delay, events=events)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.status_counts)
+
+
+def estimate_prompt_tokens(params):
+    """Roughly four characters per token over the system prompt and messages, like the runners' estimate."""
+    text = json.dumps([params.get("system"), params.get("messages")], ensure_ascii=False)
+    return max(1, len(text) // 4)
+
+
+def response_words(output_tokens):
+    return [f"tok{index % 100} " for index in range(output_tokens)]
+
+
+def message_body(message_id, model, input_tokens, output_tokens):
+    return {
+        "id": message_id,
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": [{"type": "text", "text": "".join(response_words(output_tokens))}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                  "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0},
+    }
+
+
+def error_reply(status, delay, headers=None):
+    error_type = ERROR_TYPES.get(status, "api_error")
+    body = {"type": "error", "error": {"type": error_type, "message": f"Mock {error_type} ({status})"}}
+    return MockReply(status, {"content-type": "application/json", **(headers or {})}, delay, body=body)
+
+
+def sse_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+def stream_prologue(message_id, model, input_tokens):
+    message = message_body(message_id, model, input_tokens, 1)
+    message.update(content=[], stop_reason=None)
+    return [
+        sse_event("message_start", {"type": "message_start", "message": message}),
+        sse_event("content_block_start", {"type": "content_block_start", "index": 0,
+                                          "content_block": {"type": "text", "text": ""}}),
+    ]
+
+
+def stream_epilogue(output_tokens):
+    return [
+        sse_event("content_block_stop", {"type": "content_block_stop", "index": 0}),
+        sse_event("message_delta", {"type": "message_delta",
+                                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                    "usage": {"output_tokens": output_tokens}}),
+        sse_event("message_stop", {"type": "message_stop"}),
+    ]
+
+
+class MockAnthropicTransport:
+    """
+    In-process httpx transports that answer Messages API calls from a MockAnthropicBehavior.
+
+    Usage:
+        transport = MockAnthropicTransport(behavior)
+        client = anthropic.AsyncAnthropic(api_key="mock", http_client=httpx.AsyncClient(transport=transport.async_transport()))
+    """
+
+    def __init__(self, behavior=None):
+        self.behavior = behavior or MockAnthropicBehavior()
+
+    def _plan(self, request):
+        params = json.loads(request.content or b"{}")
+        return self.behavior.reply(params, path=request.url.path)
+
+    def transport(self):
+        import httpx
+
+        def handle(request):
+            reply = self._plan(request)
+            if reply.delay:
+                time.sleep(reply.delay)
+            if reply.events is None:
+                return httpx.Response(reply.status, headers=reply.headers, content=reply.encoded_body())
+            return httpx.Response(reply.status, headers=reply.headers, content=_iter_events(reply.events))
+        return httpx.MockTransport(handle)
+
+    def async_transport(self):
+        import httpx
+
+        async def handle(request):
+            reply = self._plan(request)
+            if reply.delay:
+                await asyncio.sleep(reply.delay)
+            if reply.events is None:
+                return httpx.Response(reply.status, headers=reply.headers, content=reply.encoded_body())
+            return httpx.Response(reply.status, headers=reply.headers, content=_aiter_events(reply.events))
+        return httpx.MockTransport(handle)
+
+
+def _iter_events(events):
+    for gap, event in events:
+        if gap:
+            time.sleep(gap)
+        yield event
+
+
+async def _aiter_events(events):
+    for gap, event in events:
+        if gap:
+            await asyncio.sleep(gap)
+        yield event
+
+
+def mock_anthropic_client(behavior=None, max_retries=0):
+    """A synchronous anthropic.Anthropic client served by the in-process mock transport."""
+    import anthropic
+    import httpx
+
+    transport = MockAnthropicTransport(behavior).transport()
+    return anthropic.Anthropic(api_key="mock", max_retries=max_retries, http_client=httpx.Client(transport=transport))
+
+
+def mock_async_anthropic_client(behavior=None, max_retries=0):
+    """An anthropic.AsyncAnthropic client served by the in-process mock transport."""
+    import anthropic
+    import httpx
+
+    transport = MockAnthropicTransport(behavior).async_transport()
+    return anthropic.AsyncAnthropic(api_key="mock", max_retries=max_retries,
+                                    http_client=httpx.AsyncClient(transport=transport))
+
+
+class _MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length") or 0)
+        params = json.loads(self.rfile.read(length) or b"{}")
+        reply = self.server.behavior.reply(params, path=self.path)
+        if reply.delay:
+            time.sleep(reply.delay)
+
+        self.send_response(reply.status)
+        for name, value in reply.headers.items():
+            self.send_header(name, value)
+        if reply.events is None:
+            body = reply.encoded_body()
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # Streamed replies are delimited by closing the connection
+        self.send_header("connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for gap, event in reply.events:
+            if gap:
+                time.sleep(gap)
+            self.wfile.write(event)
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate a load test
+
+
+class MockAnthropicServer:
+    """
+    The mock API on a localhost port (0 picks a free one), for runners in other processes.
+
+    Usage:
+        with MockAnthropicServer(MockAnthropicBehavior(error_rates={429: 0.01})) as server:
+            runner = AsyncAnthropicBenchmarkRunner(api_key="mock", base_url=server.base_url)
+    """
+
+    def __init__(self, behavior=None, host="127.0.0.1", port=0):
+        self.behavior = behavior or MockAnthropicBehavior()
+        self.httpd = ThreadingHTTPServer((host, port), _MockRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.behavior = self.behavior
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-anthropic", daemon=True)
+        self._thread.start()
+        print(f"[MOCK] Mock Anthropic API listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,177 @@
+"""
+Day-partitioned Parquet archive (<root>/date=YYYY-MM-DD/part-<first id>.parquet) for prompt logs
+that have aged out of the hot SQLite store. Requires pyarrow.
+"""
+
+import os
+from datetime import date, datetime, timedelta, timezone
+
+from anthrotrace.core.prompt_log_schema import ALL_COLUMNS, EXTENDED_COLUMNS, to_epoch_ms
+
+_BASE_TYPES = {
+    "input_tokens": "INTEGER", "output_tokens": "INTEGER", "duration": "REAL", "cost": "REAL", "timestamp": "TIMESTAMP",
+}
+
+
+def archive_schema():
+    """Arrow schema of archived parts: ALL_COLUMNS plus the derived boolean success column."""
+    import pyarrow as pa
+    types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "TEXT": pa.string(), "TIMESTAMP": pa.timestamp("ms", tz="UTC")}
+    declared = dict(_BASE_TYPES, **{name: sqlite_type.split()[0] for name, sqlite_type, _ in EXTENDED_COLUMNS})
+    fields = [pa.field(name, types[declared.get(name, "TEXT")]) for name in ALL_COLUMNS]
+    return pa.schema(fields + [pa.field("success", pa.bool_())])
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
+    return start, start + timedelta(days=1) - timedelta(milliseconds=1)
+
+
+def _as_datetime(value):
+    return datetime.fromtimestamp(to_epoch_ms(value) / 1000, timezone.utc)
+
+
+class ParquetArchive:
+    """
+    Day-partitioned Parquet files of archived prompt logs under `root`.
+
+    Usage:
+        archive = ParquetArchive("data/archive")
+        archive.write_day(date(2024, 6, 1), tables, "part-000000000001")
+        table = archive.read(category="Summarization", start_time="2024-06-01T00:00:00")
+    """
+
+    def __init__(self, root="data/archive"):
+        self.root = root
+
+    def partition_path(self, day):
+        return os.path.join(self.root, f"date={day.isoformat()}")
+
+    def partitions(self):
+        """Archived UTC dates, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(date.fromisoformat(name[len("date="):]) for name in os.listdir(self.root)
+                      if name.startswith("date="))
+
+    def write_day(self, day, tables, name):
+        """
+        Write Arrow tables (archive_schema, in timestamp order) as the part `name` of a day's
+        partition. Returns (path, rows written).
+        """
+        import pyarrow.parquet as pq
+        directory = self.partition_path(day)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.parquet")
+        temporary = path + ".tmp"
+        rows = 0
+        with pq.ParquetWriter(temporary, archive_schema(), compression="zstd", write_statistics=True) as writer:
+            for table in tables:
+                if table.num_rows:
+                    writer.write_table(table.sort_by("timestamp"), row_group_size=100_000)
+                    rows += table.num_rows
+        if pq.ParquetFile(temporary).metadata.num_rows != rows:
+            os.unlink(temporary)
+            raise IOError(f"Archived part {path} is incomplete")
+        os.replace(temporary, path)  # Readers never see a partially written part
+        return path, rows
+
+    def files(self, start_time=None, end_time=None):
+        """Part files of every partition that overlaps [start_time, end_time]."""
+        start_day = _as_datetime(start_time).date() if start_time is not None else None
+        end_day = _as_datetime(end_time).date() if end_time is not None else None
+        paths = []
+        for day in self.partitions():
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            directory = self.partition_path(day)
+            paths += [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".parquet")]
+        return paths
+
+    def read(self, category=None, model=None, start_time=None, end_time=None, columns=None):
+        """Archived rows matching the filters as an Arrow table (columns from archive_schema)."""
+        import pyarrow.dataset as ds
+        schema = archive_schema()
+        columns = list(columns) if columns is not None else list(ALL_COLUMNS)
+        unknown = [column for column in columns if column not in schema.names]
+        if unknown:
+            raise ValueError(f"Unknown archive columns: {', '.join(unknown)}")
+        paths = self.files(start_time, end_time)
+        if not paths:
+            return schema.empty_table().select(columns)
+
+        conditions = []
+        if category:
+            conditions.append(ds.field("category") == category)
+        if model:
+            conditions.append(ds.field("model") == model)
+        if start_time is not None:
+            conditions.append(ds.field("timestamp") >= _as_datetime(start_time))
+        if end_time is not None:
+            conditions.append(ds.field("timestamp") <= _as_datetime(end_time))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return ds.dataset(paths, schema=schema, format="parquet").to_table(columns=columns, filter=expression)
+
+    def read_days(self, category=None, model=None, start_time=None, end_time=None, columns=None):
+        """read() one partition at a time, newest day first, each table sorted newest row first."""
+        for day in reversed(self.partitions()):
+            day_start, day_end = _day_bounds(day)
+            if (start_time is not None and day_end < _as_datetime(start_time)) or \
+                    (end_time is not None and day_start > _as_datetime(end_time)):
+                continue
+            start = max(day_start, _as_datetime(start_time)) if start_time is not None else day_start
+            end = min(day_end, _as_datetime(end_time)) if end_time is not None else day_end
+            table = self.read(category, model, start, end, columns=["timestamp"] + [
+                column for column in (columns if columns is not None else ALL_COLUMNS) if column != "timestamp"])
+            table = table.sort_by([("timestamp", "descending")])
+            yield table.select(list(columns) if columns is not None else list(ALL_COLUMNS))
+
+    def column_names(self):
+        return archive_schema().names
+
+
+def _hourly_tables(repository, day, max_id):
+    """A day's rows with id <= max_id as archive_schema tables, one per hour, in timestamp order."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    schema = archive_schema()
+    day_start, _ = _day_bounds(day)
+    for hour in range(24):
+        start = day_start + timedelta(hours=hour)
+        table = repository.fetch_logs_arrow(start_time=start, end_time=start + timedelta(hours=1, milliseconds=-1),
+                                            columns=["id"] + schema.names)
+        table = table.filter(pc.less_equal(table.column("id"), max_id))
+        yield pa.Table.from_arrays([table.column(field.name).cast(field.type) for field in schema], schema=schema)
+
+
+def archive_closed_partitions(repository, archive, retain_days=30, now=None, vacuum=True):
+    """
+    Move every UTC day older than `retain_days` from a SQLiteRepository into `archive`: export
+    the day's rows to Parquet, check the part, then delete exactly the exported rows from the
+    hot store. VACUUMs once at the end if anything moved. Returns {date: rows archived}.
+
+    A part is named after the smallest id it holds. Ids only grow, so a pass retried after a crash
+    rewrites the same part, while rows that reach an archived day later go into a new one.
+    """
+    now = _as_datetime(now) if now is not None else datetime.now(timezone.utc)
+    cutoff = datetime.combine(now.date() - timedelta(days=retain_days), datetime.min.time(), tzinfo=timezone.utc)
+    repository.flush()
+
+    archived = {}
+    for day in repository.log_days(end_time=cutoff):
+        start, end = _day_bounds(day)
+        # Rows written to this day while it is being archived have larger ids and wait for the next pass
+        ids = repository.fetch_logs_df(start_time=start, end_time=end, columns=["id"])["id"]
+        if ids.empty:
+            continue
+        min_id, max_id = int(ids.min()), int(ids.max())
+        _, rows = archive.write_day(day, _hourly_tables(repository, day, max_id), f"part-{min_id:012d}")
+        if rows != len(ids):
+            raise IOError(f"Archived {rows} of {len(ids)} rows for {day}; the hot store was left untouched")
+        archived[day] = repository.delete_logs(start_time=start, end_time=end, max_id=max_id)
+
+    if archived and vacuum:
+        repository.vacuum()
+    return archived
@@ -0,0 +1,303 @@
+"""
+Prompt log storage split into one SQLite database file per UTC day or ISO week.
+
+    <directory>/catalog.db                    partition bounds and run checkpoints
+    <directory>/prompt_logs_2024-06-15.db     partition="day"
+    <directory>/prompt_logs_2024-W24.db       partition="week"
+
+Each partition is an ordinary SQLiteRepository with its own writer, so writes to different
+partitions never wait on each other, and retention is a file delete (drop_partition).
+
+The catalog records a [min_timestamp, max_timestamp] range per partition that covers every
+row in it. It is widened before rows are written and rounded out to whole minutes, so live
+appends update it at most once a minute per partition. Reads prune the partitions whose
+range misses the time filter. The remaining partitions are queried in parallel worker
+threads, each through its own connection. Partitions cover disjoint time ranges, so their
+results merge without sorting: totals add up, and rows are concatenated newest partition
+first. Row ids are per partition.
+"""
+
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from anthrotrace.core.prompt_log_schema import to_epoch_ms
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.tiered_repository import combine_totals
+
+PARTITION_SCHEMES = ("day", "week")
+CATALOG_FILE = "catalog.db"
+PARTITION_PREFIX = "prompt_logs_"
+_DAY_MS = 24 * 3600 * 1000
+_MINUTE_MS = 60 * 1000
+_EPOCH = date(1970, 1, 1)
+
+UPSERT_PARTITION_SQL = """
+INSERT INTO partitions (name, min_timestamp, max_timestamp) VALUES (?, ?, ?)
+ON CONFLICT(name) DO UPDATE SET
+    min_timestamp = MIN(min_timestamp, excluded.min_timestamp),
+    max_timestamp = MAX(max_timestamp, excluded.max_timestamp)
+"""
+
+
+class PartitionedSQLiteRepository:
+    """
+    Drop-in replacement for SQLiteRepository (e.g. behind RepositoryAdapter or as a runner
+    repository). Writer options (write_behind, flush_rows, ..., text_storage) apply to every
+    partition.
+
+    Usage:
+        repo = PartitionedSQLiteRepository("data/prompt_logs", partition="day", write_behind=True)
+        repo.insert_results(results)
+        repo.aggregate_summary(start_time="2024-06-01T00:00:00")  # scans June's partitions in parallel
+        repo.drop_partitions(before="2024-05-01T00:00:00")
+    """
+
+    def __init__(self, directory="data/prompt_logs", partition="day", max_workers=None, **sqlite_options):
+        if partition not in PARTITION_SCHEMES:
+            raise ValueError(f"Unknown partition scheme {partition!r}; expected one of {', '.join(PARTITION_SCHEMES)}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.partition = partition
+        self.sqlite_options = sqlite_options
+        self._lock = threading.Lock()
+        self._writers = {}
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="anthrotrace-partition")
+        # Checkpoints live in the catalog database; its prompt_logs table stays empty
+        self.catalog = SQLiteRepository(os.path.join(directory, CATALOG_FILE))
+        self.catalog.conn.execute("""
+        CREATE TABLE IF NOT EXISTS partitions (
+            name TEXT PRIMARY KEY,
+            min_timestamp INTEGER NOT NULL,
+            max_timestamp INTEGER NOT NULL
+        )
+        """)
+        self.catalog.conn.commit()
+        self._bounds = {name: (low, high) for name, low, high in
+                        self.catalog.conn.execute("SELECT name, min_timestamp, max_timestamp FROM partitions")}
+        self._reconcile_catalog()
+
+    def partition_path(self, name):
+        return os.path.join(self.directory, f"{PARTITION_PREFIX}{name}.db")
+
+    def _partition_name(self, day):
+        """Partition of the UTC day `day` (days since the epoch)."""
+        if self.partition == "day":
+            return (_EPOCH + timedelta(days=day)).isoformat()
+        year, week, _ = (_EPOCH + timedelta(days=day)).isocalendar()
+        return f"{year}-W{week:02d}"
+
+    def _reconcile_catalog(self):
+        """Add partition files the catalog does not list (e.g. copied in) and forget entries whose file is gone."""
+        on_disk = {name[len(PARTITION_PREFIX):-len(".db")] for name in os.listdir(self.directory)
+                   if name.startswith(PARTITION_PREFIX) and name.endswith(".db")}
+        for name in set(self._bounds) - on_disk:
+            self._forget(name)
+        for name in sorted(on_disk - set(self._bounds)):
+            reader = SQLiteRepository(self.partition_path(name), migrate=False)
+            try:
+                low, high = reader.conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM prompt_logs").fetchone()
+            except sqlite3.Error as e:
+                print(f"[SQLite] Skipping unreadable partition {name}: {e}")
+                continue
+            finally:
+                reader.close()
+            if low is not None:
+                self._widen({name: (low, high)})
+
+    def _widen(self, ranges):
+        """Grow the catalog ranges to cover {name: (min_ms, max_ms)} before the rows are written."""
+        with self._lock:
+            updates = []
+            for name, (low, high) in ranges.items():
+                known = self._bounds.get(name)
+                if known and known[0] <= low and high <= known[1]:
+                    continue
+                low = low - low % _MINUTE_MS
+                high = high - high % _MINUTE_MS + _MINUTE_MS - 1
+                if known:
+                    low, high = min(low, known[0]), max(high, known[1])
+                updates.append((name, low, high))
+                self._bounds[name] = (low, high)
+            if updates:
+                self.catalog.conn.executemany(UPSERT_PARTITION_SQL, updates)
+                self.catalog.conn.commit()
+
+    def _forget(self, name):
+        with self._lock:
+            self._bounds.pop(name, None)
+            self.catalog.conn.execute("DELETE FROM partitions WHERE name = ?", (name,))
+            self.catalog.conn.commit()
+
+    def _writer(self, name):
+        with self._lock:
+            if name not in self._writers:
+                self._writers[name] = SQLiteRepository(self.partition_path(name), **self.sqlite_options)
+            return self._writers[name]
+
+    def partitions(self, start_time=None, end_time=None):
+        """{name: (min_timestamp, max_timestamp)} of the partitions that may hold rows in the window."""
+        start_ms = to_epoch_ms(start_time) if start_time is not None else None
+        end_ms = to_epoch_ms(end_time) if end_time is not None else None
+        with self._lock:
+            return {name: bounds for name, bounds in sorted(self._bounds.items())
+                    if (start_ms is None or bounds[1] >= start_ms) and (end_ms is None or bounds[0] <= end_ms)}
+
+    def insert_log(self, category, model, prompt_text, response, input_tokens, output_tokens, duration, cost=0.0,
+                   timestamp=None):
+        self.insert_result({
+            "category": category, "model": model, "prompt_text": prompt_text, "response": response,
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "duration": duration, "cost": cost,
+            "timestamp": timestamp
+        })
+
+    def insert_result(self, result):
+        self.insert_results([result])
+
+    def insert_results(self, results):
+        """Route each result to the partition of its timestamp; one executemany per partition."""
+        by_partition, ranges, names = {}, {}, {}
+        for result in results:
+            epoch_ms = to_epoch_ms(result.get("timestamp"))
+            if result.get("timestamp") is None:
+                result = dict(result, timestamp=epoch_ms)  # Pin "now" so the row lands in the partition chosen here
+            day = epoch_ms // _DAY_MS
+            if day not in names:
+                names[day] = self._partition_name(day)
+            name = names[day]
+            by_partition.setdefault(name, []).append(result)
+            low, high = ranges.get(name, (epoch_ms, epoch_ms))
+            ranges[name] = (min(low, epoch_ms), max(high, epoch_ms))
+        # Create new partition files before the catalog lists them, so readers never open a missing one
+        writers = {name: self._writer(name) for name in by_partition}
+        self._widen(ranges)
+        for name, rows in by_partition.items():
+            writers[name].insert_results(rows)
+
+    def record_checkpoints(self, run_id, rows):
+        """Upsert checkpoint rows in the catalog, after the results written so far are committed."""
+        self.flush()
+        with self._lock:
+            self.catalog.record_checkpoints(run_id, rows)
+
+    def fetch_checkpoints(self, run_id):
+        with self._lock:
+            return self.catalog.fetch_checkpoints(run_id)
+
+    def flush(self):
+        with self._lock:
+            writers = list(self._writers.values())
+        for writer in writers:
+            writer.flush()
+
+    def fold_summary_index(self):
+        """Fold every partition's unfolded rows into its summary index through its writer; returns how many."""
+        return sum(self._writer(name).fold_summary_index() for name in self.partitions())
+
+    def close(self):
+        with self._lock:
+            writers, self._writers = list(self._writers.values()), {}
+        for writer in writers:
+            writer.close()
+        self._executor.shutdown()
+        self.catalog.close()
+
+    def drop_partition(self, name):
+        """Delete a partition: close its writer, remove it from the catalog and delete its files."""
+        with self._lock:
+            writer = self._writers.pop(name, None)
+        if writer is not None:
+            writer.close()
+        self._forget(name)
+        path = self.partition_path(name)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        print(f"[SQLite] Dropped partition {name}")
+
+    def drop_partitions(self, before):
+        """Drop every partition whose rows are all older than `before`; returns their names."""
+        before_ms = to_epoch_ms(before)
+        names = [name for name, (_, high) in self.partitions().items() if high < before_ms]
+        for name in names:
+            self.drop_partition(name)
+        return names
+
+    def _read(self, name, method, *args, **kwargs):
+        """Run a SQLiteRepository read method on one partition through a connection of its own."""
+        reader = SQLiteRepository(self.partition_path(name), migrate=False)
+        try:
+            return getattr(reader, method)(*args, **kwargs)
+        finally:
+            reader.close()
+
+    def _fan_out(self, method, start_time=None, end_time=None, **kwargs):
+        """Results of `method` on every partition in the window, newest partition first, queried in parallel."""
+        names = sorted(self.partitions(start_time, end_time), reverse=True)
+        kwargs.update(start_time=start_time, end_time=end_time)
+        return list(self._executor.map(lambda name: self._read(name, method, **kwargs), names))
+
+    def _fan_out_until(self, method, rows_needed, start_time=None, end_time=None, **kwargs):
+        """
+        Like _fan_out, but query the partitions newest first in waves of one per worker, and stop
+        once the results hold `rows_needed` rows: the newest rows live in the newest partitions.
+        """
+        names = sorted(self.partitions(start_time, end_time), reverse=True)
+        kwargs.update(start_time=start_time, end_time=end_time)
+        results, rows = [], 0
+        for start in range(0, len(names), self.max_workers):
+            for result in self._executor.map(lambda name: self._read(name, method, **kwargs),
+                                             names[start:start + self.max_workers]):
+                results.append(result)
+                rows += len(result)
+            if rows >= rows_needed:
+                break
+        return results
+
+    def aggregate_summary(self, category=None, model=None, start_time=None, end_time=None):
+        """
+        Counts and totals over every partition in the window (None if nothing matches). The
+        readers only query; each partition's writer keeps its summary index folded.
+        """
+        return combine_totals(*self._fan_out("aggregate_summary", category=category, model=model,
+                                             start_time=start_time, end_time=end_time))
+
+    def fetch_logs(self, category=None, model=None, start_time=None, end_time=None, limit=100):
+        chunks = self._fan_out_until("fetch_logs", limit, category=category, model=model, start_time=start_time,
+                                     end_time=end_time, limit=limit)
+        return [log for chunk in chunks for log in chunk][:limit]
+
+    def iter_logs(self, category=None, model=None, start_time=None, end_time=None, batch_size=1000, columns=None):
+        """Yield every log matching the filters, newest first, one partition after another."""
+        for name in sorted(self.partitions(start_time, end_time), reverse=True):
+            reader = SQLiteRepository(self.partition_path(name), migrate=False)
+            try:
+                yield from reader.iter_logs(category, model, start_time, end_time, batch_size=batch_size,
+                                            columns=columns)
+            finally:
+                reader.close()
+
+    def fetch_logs_df(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        """SQLiteRepository.fetch_logs_df over the partitions in the window, read in parallel."""
+        import pandas as pd
+        filters = {"category": category, "model": model, "start_time": start_time, "end_time": end_time}
+        if limit:
+            frames = self._fan_out_until("fetch_logs_df", limit, columns=columns, limit=limit, **filters)
+        else:
+            frames = self._fan_out("fetch_logs_df", columns=columns, **filters)
+        if not frames:
+            return self.catalog.fetch_logs_df(columns=columns)  # The catalog's empty table gives the dtypes
+        frame = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        return frame.head(limit) if limit else frame
+
+    def fetch_logs_arrow(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        """fetch_logs_df as a pyarrow Table."""
+        import pyarrow as pa
+        frame = self.fetch_logs_df(category, model, start_time, end_time, columns=columns, limit=limit)
+        return pa.Table.from_pandas(frame, preserve_index=False)
+
+    def get_all_logs(self):
+        return self.fetch_logs(limit=100)
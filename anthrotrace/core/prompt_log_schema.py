@@ -0,0 +1,99 @@
+"""
+Column layout of the prompt_logs table shared by the runners and repositories.
+
+The original nine columns are created by each repository's CREATE TABLE statement.
+Columns added later are listed in EXTENDED_COLUMNS with their SQLite and ClickHouse
+types so every writer stays in sync. ClickHouse tables are upgraded in place with
+ensure_clickhouse_columns; SQLite databases through sqlite_migrations.
+"""
+
+from datetime import datetime, timezone
+
+BASE_COLUMNS = [
+    "category", "model", "prompt_text", "response", "input_tokens",
+    "output_tokens", "duration", "cost", "timestamp"
+]
+
+# (name, SQLite type, ClickHouse type)
+EXTENDED_COLUMNS = [
+    # 'success', 'failure' or 'throttled' (rate limited after all retries were spent)
+    ("status", "TEXT", "LowCardinality(String) DEFAULT ''"),
+    # 'standard', 'stream' or 'batch'; batch rows have no meaningful per-request latency
+    ("execution_mode", "TEXT", "LowCardinality(String) DEFAULT ''"),
+    # Run manifest: the run a row belongs to and the stable hash of (category, prompt_text, model)
+    ("run_id", "TEXT", "String DEFAULT ''"),
+    ("prompt_id", "TEXT", "String DEFAULT ''"),
+    # 1 when the response was served from the ResponseCache instead of the API
+    ("cached", "INTEGER DEFAULT 0", "UInt8 DEFAULT 0"),
+    # Prompt-caching usage: tokens written to and read from the prompt cache (not part of input_tokens)
+    ("cache_creation_input_tokens", "INTEGER DEFAULT 0", "UInt32 DEFAULT 0"),
+    ("cache_read_input_tokens", "INTEGER DEFAULT 0", "UInt32 DEFAULT 0"),
+    # Streaming mode only: seconds to the first text chunk, generation speed and inter-chunk gaps
+    ("time_to_first_token", "REAL", "Nullable(Float64)"),
+    ("output_tokens_per_sec", "REAL", "Nullable(Float64)"),
+    ("inter_token_latency_p50", "REAL", "Nullable(Float64)"),
+    ("inter_token_latency_p95", "REAL", "Nullable(Float64)"),
+    ("inter_token_latency_max", "REAL", "Nullable(Float64)"),
+]
+
+ALL_COLUMNS = BASE_COLUMNS + [name for name, _, _ in EXTENDED_COLUMNS]
+
+# Rows with a real API round trip; batch results and cache hits carry no meaningful latency.
+# Valid in both SQLite and ClickHouse, where the columns may be NULL or default respectively.
+LATENCY_CONDITION = "COALESCE(execution_mode, '') != 'batch' AND COALESCE(cached, 0) = 0"
+
+# Free-text columns that dominate row size; projections that only need numbers should skip them
+TEXT_COLUMNS = ["prompt_text", "response"]
+
+
+def result_row(result, columns=ALL_COLUMNS):
+    """Return the values of a runner result dict in column order; missing optional fields become None."""
+    return tuple(result.get(column) for column in columns)
+
+
+def projected_columns(columns=None, available=ALL_COLUMNS):
+    """
+    Validate a column projection before it is interpolated into SQL. None selects ALL_COLUMNS;
+    `available` lists what may be asked for (e.g. ALL_COLUMNS plus a repository's id column).
+    """
+    if columns is None:
+        return list(ALL_COLUMNS)
+    unknown = [column for column in columns if column not in available]
+    if unknown:
+        raise ValueError(f"Unknown prompt_logs columns: {', '.join(unknown)}")
+    return list(columns)
+
+
+def to_epoch_ms(value):
+    """
+    Normalize a timestamp to integer milliseconds since the epoch (UTC), the storage format of
+    prompt_logs.timestamp in SQLite. Accepts ISO 8601 strings (naive ones are UTC), datetimes,
+    integer epoch milliseconds and None (now).
+    """
+    if value is None:
+        return int(datetime.now(timezone.utc).timestamp() * 1000)
+    if isinstance(value, bool):
+        raise ValueError(f"Not a timestamp: {value!r}")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lstrip("-").isdigit():
+            return int(text)
+        value = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(round(value.timestamp() * 1000))
+
+
+def from_epoch_ms(value):
+    """Render stored epoch milliseconds as an ISO 8601 UTC string, the format runners produce."""
+    if value is None or isinstance(value, str):
+        return value
+    return datetime.fromtimestamp(value / 1000, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def ensure_clickhouse_columns(client, table="prompt_logs"):
+    """Add any EXTENDED_COLUMNS missing from an existing ClickHouse table."""
+    for name, _, clickhouse_type in EXTENDED_COLUMNS:
+        client.command(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} {clickhouse_type}")
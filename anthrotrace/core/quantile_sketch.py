@@ -0,0 +1,224 @@
+"""
+Mergeable quantile sketches (DDSketch) for latency and cost: quantiles within a relative accuracy
+of the true value, and sketches of disjoint row sets merge exactly by adding bin counts.
+"""
+
+import math
+import struct
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Quantile levels every repository reports in its summaries
+LATENCY_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+# Values at or below this (e.g. zero-cost cache hits) are counted in the zero bin
+MIN_INDEXABLE_VALUE = 1e-9
+
+_HEADER = struct.Struct("<dQI")  # relative accuracy, zero count, number of bins
+
+# merge_serialized() counts bins with NumPy (when installed) from this many stored bins on
+VECTORIZED_MERGE_MIN_BINS = 10_000
+
+
+class QuantileSketch:
+    """
+    Usage:
+        sketch = QuantileSketch()
+        sketch.add_many(durations)
+        sketch.merge(QuantileSketch.from_bytes(stored))
+        sketch.quantile(0.99)
+    """
+
+    __slots__ = ("relative_accuracy", "bins", "zero_count", "count", "_multiplier", "_gamma")
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._multiplier = 1 / math.log(self._gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        if value is None or value != value:  # NULL or NaN
+            return
+        if value <= MIN_INDEXABLE_VALUE:
+            self.zero_count += count
+        else:
+            key = math.ceil(math.log(value) * self._multiplier)
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+
+    def add_many(self, values):
+        """add() for every value; NumPy arrays and pandas Series are binned vectorized."""
+        if hasattr(values, "dtype"):
+            self._add_array(values)
+            return
+        bins = self.bins
+        multiplier = self._multiplier
+        for value in values:
+            if value is None or value != value:
+                continue
+            if value <= MIN_INDEXABLE_VALUE:
+                self.zero_count += 1
+            else:
+                key = math.ceil(math.log(value) * multiplier)
+                bins[key] = bins.get(key, 0) + 1
+            self.count += 1
+
+    def _add_array(self, values):
+        import numpy as np
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        positive = values[values > MIN_INDEXABLE_VALUE]
+        self.zero_count += len(values) - len(positive)
+        self.count += len(values)
+        if not len(positive):
+            return
+        keys = np.ceil(np.log(positive) * self._multiplier).astype(np.int64)
+        # Keys span a few hundred values, so counting them is linear (no sort)
+        lowest = int(keys.min())
+        counts = np.bincount(keys - lowest)
+        bins = self.bins
+        for offset in np.flatnonzero(counts).tolist():
+            bins[lowest + offset] = bins.get(lowest + offset, 0) + int(counts[offset])
+
+    def merge(self, other):
+        """Add another sketch's counts to this one (in place); returns self."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        bins = self.bins
+        for key, count in other.bins.items():
+            bins[key] = bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantile(self, level):
+        """Value at quantile `level` (0..1), None for an empty sketch."""
+        return self.quantiles([level])[0]
+
+    def quantiles(self, levels):
+        """quantile() for several levels with one pass over the bins."""
+        if not self.count:
+            return [None] * len(levels)
+        # Nearest rank, as the in-memory repository computes exact quantiles
+        ranks = sorted((min(self.count - 1, int(level * self.count)), index) for index, level in enumerate(levels))
+        values = [None] * len(levels)
+        keys = sorted(self.bins)
+        position = 0
+        seen = self.zero_count  # Values in the bins before keys[position]
+        for rank, index in ranks:
+            if rank < self.zero_count:
+                values[index] = 0.0
+                continue
+            while seen <= rank:
+                seen += self.bins[keys[position]]
+                position += 1
+            values[index] = self._value(keys[position - 1])
+        return values
+
+    def _value(self, key):
+        # The bin covers (gamma^(key-1), gamma^key]; this point is within the relative accuracy of both ends
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def __eq__(self, other):
+        if not isinstance(other, QuantileSketch):
+            return NotImplemented
+        return (self.relative_accuracy == other.relative_accuracy and self.zero_count == other.zero_count
+                and self.bins == other.bins)
+
+    def __repr__(self):
+        return f"QuantileSketch(count={self.count}, bins={len(self.bins)})"
+
+    def to_bytes(self):
+        keys = sorted(self.bins)
+        return (_HEADER.pack(self.relative_accuracy, self.zero_count, len(keys))
+                + struct.pack(f"<{len(keys)}i{len(keys)}Q", *keys, *(self.bins[key] for key in keys)))
+
+    @classmethod
+    def from_bytes(cls, data):
+        relative_accuracy, zero_count, size = _HEADER.unpack_from(data)
+        values = struct.unpack_from(f"<{size}i{size}Q", data, _HEADER.size)
+        sketch = cls(relative_accuracy)
+        sketch.bins = dict(zip(values[:size], values[size:]))
+        sketch.zero_count = zero_count
+        sketch.count = zero_count + sum(values[size:])
+        return sketch
+
+
+def merge_sketches(sketches):
+    """One new sketch with the counts of every non-None sketch; None if there are none."""
+    merged = None
+    for sketch in sketches:
+        if sketch is None:
+            continue
+        if merged is None:
+            merged = QuantileSketch(sketch.relative_accuracy)
+        merged.merge(sketch)
+    return merged
+
+
+def merge_serialized(blobs):
+    """
+    merge_sketches() over to_bytes() outputs (None entries are skipped) without building a
+    QuantileSketch per blob; for summaries that combine thousands of stored sketches.
+    """
+    key_blocks, count_blocks = [], []
+    zero_count = 0
+    relative_accuracy = None
+    for data in blobs:
+        if not data:
+            continue
+        accuracy, zeros, size = _HEADER.unpack_from(data)
+        if relative_accuracy is None:
+            relative_accuracy = accuracy
+        elif accuracy != relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        counts_start = _HEADER.size + 4 * size
+        key_blocks.append(data[_HEADER.size:counts_start])
+        count_blocks.append(data[counts_start:counts_start + 8 * size])
+        zero_count += zeros
+    if relative_accuracy is None:
+        return None
+    merged = QuantileSketch(relative_accuracy)
+    keys, counts = b"".join(key_blocks), b"".join(count_blocks)
+    np = None
+    if len(keys) // 4 >= VECTORIZED_MERGE_MIN_BINS:
+        try:
+            import numpy as np
+        except ImportError:
+            pass
+    if np is None:
+        bins = merged.bins
+        for key, count in zip(struct.unpack(f"<{len(keys) // 4}i", keys), struct.unpack(f"<{len(counts) // 8}Q", counts)):
+            bins[key] = bins.get(key, 0) + count
+    else:
+        keys = np.frombuffer(keys, dtype="<i4")
+        lowest = int(keys.min())
+        totals = np.bincount(keys - lowest, weights=np.frombuffer(counts, dtype="<u8"))
+        occupied = np.flatnonzero(totals)
+        merged.bins = dict(zip((occupied + lowest).tolist(), totals[occupied].astype(np.int64).tolist()))
+    merged.zero_count = zero_count
+    merged.count = zero_count + sum(merged.bins.values())
+    return merged
+
+
+def quantile_name(prefix, level, unit):
+    """Summary key of a quantile, e.g. latency_p99_sec or cost_p50_usd."""
+    return f"{prefix}_p{int(round(level * 100))}_{unit}"
+
+
+def add_sketch_quantiles(totals):
+    """
+    Set latency_pXX_sec and cost_pXX_usd on an aggregate_summary dict from its latency_sketch
+    and cost_sketch entries (0.0 where a sketch is empty), for every level in LATENCY_QUANTILES.
+    """
+    for prefix, unit in (("latency", "sec"), ("cost", "usd")):
+        sketch = totals.get(f"{prefix}_sketch")
+        values = sketch.quantiles(LATENCY_QUANTILES) if sketch is not None else [None] * len(LATENCY_QUANTILES)
+        for level, value in zip(LATENCY_QUANTILES, values):
+            totals[quantile_name(prefix, level, unit)] = value if value is not None else 0.0
+    return totals
@@ -0,0 +1,306 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+# 429 = rate limited, 529 = API overloaded
+THROTTLE_STATUS_CODES = {429, 529}
+
+RATE_LIMIT_HEADER_PREFIX = "anthropic-ratelimit-"
+
+
+class RateLimitExhausted(Exception):
+    """Raised when a request is still being throttled after every retry has been spent."""
+
+    def __init__(self, attempts, last_error):
+        super().__init__(f"Still throttled after {attempts} attempts: {last_error}")
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+def is_throttle_error(exc):
+    """True for rate-limit (429) and overloaded (529) API errors, which are not real failures."""
+    if getattr(exc, "status_code", None) in THROTTLE_STATUS_CODES:
+        return True
+    body = getattr(exc, "body", None)
+    if isinstance(body, dict):
+        error_type = (body.get("error") or {}).get("type")
+        return error_type in ("rate_limit_error", "overloaded_error")
+    return False
+
+
+def _error_headers(exc):
+    response = getattr(exc, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def _parse_reset(value):
+    """Seconds until an RFC 3339 reset timestamp, or None if it cannot be parsed."""
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if reset_at.tzinfo is None:
+        reset_at = reset_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` units per minute.
+
+    Callers `acquire` an estimate before sending a request and `adjust` once the real
+    amount is known, so the balance may dip below zero after an underestimate.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = None
+        self._thread_lock = threading.Lock()
+
+    @property
+    def lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    async def acquire(self, amount=1):
+        # Requests larger than the whole bucket wait for a full bucket instead of forever
+        amount = min(float(amount), self.capacity)
+        async with self.lock:
+            while True:
+                now = self._refill()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def acquire_blocking(self, amount=1):
+        """acquire() for synchronous callers: waits block the calling thread."""
+        amount = min(float(amount), self.capacity)
+        with self._thread_lock:
+            while True:
+                now = self._refill()
+                if now < self._blocked_until:
+                    time.sleep(self._blocked_until - now)
+                    continue
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                time.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta):
+        """Debit (positive) or refund (negative) tokens after the fact."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def observe(self, limit=None, remaining=None, reset_in=None):
+        """Reconcile the local balance with the server's view from the rate-limit headers."""
+        self._refill()
+        if limit:
+            self.rate = limit / 60.0
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0 and reset_in:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + reset_in)
+
+
+class AIMDConcurrencyLimiter:
+    """
+    Additive-increase / multiplicative-decrease limit on requests in flight.
+
+    Every successful response grows the limit by `additive_increase / limit` (about one
+    slot per window of `limit` successes); a throttled response shrinks it by
+    `multiplicative_decrease`, at most once per `cooldown` seconds so that a single burst
+    of 429s only counts as one congestion signal.
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=256, additive_increase=1.0,
+                 multiplicative_decrease=0.5, cooldown=1.0):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = None
+
+    @property
+    def condition(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < max(self.min_limit, int(self.limit)))
+            self.in_flight += 1
+
+    async def release(self, throttled=False):
+        async with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.multiplicative_decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + self.additive_increase / self.limit)
+            self.condition.notify_all()
+
+
+class RateGovernor:
+    """
+    Paces requests to an API tier: token buckets for requests, input tokens and output
+    tokens per minute in front of an AIMD concurrency limit, with jittered exponential
+    backoff on 429/529 responses.
+
+    Bucket sizes left as None are learned from the `anthropic-ratelimit-*` response
+    headers. Throttle events are counted in `throttle_events` (and exported as
+    `anthropic_throttle_events_total` when a metrics exporter is given) rather than
+    surfacing as failures; only a request still throttled after `max_retries` raises
+    RateLimitExhausted.
+    """
+
+    def __init__(self, requests_per_minute=None, input_tokens_per_minute=None, output_tokens_per_minute=None,
+                 initial_concurrency=8, max_concurrency=256, max_retries=6, base_backoff=0.5, max_backoff=30.0,
+                 metrics_exporter=None):
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute) if requests_per_minute else None,
+            "input-tokens": TokenBucket(input_tokens_per_minute) if input_tokens_per_minute else None,
+            "output-tokens": TokenBucket(output_tokens_per_minute) if output_tokens_per_minute else None,
+        }
+        self.limiter = AIMDConcurrencyLimiter(initial_limit=initial_concurrency, max_limit=max_concurrency)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics_exporter
+        self.throttle_events = 0
+        self.retries = 0
+
+    async def execute(self, send, estimated_input_tokens=0, max_output_tokens=0, labels=None):
+        """
+        Await `send()` under the governor and return its result. `send` is retried on
+        throttling, so it must build a fresh request coroutine on every call.
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            await self._acquire_budget(estimated_input_tokens, max_output_tokens)
+            await self.limiter.acquire()
+            try:
+                response = await send()
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                await self.limiter.release(throttled=throttled)
+                if not throttled:
+                    raise
+                last_error = e
+                retry_after = self.observe_headers(_error_headers(e))
+                self._record_throttle(labels)
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    await asyncio.sleep(self.backoff(attempt, retry_after))
+                continue
+
+            await self.limiter.release()
+            self.observe_headers(getattr(response, "headers", None) or {})
+            return response
+
+        raise RateLimitExhausted(self.max_retries + 1, last_error)
+
+    def execute_blocking(self, send, estimated_input_tokens=0, max_output_tokens=0, labels=None):
+        """
+        execute() for synchronous callers such as AnthropicBenchmarkWithSQLite. A blocking
+        caller has one request in flight, so only the token buckets and backoff apply.
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self._acquire_budget_blocking(estimated_input_tokens, max_output_tokens)
+            try:
+                response = send()
+            except Exception as e:
+                if not is_throttle_error(e):
+                    raise
+                last_error = e
+                retry_after = self.observe_headers(_error_headers(e))
+                self._record_throttle(labels)
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    time.sleep(self.backoff(attempt, retry_after))
+                continue
+
+            self.observe_headers(getattr(response, "headers", None) or {})
+            return response
+
+        raise RateLimitExhausted(self.max_retries + 1, last_error)
+
+    def record_usage(self, estimated_input_tokens, input_tokens, max_output_tokens, output_tokens):
+        """Replace the pre-request token estimates with the usage the API actually reported."""
+        if self.buckets["input-tokens"]:
+            self.buckets["input-tokens"].adjust(input_tokens - estimated_input_tokens)
+        if self.buckets["output-tokens"]:
+            self.buckets["output-tokens"].adjust(output_tokens - max_output_tokens)
+
+    def backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than the server's retry-after."""
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        return max(delay, retry_after or 0.0)
+
+    def observe_headers(self, headers):
+        """Feed `anthropic-ratelimit-*` headers into the buckets; returns retry-after seconds, if any."""
+        for dimension in ("requests", "input-tokens", "output-tokens"):
+            prefix = f"{RATE_LIMIT_HEADER_PREFIX}{dimension}-"
+            limit = _parse_float(headers.get(prefix + "limit"))
+            remaining = _parse_float(headers.get(prefix + "remaining"))
+            if limit is None and remaining is None:
+                continue
+            if self.buckets[dimension] is None and limit:
+                self.buckets[dimension] = TokenBucket(limit)
+            if self.buckets[dimension] is not None:
+                self.buckets[dimension].observe(limit, remaining, _parse_reset(headers.get(prefix + "reset")))
+        return _parse_float(headers.get("retry-after"))
+
+    async def _acquire_budget(self, estimated_input_tokens, max_output_tokens):
+        if self.buckets["requests"]:
+            await self.buckets["requests"].acquire(1)
+        if self.buckets["input-tokens"] and estimated_input_tokens:
+            await self.buckets["input-tokens"].acquire(estimated_input_tokens)
+        if self.buckets["output-tokens"] and max_output_tokens:
+            await self.buckets["output-tokens"].acquire(max_output_tokens)
+
+    def _acquire_budget_blocking(self, estimated_input_tokens, max_output_tokens):
+        if self.buckets["requests"]:
+            self.buckets["requests"].acquire_blocking(1)
+        if self.buckets["input-tokens"] and estimated_input_tokens:
+            self.buckets["input-tokens"].acquire_blocking(estimated_input_tokens)
+        if self.buckets["output-tokens"] and max_output_tokens:
+            self.buckets["output-tokens"].acquire_blocking(max_output_tokens)
+
+    def _record_throttle(self, labels):
+        self.throttle_events += 1
+        if self.metrics:
+            self.metrics.emit_metric("anthropic_throttle_events_total", 1, labels or {}, metric_type="counter")
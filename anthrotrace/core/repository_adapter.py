@@ -1,16 +1,54 @@
+import inspect
+
+from anthrotrace.core.benchmark_summary_service import SUMMARY_FRAME_COLUMNS, reduce_frame, reduce_logs
+from anthrotrace.core.prompt_log_schema import to_epoch_ms
+
 class RepositoryAdapter:
     def __init__(self, prompt_log_repository):
         self.repo = prompt_log_repository
 
     def query_logs(self, category=None, model=None, start_time=None, end_time=None):
-        # This passes filters down to the repo (which should apply them correctly)
-        try:
-            return self.repo.fetch_logs(
-                category=category,
-                model=model,
-                start_time=start_time,
-                end_time=end_time
-            )
-        except AttributeError:
-            # For SQLite fallback if fetch_logs() is missing
-            return self.repo.get_all_logs()
+        filters = {"category": category, "model": model, "start_time": start_time, "end_time": end_time}
+        fetch_logs = getattr(self.repo, "fetch_logs", None)
+        if fetch_logs is not None and _accepts_filters(fetch_logs):
+            # This passes filters down to the repo (which should apply them correctly)
+            return fetch_logs(**filters)
+        # Repositories that can only return every row (e.g. MockRepository) are filtered here
+        logs = fetch_logs() if fetch_logs is not None else self.repo.get_all_logs()
+        return filter_logs(logs, **filters)
+
+    def aggregate_summary(self, category=None, model=None, start_time=None, end_time=None):
+        # Let the database aggregate when it can; otherwise reduce columns, and rows as a last resort
+        filters = {"category": category, "model": model, "start_time": start_time, "end_time": end_time}
+        if hasattr(self.repo, "aggregate_summary"):
+            return self.repo.aggregate_summary(**filters)
+        if hasattr(self.repo, "fetch_logs_df"):
+            return reduce_frame(self.repo.fetch_logs_df(columns=SUMMARY_FRAME_COLUMNS, **filters))
+        return reduce_logs(self.query_logs(**filters))
+
+
+def filter_logs(logs, category=None, model=None, start_time=None, end_time=None):
+    """The rows of `logs` that match the filters fetch_logs applies in the database."""
+    start = to_epoch_ms(start_time) if start_time is not None else None
+    end = to_epoch_ms(end_time) if end_time is not None else None
+    matching = []
+    for log in logs:
+        if (category and log.get("category") != category) or (model and log.get("model") != model):
+            continue
+        if start is not None or end is not None:
+            timestamp = log.get("timestamp")
+            if timestamp is None:
+                continue
+            timestamp = to_epoch_ms(timestamp)
+            if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                continue
+        matching.append(log)
+    return matching
+
+
+def _accepts_filters(fetch_logs):
+    try:
+        parameters = inspect.signature(fetch_logs).parameters.values()
+    except (TypeError, ValueError):
+        return True  # No signature to inspect (e.g. a builtin); assume the usual fetch_logs filters
+    return any(parameter.name == "category" or parameter.kind is parameter.VAR_KEYWORD for parameter in parameters)
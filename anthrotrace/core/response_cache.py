@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Fields of a Messages API request that determine its (deterministic) response
+CACHE_KEY_FIELDS = ("model", "system", "messages", "max_tokens", "temperature")
+
+
+class ResponseCache:
+    """
+    Disk-backed, content-addressed cache of deterministic Messages API responses.
+
+    Entries are keyed by a SHA-256 of (model, system, messages, max_tokens, temperature)
+    and stored in their own SQLite file. Entries older than `ttl_seconds` are treated as
+    misses, and once the cache holds more than `max_entries` the least recently used
+    entries are evicted. Only temperature-0 requests are cacheable.
+
+    Usage:
+        cache = ResponseCache("data/response_cache.db", ttl_seconds=7 * 86400, max_entries=100_000)
+        runner = AsyncAnthropicBenchmarkRunner(api_key, response_cache=cache)
+    """
+
+    def __init__(self, db_path="data/response_cache.db", ttl_seconds=7 * 24 * 3600, max_entries=100_000):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_table_if_not_exists()
+        self._entries = self.conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+    def _create_table_if_not_exists(self):
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_last_access ON response_cache (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def is_cacheable(params):
+        return params.get("temperature") == 0
+
+    @staticmethod
+    def make_key(params):
+        payload = {field: params.get(field) for field in CACHE_KEY_FIELDS}
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached entry as a dict, or None on a miss (including expired entries)."""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response, input_tokens, output_tokens, created_at FROM response_cache WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[3] > self.ttl_seconds):
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return {"response": row[0], "input_tokens": row[1], "output_tokens": row[2]}
+
+    def put(self, key, response, input_tokens, output_tokens):
+        if response is None:
+            return  # Never cache failures
+        now = time.time()
+        with self._lock:
+            # An overwritten key is not a new entry, so only a real insert counts towards max_entries
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO response_cache (key, response, input_tokens, output_tokens, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, response, input_tokens, output_tokens, now, now)
+            )
+            if cursor.rowcount:
+                self._entries += 1
+            else:
+                self.conn.execute(
+                    "UPDATE response_cache SET response = ?, input_tokens = ?, output_tokens = ?, "
+                    "created_at = ?, last_access = ? WHERE key = ?",
+                    (response, input_tokens, output_tokens, now, now, key)
+                )
+            if self._entries > self.max_entries:
+                self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        # Drop expired entries first, then the least recently used ones; trim 10% below the cap
+        # so eviction runs once per batch of inserts rather than on every put
+        deleted = 0
+        if self.ttl_seconds:
+            deleted += self.conn.execute(
+                "DELETE FROM response_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+        count = self.conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        target = int(self.max_entries * 0.9)
+        if count > target:
+            deleted += self.conn.execute(
+                "DELETE FROM response_cache WHERE key IN "
+                "(SELECT key FROM response_cache ORDER BY last_access ASC LIMIT ?)",
+                (count - target,)
+            ).rowcount
+        self.evictions += deleted
+        self._entries = self.conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self._entries,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def lookup(self, params, metrics=None, labels=None):
+        """
+        Return (key, entry) for a request; entry is None on a miss and key is None when the
+        request is not cacheable. Hits and misses are counted on `metrics` when it is given.
+        """
+        if not self.is_cacheable(params):
+            return None, None
+        key = self.make_key(params)
+        entry = self.get(key)
+        if metrics:
+            name = "response_cache_hits_total" if entry else "response_cache_misses_total"
+            metrics.emit_metric(name, 1, labels or {"cache": os.path.basename(self.db_path)}, metric_type="counter")
+        return key, entry
+
+    def export_metrics(self, exporter):
+        """Publish the cache size, evictions and hit ratio as gauges through a PrometheusMetricsExporter."""
+        labels = {"cache": os.path.basename(self.db_path)}
+        stats = self.stats()
+        for name in ("entries", "evictions", "hit_ratio"):
+            exporter.emit_metric(f"response_cache_{name}", stats[name], labels, metric_type="gauge")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
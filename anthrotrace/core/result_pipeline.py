@@ -0,0 +1,306 @@
+"""
+Fan-out of benchmark results to any number of sinks (SQLite, ClickHouse, Prometheus, JSONL...).
+
+Runners publish each result once. Every registered sink has its own bounded queue and
+worker thread that hands it batches of up to `batch_rows` results, at least every
+`flush_interval` seconds. Sinks are therefore independent: a slow or failing sink
+only grows its own queue, and publishing stays an in-memory append. A failing batch
+is retried `max_retries` times and then dropped, without affecting the other sinks; the
+sink then gets no checkpoints for the dropped results.
+
+A full queue (`max_pending` results) either blocks publishers until the sink catches up
+(overflow="block", the default, for stores that must not lose rows) or drops the oldest
+queued results (overflow="drop", for best-effort sinks such as metrics).
+
+A sink is any object with write_batch(results); flush() and close() are called when
+present.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+from anthrotrace.core.benchmark_results import emit_result_metrics
+
+OVERFLOW_POLICIES = ("block", "drop")
+
+
+class ResultPipeline:
+    """
+    Publishes runner results to registered sinks. It has the write side of a repository
+    (insert_result, insert_results, flush, close, record_checkpoints, fetch_checkpoints), so
+    it can be passed wherever a runner takes a repository.
+
+    Usage:
+        pipeline = ResultPipeline(metrics_exporter=exporter)
+        pipeline.add_sink("sqlite", RepositorySink(SQLiteRepository()))
+        pipeline.add_sink("clickhouse", RepositorySink(clickhouse_repo), batch_rows=5000)
+        pipeline.add_sink("prometheus", MetricsSink(exporter), overflow="drop")
+        runner = AnthropicBenchmarkWithSQLite(api_key, pipeline=pipeline)
+        ...
+        pipeline.close()
+    """
+
+    def __init__(self, metrics_exporter=None):
+        self.metrics = metrics_exporter  # Injected externally (shared instance)
+        self._workers = {}
+        self._closed = False
+
+    def add_sink(self, name, sink, batch_rows=500, flush_interval=1.0, max_pending=100_000, overflow="block",
+                 max_retries=3):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; expected one of {', '.join(OVERFLOW_POLICIES)}")
+        if name in self._workers:
+            raise ValueError(f"A sink named {name!r} is already registered")
+        if self._closed:
+            raise RuntimeError("ResultPipeline is closed.")
+        self._workers[name] = _SinkWorker(name, sink, batch_rows, flush_interval, max_pending, overflow, max_retries,
+                                          self.metrics)
+        return sink
+
+    @property
+    def sinks(self):
+        return {name: worker.sink for name, worker in self._workers.items()}
+
+    def publish(self, result):
+        """Queue a result for every sink; returns without waiting for any of them."""
+        self.insert_results([result])
+
+    def insert_result(self, result):
+        self.insert_results([result])
+
+    def insert_results(self, results):
+        if self._closed:
+            raise RuntimeError("ResultPipeline is closed.")
+        results = list(results)
+        for worker in self._workers.values():
+            worker.put(results)
+
+    def flush(self):
+        """Block until every sink has written (or given up on) everything published so far."""
+        for worker in self._workers.values():
+            worker.flush()
+
+    def close(self):
+        """Drain every sink, stop the worker threads and close the sinks."""
+        self._closed = True
+        for worker in self._workers.values():
+            worker.close()
+
+    def stats(self):
+        """{sink name: {"pending", "written", "dropped", "errors"}}"""
+        return {name: worker.stats() for name, worker in self._workers.items()}
+
+    def record_checkpoints(self, run_id, rows):
+        """
+        Write checkpoints to every sink that stores them, after the results they vouch for. A sink
+        only gets the checkpoints of results it wrote, so a resumed run retries the ones it dropped.
+        """
+        self.flush()
+        for worker in self._workers.values():
+            if hasattr(worker.sink, "record_checkpoints"):
+                unwritten = worker.take_unwritten(run_id, [prompt_id for prompt_id, _, _ in rows])
+                if unwritten:
+                    print(f"[PIPELINE] Sink {worker.name} did not write {len(unwritten)} results; "
+                          f"not checkpointing them")
+                written = [row for row in rows if row[0] not in unwritten]
+                if written:
+                    worker.sink.record_checkpoints(run_id, written)
+
+    def fetch_checkpoints(self, run_id):
+        for worker in self._workers.values():
+            if hasattr(worker.sink, "fetch_checkpoints"):
+                return worker.sink.fetch_checkpoints(run_id)
+        return {}
+
+
+class _SinkWorker:
+    """Queue and thread feeding one sink."""
+
+    def __init__(self, name, sink, batch_rows, flush_interval, max_pending, overflow, max_retries, metrics):
+        self.name = name
+        self.sink = sink
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self._queue = deque()
+        self._oldest = None
+        self._accepted = 0  # Results ever queued
+        self._finished = 0  # Results written, dropped or given up on
+        self._flush_waiters = 0
+        self._counts = {"written": 0, "dropped": 0, "errors": 0}
+        self._unwritten = {}  # run_id -> prompt ids of dropped results, until their checkpoints come by
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=f"anthrotrace-sink-{name}", daemon=True)
+        self._thread.start()
+
+    def put(self, results):
+        with self._condition:
+            for result in results:
+                if len(self._queue) >= self.max_pending:
+                    if self.overflow == "drop":
+                        self._mark_unwritten([self._queue.popleft()])
+                        self._finished += 1
+                        self._counts["dropped"] += 1
+                    else:
+                        # Back-pressure: this sink is max_pending results behind
+                        while len(self._queue) >= self.max_pending and not self._stopping:
+                            self._condition.wait()
+                if not self._queue:
+                    self._oldest = time.monotonic()
+                self._queue.append(result)
+                self._accepted += 1
+            if len(self._queue) >= self.batch_rows:
+                self._condition.notify_all()
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self._queue and (len(self._queue) >= self.batch_rows or self._flush_waiters or self._stopping
+                                    or time.monotonic() - self._oldest >= self.flush_interval):
+                    break
+                if self._stopping:
+                    return None
+                timeout = self.flush_interval
+                if self._queue:
+                    timeout = max(0.0, self._oldest + self.flush_interval - time.monotonic())
+                self._condition.wait(timeout)
+            batch = [self._queue.popleft() for _ in range(min(self.batch_rows, len(self._queue)))]
+            self._oldest = time.monotonic() if self._queue else None
+            self._condition.notify_all()  # Wake publishers blocked on a full queue
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            written = self._write(batch)
+            with self._condition:
+                self._finished += len(batch)
+                self._counts["written" if written else "dropped"] += len(batch)
+                if not written:
+                    self._mark_unwritten(batch)
+                pending = len(self._queue)
+                self._condition.notify_all()
+            self._emit("result_pipeline_pending", pending, "gauge")
+            self._emit("result_pipeline_written_total" if written else "result_pipeline_dropped_total", len(batch),
+                       "counter")
+
+    def _write(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sink.write_batch(batch)
+                return True
+            except Exception as e:
+                with self._condition:
+                    self._counts["errors"] += 1
+                self._emit("result_pipeline_errors_total", 1, "counter")
+                print(f"[PIPELINE] Sink {self.name} failed on {len(batch)} results (attempt {attempt + 1}): {e}")
+                if attempt < self.max_retries and not self._stopping:
+                    time.sleep(self.flush_interval)
+        print(f"[PIPELINE] Sink {self.name} dropped {len(batch)} results after {self.max_retries + 1} attempts")
+        return False
+
+    def _mark_unwritten(self, results):
+        for result in results:
+            if result.get("prompt_id") is not None:
+                self._unwritten.setdefault(result.get("run_id"), set()).add(result["prompt_id"])
+
+    def take_unwritten(self, run_id, prompt_ids):
+        """The given prompt ids whose results this sink dropped, forgetting them."""
+        with self._condition:
+            dropped = self._unwritten.get(run_id)
+            if not dropped:
+                return set()
+            unwritten = dropped.intersection(prompt_ids)
+            dropped.difference_update(unwritten)
+            if not dropped:
+                del self._unwritten[run_id]
+            return unwritten
+
+    def flush(self):
+        with self._condition:
+            target = self._accepted
+            self._flush_waiters += 1
+            self._condition.notify_all()
+            while self._finished < target and self._thread.is_alive():
+                self._condition.wait()
+            self._flush_waiters -= 1
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()
+
+    def close(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._thread.join()
+        if hasattr(self.sink, "close"):
+            self.sink.close()
+
+    def stats(self):
+        with self._condition:
+            return dict(self._counts, pending=len(self._queue))
+
+    def _emit(self, name, value, metric_type):
+        if self.metrics:
+            self.metrics.emit_metric(name, value, {"sink": self.name}, metric_type=metric_type)
+
+
+class RepositorySink:
+    """Writes batches to a repository (SQLiteRepository, ClickHousePromptLogRepository, ...) with insert_results."""
+
+    def __init__(self, repository):
+        self.repository = repository
+        if hasattr(repository, "record_checkpoints"):
+            self.record_checkpoints = repository.record_checkpoints
+            self.fetch_checkpoints = repository.fetch_checkpoints
+
+    def write_batch(self, results):
+        if hasattr(self.repository, "insert_results"):
+            self.repository.insert_results(results)
+        else:
+            for result in results:
+                self.repository.insert_result(result)
+
+    def flush(self):
+        if hasattr(self.repository, "flush"):
+            self.repository.flush()
+
+    def close(self):
+        if hasattr(self.repository, "close"):
+            self.repository.close()
+
+
+class MetricsSink:
+    """Emits the per-request Prometheus metrics (emit_result_metrics) for every result."""
+
+    def __init__(self, metrics_exporter):
+        self.metrics = metrics_exporter
+
+    def write_batch(self, results):
+        for result in results:
+            emit_result_metrics(self.metrics, result, success=result.get("status", "success") == "success")
+
+
+class JsonlSink:
+    """Appends every result as one JSON line to `path`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write_batch(self, results):
+        self._file.write("".join(json.dumps(result, default=str) + "\n" for result in results))
+        self._file.flush()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,88 @@
+import hashlib
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Checkpoint statuses that count as done; failed and throttled prompts are retried on resume
+COMPLETED_STATUSES = ("success",)
+
+
+def new_run_id():
+    """A sortable, unique id for one benchmark run, e.g. 'run-20250714T093000-1a2b3c4d'."""
+    return f"run-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def make_prompt_id(category, prompt_text, model):
+    """Stable id of a prompt within a suite: the same category, text and model always hash the same."""
+    digest = hashlib.sha256("\x1f".join((category or "", prompt_text or "", model or "")).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+class RunCheckpointer:
+    """
+    Tracks which prompts of a run have completed so an interrupted run can be resumed.
+
+    Checkpoints live in the repository's run_checkpoints table (SQLiteRepository and
+    ClickHousePromptLogRepository both implement record_checkpoints/fetch_checkpoints).
+    Writes are buffered and flushed every `flush_every` records or `flush_interval`
+    seconds, so checkpointing does not add a commit per prompt. A crash can therefore
+    lose the last unflushed checkpoints; those prompts simply run again on resume.
+
+    Usage:
+        checkpointer = RunCheckpointer(repo, run_id="run-20250714T093000-1a2b3c4d")
+        results = runner.run(prompts, checkpointer=checkpointer)  # skips completed prompts
+    """
+
+    def __init__(self, repository, run_id=None, flush_every=200, flush_interval=5.0):
+        self.repository = repository
+        self.run_id = run_id or new_run_id()
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._completed = None
+
+    def completed_prompt_ids(self):
+        """Prompt ids this run has already completed (loaded once from the repository)."""
+        if self._completed is None:
+            checkpoints = self.repository.fetch_checkpoints(self.run_id)
+            self._completed = {
+                prompt_id for prompt_id, status in checkpoints.items() if status in COMPLETED_STATUSES
+            }
+        return self._completed
+
+    def pending(self, prompts, model):
+        """Filter load_prompts_with_categories output down to the prompts still to run."""
+        completed = self.completed_prompt_ids()
+        return [
+            prompt for prompt in prompts
+            if make_prompt_id(prompt["category"], prompt["prompt_text"], model) not in completed
+        ]
+
+    def record(self, prompt_id, status):
+        with self._lock:
+            self._buffer.append((prompt_id, status, datetime.now(timezone.utc).isoformat()))
+            due = (len(self._buffer) >= self.flush_every
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def record_result(self, result):
+        self.record(result["prompt_id"], result.get("status") or ("success" if result.get("response") else "failure"))
+
+    def flush(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        if rows:
+            self.repository.record_checkpoints(self.run_id, rows)
+            if self._completed is not None:
+                self._completed.update(prompt_id for prompt_id, status, _ in rows if status in COMPLETED_STATUSES)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
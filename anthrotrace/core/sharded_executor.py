@@ -0,0 +1,250 @@
+import multiprocessing
+import os
+from itertools import islice
+
+from anthrotrace.core.benchmark_results import DEFAULT_MODEL, flush_metrics
+from anthrotrace.core.run_manifest import RunCheckpointer, make_prompt_id, new_run_id
+from anthrotrace.core.sqlite_repository import STORAGE_COLUMNS, SQLiteRepository
+from anthrotrace.core.yaml_prompt_loader import load_prompts_with_categories
+
+
+def shard_index_for(prompt, shard_count, model=DEFAULT_MODEL):
+    """Deterministic shard of a prompt: its stable prompt id modulo the shard count."""
+    return int(make_prompt_id(prompt["category"], prompt["prompt_text"], model), 16) % shard_count
+
+
+def shard_prompts(prompts, shard_count, model=DEFAULT_MODEL):
+    """Split prompts into `shard_count` lists. Every host computes the same split from the same suite."""
+    shards = [[] for _ in range(shard_count)]
+    for prompt in prompts:
+        shards[shard_index_for(prompt, shard_count, model)].append(prompt)
+    return shards
+
+
+def shard_db_path(output_dir, shard_index, shard_count):
+    return os.path.join(output_dir, f"shard-{shard_index:03d}-of-{shard_count:03d}.db")
+
+
+def default_runner_factory(repository, api_key=None, max_concurrency=100, metrics_exporter=None):
+    from anthrotrace.core.async_anthropic_benchmark_runner import AsyncAnthropicBenchmarkRunner
+    return AsyncAnthropicBenchmarkRunner(
+        api_key=api_key,
+        repository=repository,
+        metrics_exporter=metrics_exporter,
+        max_concurrency=max_concurrency
+    )
+
+
+def run_shard(prompts_path, shard_index, shard_count, output_dir="data/shards", model=DEFAULT_MODEL, api_key=None,
+              max_concurrency=100, run_id=None, runner_factory=None, export_metrics=False, text_storage="plain"):
+    """
+    Run one shard of a prompt suite and write its results to the shard's own SQLite file.
+    This is what each worker process (or each host, via the CLI) executes. Returns the shard DB path.
+    `text_storage` is passed to SQLiteRepository; compact modes keep shard files small to copy.
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} is out of range for {shard_count} shards.")
+
+    prompts = load_prompts_with_categories(prompts_path)
+    shard = shard_prompts(prompts, shard_count, model)[shard_index]
+
+    os.makedirs(output_dir, exist_ok=True)
+    db_path = shard_db_path(output_dir, shard_index, shard_count)
+    repository = SQLiteRepository(db_path=db_path, write_behind=True, text_storage=text_storage)
+
+    metrics_exporter = None
+    if export_metrics:
+        # Workers only write to the shared multiprocess directory; the parent serves the aggregate
+        from anthrotrace.metrics.prometheus_metrics_exporter import PrometheusMetricsExporter
+        metrics_exporter = PrometheusMetricsExporter(start_server=False)
+
+    runner = (runner_factory or default_runner_factory)(
+        repository, api_key=api_key, max_concurrency=max_concurrency, metrics_exporter=metrics_exporter
+    )
+    # Checkpoints live in the shard's own DB, so re-running a failed shard with the same run_id resumes it
+    checkpointer = RunCheckpointer(repository, run_id=run_id or new_run_id())
+    try:
+        runner.run(shard, model=model, checkpointer=checkpointer)
+    finally:
+        # Queued result metrics reach the multiprocess files before the worker exits
+        flush_metrics(metrics_exporter)
+        repository.close()
+    print(f"[SHARD] Shard {shard_index + 1}/{shard_count} finished {len(shard)} prompts -> {db_path}")
+    return db_path
+
+
+def _run_shard_process(kwargs):
+    run_shard(**kwargs)
+
+
+def merge_shards(shard_paths, target_repository, batch_size=5000, target_name=None):
+    """
+    Bulk-load per-shard SQLite files, rows and run checkpoints, into the main repository.
+    Merging a shard again (e.g. a retried merge, or after the shard was resumed) adds only
+    the rows the target does not have yet. Returns the number of rows merged.
+
+    A SQLiteRepository target copies each shard in one transaction over an attached database,
+    keeping interned prompts and encoded responses as they are, and skips rows it already
+    holds by (run_id, prompt_id, timestamp). Any other repository (e.g. ClickHouse) receives
+    the rehydrated rows through insert_results in chunks of `batch_size`; the shard file then
+    records how far it was merged into `target_name` (default: the target's class name), so a
+    crash mid-merge repeats at most one chunk.
+    """
+    merged = 0
+    for path in shard_paths:
+        if isinstance(target_repository, SQLiteRepository):
+            merged += _merge_into_sqlite(path, target_repository)
+        else:
+            merged += _merge_into_repository(path, target_repository, batch_size,
+                                             target_name or type(target_repository).__name__)
+    if hasattr(target_repository, "flush"):
+        target_repository.flush()  # Buffered targets: merged rows are written when merge returns
+    print(f"[SHARD] Merged {merged} rows from {len(shard_paths)} shards")
+    return merged
+
+
+def _merge_into_sqlite(path, target_repository):
+    columns = ", ".join(STORAGE_COLUMNS)
+    target_repository.flush()  # Keep the bulk copy ordered after rows a write-behind target still has queued
+    conn = target_repository.conn
+    conn.execute("ATTACH DATABASE ? AS shard", (path,))
+    try:
+        conn.execute("INSERT OR IGNORE INTO prompts (hash, prompt_text) SELECT hash, prompt_text FROM shard.prompts")
+        # A resumed run has several rows per prompt (e.g. a failure, then a success), so the
+        # timestamp is part of a row's identity
+        cursor = conn.execute(f"""
+        INSERT INTO prompt_logs ({columns})
+        SELECT {columns} FROM shard.prompt_logs AS source
+        WHERE NOT EXISTS (
+            SELECT 1 FROM main.prompt_logs AS existing
+            WHERE existing.run_id = source.run_id AND existing.prompt_id = source.prompt_id
+              AND existing.timestamp = source.timestamp
+        )
+        """)
+        conn.execute("""
+        INSERT INTO run_checkpoints (run_id, prompt_id, status, updated_at)
+        SELECT run_id, prompt_id, status, updated_at FROM shard.run_checkpoints WHERE true
+        ON CONFLICT (run_id, prompt_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at
+        WHERE excluded.updated_at > run_checkpoints.updated_at
+        """)
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE shard")
+    target_repository.fold_summary_index()  # The target's writer side: fold the copied rows
+    return cursor.rowcount
+
+
+def _merge_into_repository(path, target_repository, batch_size, target_name):
+    merged = 0
+    source = SQLiteRepository(path)
+    try:
+        row = source.conn.execute("SELECT last_id FROM merge_watermarks WHERE target = ?", (target_name,)).fetchone()
+        logs = source.iter_logs_since(row[0] if row else 0, batch_size=batch_size)
+        while True:
+            rows = list(islice(logs, batch_size))
+            if not rows:
+                break
+            target_repository.insert_results(rows)
+            if hasattr(target_repository, "flush"):
+                target_repository.flush()  # The chunk must be stored before the shard records it as merged
+            source.conn.execute("INSERT OR REPLACE INTO merge_watermarks (target, last_id) VALUES (?, ?)",
+                                (target_name, rows[-1]["id"]))
+            source.conn.commit()
+            merged += len(rows)
+
+        if hasattr(target_repository, "record_checkpoints"):
+            checkpoints = {}
+            for run_id, prompt_id, status, updated_at in source.conn.execute(
+                    "SELECT run_id, prompt_id, status, updated_at FROM run_checkpoints"):
+                checkpoints.setdefault(run_id, []).append((prompt_id, status, updated_at))
+            for run_id, rows in checkpoints.items():
+                target_repository.record_checkpoints(run_id, rows)
+    finally:
+        source.close()
+    return merged
+
+
+class ShardedBenchmarkExecutor:
+    """
+    Runs a prompt suite across `shard_count` worker processes on this host.
+
+    Prompts are assigned to shards by a hash of their prompt id, so the split is the same
+    on every host; to spread a suite over several machines run `run_shard` (or
+    `cli/sharded_benchmark.py run-shard`) with the same shard count and a different index on each.
+    Every shard writes to its own SQLite file, and `merge` bulk-loads them into the main store.
+
+    With `metrics_port`, workers record Prometheus metrics in multiprocess mode under
+    `metrics_dir` and this process serves the aggregated values, so counters stay correct
+    across workers.
+
+    Usage:
+        executor = ShardedBenchmarkExecutor("anthrotrace/data/anthrotrace_common_prompts.yaml", shard_count=8)
+        shard_paths = executor.run()
+        executor.merge(shard_paths, SQLiteRepository("data/prompt_logs.db"))
+    """
+
+    def __init__(self, prompts_path, shard_count, output_dir="data/shards", model=DEFAULT_MODEL, api_key=None,
+                 max_concurrency=100, run_id=None, runner_factory=None, metrics_port=None,
+                 metrics_dir="data/prometheus_multiproc", text_storage="plain"):
+        self.prompts_path = prompts_path
+        self.shard_count = shard_count
+        self.output_dir = output_dir
+        self.model = model
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.run_id = run_id or new_run_id()
+        self.runner_factory = runner_factory
+        self.metrics_port = metrics_port
+        self.metrics_dir = metrics_dir
+        self.text_storage = text_storage
+        self.metrics_exporter = None
+
+    def _start_metrics(self):
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        for name in os.listdir(self.metrics_dir):
+            if name.endswith(".db"):
+                os.unlink(os.path.join(self.metrics_dir, name))  # Stale values from an earlier run
+        # Must be set before the workers import prometheus_client
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = self.metrics_dir
+        from anthrotrace.metrics.prometheus_metrics_exporter import PrometheusMetricsExporter
+        self.metrics_exporter = PrometheusMetricsExporter(port=self.metrics_port)
+
+    def run(self):
+        """Run every shard in its own process and return the shard DB paths."""
+        if self.metrics_port:
+            self._start_metrics()
+
+        context = multiprocessing.get_context("spawn")
+        processes = []
+        for shard_index in range(self.shard_count):
+            kwargs = {
+                "prompts_path": self.prompts_path,
+                "shard_index": shard_index,
+                "shard_count": self.shard_count,
+                "output_dir": self.output_dir,
+                "model": self.model,
+                "api_key": self.api_key,
+                "max_concurrency": self.max_concurrency,
+                "run_id": self.run_id,
+                "runner_factory": self.runner_factory,
+                "export_metrics": bool(self.metrics_port),
+                "text_storage": self.text_storage,
+            }
+            process = context.Process(target=_run_shard_process, args=(kwargs,), name=f"anthrotrace-shard-{shard_index}")
+            process.start()
+            processes.append(process)
+
+        failed = []
+        for shard_index, process in enumerate(processes):
+            process.join()
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.mark_process_dead(process.pid)
+            if process.exitcode != 0:
+                failed.append(shard_index)
+        if failed:
+            raise RuntimeError(f"Shards {failed} exited with errors; re-run them with the same run_id to resume.")
+
+        return [shard_db_path(self.output_dir, index, self.shard_count) for index in range(self.shard_count)]
+
+    def merge(self, shard_paths, target_repository, batch_size=5000):
+        return merge_shards(shard_paths, target_repository, batch_size=batch_size)
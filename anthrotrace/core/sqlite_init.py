@@ -3,28 +3,22 @@
 import sqlite3
 import os
 
+from anthrotrace.core.sqlite_migrations import apply_migrations
+
 DB_PATH = "data/prompt_logs.db"
 
 def initialize_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    """Create the database if needed and apply any pending schema migrations."""
+    directory = os.path.dirname(DB_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
-    conn.execute("""
-        CREATE TABLE prompt_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            category TEXT NOT NULL,
-            model TEXT NOT NULL,
-            prompt_text TEXT NOT NULL,
-            response TEXT,
-            input_tokens INTEGER DEFAULT 0,
-            output_tokens INTEGER DEFAULT 0,
-            duration REAL DEFAULT 0,
-            cost REAL DEFAULT 0,
-            timestamp TEXT NOT NULL
-        );
-    """)
-    conn.commit()
+    applied = apply_migrations(conn)
     conn.close()
-    print(f"✅ Database initialized at {DB_PATH}")
+    if applied:
+        print(f"✅ Database initialized at {DB_PATH} (schema migrations {applied[0]}-{applied[-1]} applied)")
+    else:
+        print(f"✅ Database at {DB_PATH} is already up to date")
 
 if __name__ == "__main__":
     initialize_db()
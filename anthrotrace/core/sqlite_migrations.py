@@ -0,0 +1,232 @@
+"""
+Versioned, forward-only schema migrations for the SQLite prompt log store.
+
+The applied version is recorded in the schema_version table. apply_migrations() runs every
+migration newer than that version, each in its own transaction, so any database, whether
+fresh, created by sqlite_init or by an older SQLiteRepository, ends up with the same schema.
+Migrations are frozen once released: to change the schema, append a new one to MIGRATIONS.
+"""
+
+from datetime import datetime, timezone
+
+from anthrotrace.core.prompt_log_schema import to_epoch_ms
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def add_missing_columns(conn, table, columns):
+    """ALTER TABLE ADD COLUMN for each (name, SQLite type) the table does not have yet."""
+    existing = set(_table_columns(conn, table))
+    for name, sqlite_type in columns:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sqlite_type}")
+
+
+def _create_base_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS prompt_logs (
+        category TEXT NOT NULL,
+        model TEXT NOT NULL,
+        prompt_text TEXT NOT NULL,
+        response TEXT,
+        input_tokens INTEGER,
+        output_tokens INTEGER,
+        duration REAL,
+        cost REAL,
+        timestamp TEXT NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS run_checkpoints (
+        run_id TEXT NOT NULL,
+        prompt_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (run_id, prompt_id)
+    )
+    """)
+    # Columns added to prompt_logs before migrations existed (see EXTENDED_COLUMNS)
+    add_missing_columns(conn, "prompt_logs", [
+        ("status", "TEXT"),
+        ("execution_mode", "TEXT"),
+        ("run_id", "TEXT"),
+        ("prompt_id", "TEXT"),
+        ("cached", "INTEGER DEFAULT 0"),
+        ("cache_creation_input_tokens", "INTEGER DEFAULT 0"),
+        ("cache_read_input_tokens", "INTEGER DEFAULT 0"),
+        ("time_to_first_token", "REAL"),
+        ("output_tokens_per_sec", "REAL"),
+        ("inter_token_latency_p50", "REAL"),
+        ("inter_token_latency_p95", "REAL"),
+        ("inter_token_latency_max", "REAL"),
+    ])
+
+
+def _lenient_epoch_ms(value):
+    try:
+        return to_epoch_ms(value)
+    except (TypeError, ValueError):
+        return 0  # Unparseable legacy timestamps sort first instead of failing the migration
+
+
+def _rebuild_prompt_logs(conn):
+    """Give prompt_logs an id primary key and store timestamps as integer epoch milliseconds."""
+    conn.create_function("to_epoch_ms", 1, _lenient_epoch_ms, deterministic=True)
+    conn.execute("""
+    CREATE TABLE prompt_logs_v2 (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        category TEXT NOT NULL,
+        model TEXT NOT NULL,
+        prompt_text TEXT NOT NULL,
+        response TEXT,
+        input_tokens INTEGER DEFAULT 0,
+        output_tokens INTEGER DEFAULT 0,
+        duration REAL DEFAULT 0,
+        cost REAL DEFAULT 0,
+        timestamp INTEGER NOT NULL,
+        status TEXT,
+        execution_mode TEXT,
+        run_id TEXT,
+        prompt_id TEXT,
+        cached INTEGER DEFAULT 0,
+        cache_creation_input_tokens INTEGER DEFAULT 0,
+        cache_read_input_tokens INTEGER DEFAULT 0,
+        time_to_first_token REAL,
+        output_tokens_per_sec REAL,
+        inter_token_latency_p50 REAL,
+        inter_token_latency_p95 REAL,
+        inter_token_latency_max REAL
+    )
+    """)
+    new_columns = set(_table_columns(conn, "prompt_logs_v2")) - {"id", "timestamp"}
+    copied = [column for column in _table_columns(conn, "prompt_logs") if column in new_columns]
+    conn.execute(f"""
+    INSERT INTO prompt_logs_v2 ({', '.join(copied)}, timestamp)
+    SELECT {', '.join(copied)}, to_epoch_ms(timestamp) FROM prompt_logs ORDER BY rowid
+    """)
+    conn.execute("DROP TABLE prompt_logs")
+    conn.execute("ALTER TABLE prompt_logs_v2 RENAME TO prompt_logs")
+
+
+def _add_query_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_timestamp ON prompt_logs (timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_category_timestamp ON prompt_logs (category, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_model_timestamp ON prompt_logs (model, timestamp)")
+
+
+def _add_prompts_table(conn):
+    """Interned prompt texts keyed by text_storage.prompt_key; rows that use it set prompt_hash."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS prompts (
+        hash BLOB PRIMARY KEY,
+        prompt_text TEXT NOT NULL
+    ) WITHOUT ROWID
+    """)
+    add_missing_columns(conn, "prompt_logs", [("prompt_hash", "BLOB")])
+
+
+def _add_summary_index(conn):
+    """Hourly and daily summary buckets per (category, model) and the prompt_logs id folded into them so far."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS summary_buckets (
+        resolution INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        model TEXT NOT NULL,
+        total_runs INTEGER NOT NULL,
+        success_count INTEGER NOT NULL,
+        throttled_count INTEGER NOT NULL,
+        cached_count INTEGER NOT NULL,
+        input_tokens INTEGER NOT NULL,
+        output_tokens INTEGER NOT NULL,
+        cost REAL NOT NULL,
+        duration_sum REAL NOT NULL,
+        latency_sum REAL NOT NULL,
+        latency_count INTEGER NOT NULL,
+        last_timestamp INTEGER,
+        min_latency REAL,
+        max_latency REAL,
+        latency_sketch BLOB,
+        cost_sketch BLOB,
+        PRIMARY KEY (resolution, bucket, category, model)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS summary_watermarks (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    )
+    """)
+
+
+def _add_run_prompt_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_logs_run_prompt ON prompt_logs (run_id, prompt_id)")
+
+
+def _add_merge_watermarks(conn):
+    """Per-target merge progress of a shard, moved out of the summary index's watermarks."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS merge_watermarks (
+        target TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    )
+    """)
+    conn.execute("""
+    INSERT OR REPLACE INTO merge_watermarks (target, last_id)
+    SELECT substr(name, length('merged_into:') + 1), last_id FROM summary_watermarks WHERE name LIKE 'merged_into:%'
+    """)
+    conn.execute("DELETE FROM summary_watermarks WHERE name LIKE 'merged_into:%'")
+
+
+# (version, description, migration)
+MIGRATIONS = [
+    (1, "Create prompt_logs and run_checkpoints, add extended columns", _create_base_tables),
+    (2, "Add id primary key and store timestamps as epoch milliseconds", _rebuild_prompt_logs),
+    (3, "Index prompt_logs on timestamp, (category, timestamp) and (model, timestamp)", _add_query_indexes),
+    (4, "Add prompts table for deduplicated prompt text", _add_prompts_table),
+    (5, "Add the hourly and daily summary index", _add_summary_index),
+    (6, "Index prompt_logs on (run_id, prompt_id)", _add_run_prompt_index),
+    (7, "Add merge_watermarks for shard merges into another repository", _add_merge_watermarks),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT NOT NULL
+    )
+    """)
+    conn.commit()
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """Bring a connection's database up to LATEST_VERSION. Returns the versions that were applied."""
+    applied = []
+    if current_version(conn) >= LATEST_VERSION:
+        return applied
+    for version, description, migrate in MIGRATIONS:
+        # Take the write lock before re-reading the version so concurrent openers migrate only once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            migrate(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now(timezone.utc).isoformat())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"[SQLite] Applied schema migration {version}: {description}")
+    return applied
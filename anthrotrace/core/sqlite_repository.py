@@ -1,69 +1,712 @@
+import atexit
+import queue
 import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from anthrotrace.core.prompt_log_schema import (
+    ALL_COLUMNS, LATENCY_CONDITION, from_epoch_ms, projected_columns, result_row, to_epoch_ms
+)
+from anthrotrace.core.quantile_sketch import QuantileSketch, add_sketch_quantiles, merge_serialized
+from anthrotrace.core.sqlite_migrations import apply_migrations
+from anthrotrace.core.text_storage import TEXT_STORAGE_MODES, decode_response, encode_response, prompt_key
+
+# ALL_COLUMNS plus the prompts table key of rows whose prompt text is interned
+STORAGE_COLUMNS = ALL_COLUMNS + ["prompt_hash"]
+INSERT_RESULT_SQL = (f"INSERT INTO prompt_logs ({', '.join(STORAGE_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' for _ in STORAGE_COLUMNS)})")
+INSERT_PROMPT_SQL = "INSERT OR IGNORE INTO prompts (hash, prompt_text) VALUES (?, ?)"
+TIMESTAMP_INDEX = ALL_COLUMNS.index("timestamp")
+PROMPT_TEXT_INDEX = ALL_COLUMNS.index("prompt_text")
+RESPONSE_INDEX = ALL_COLUMNS.index("response")
+UPSERT_CHECKPOINT_SQL = "INSERT OR REPLACE INTO run_checkpoints (run_id, prompt_id, status, updated_at) VALUES (?, ?, ?, ?)"
+
+# name -> SQL aggregate over prompt_logs, the same names as ClickHousePromptLogRepository.aggregate_summary
+SUMMARY_AGGREGATES = {
+    "total_runs": "COUNT(*)",
+    "success_count": "COUNT(NULLIF(response, ''))",
+    "throttled_count": "COUNT(CASE WHEN status = 'throttled' THEN 1 END)",
+    "cached_count": "COUNT(NULLIF(cached, 0))",
+    "input_tokens": "COALESCE(SUM(input_tokens), 0)",
+    "output_tokens": "COALESCE(SUM(output_tokens), 0)",
+    "cost": "TOTAL(cost)",
+    "duration_sum": "TOTAL(duration)",
+    "latency_sum": f"TOTAL(CASE WHEN {LATENCY_CONDITION} THEN duration END)",
+    "latency_count": f"COUNT(CASE WHEN {LATENCY_CONDITION} THEN 1 END)",
+    "average_latency_sec": f"COALESCE(AVG(CASE WHEN {LATENCY_CONDITION} THEN duration END), 0.0)",
+    "last_timestamp": "MAX(timestamp)",
+}
+
+# name -> SQL expression for computed columns that fetch_logs_df can return alongside the stored ones
+DERIVED_COLUMNS = {
+    "success": "response IS NOT NULL AND response != ''",
+}
+
+# name -> SQL expression reading back text that text_storage stored in compact form (plain rows pass through)
+READ_EXPRESSIONS = {
+    "prompt_text": "CASE WHEN prompt_hash IS NULL THEN prompt_text ELSE "
+                   "(SELECT prompts.prompt_text FROM prompts WHERE prompts.hash = prompt_logs.prompt_hash) END",
+    "response": "decode_response(response)",
+}
+
+# summary_buckets rows cover one hour or one UTC day of one (category, model)
+HOUR_MS = 3_600_000
+DAY_MS = 86_400_000
+SUMMARY_INDEX_WATERMARK = "summary_buckets"
+
+# name -> SQL aggregate over prompt_logs rows, the columns of one summary_buckets row
+BUCKET_AGGREGATES = dict(
+    {name: expression for name, expression in SUMMARY_AGGREGATES.items() if name != "average_latency_sec"},
+    min_latency=f"MIN(CASE WHEN {LATENCY_CONDITION} THEN duration END)",
+    max_latency=f"MAX(CASE WHEN {LATENCY_CONDITION} THEN duration END)",
+    latency_sketch=f"quantile_sketch(CASE WHEN {LATENCY_CONDITION} THEN duration END)",
+    cost_sketch="quantile_sketch(cost)",
+)
+
+# name -> SQL aggregate combining summary_buckets rows (or BUCKET_AGGREGATES results) into one
+_COMBINED_EXPRESSIONS = {"min_latency": "MIN", "max_latency": "MAX", "last_timestamp": "MAX",
+                         "latency_sketch": "merge_sketches", "cost_sketch": "merge_sketches",
+                         "cost": "TOTAL", "duration_sum": "TOTAL", "latency_sum": "TOTAL"}
+COMBINED_AGGREGATES = {
+    name: (f"{_COMBINED_EXPRESSIONS[name]}({name})" if name in _COMBINED_EXPRESSIONS
+           else f"COALESCE(SUM({name}), 0)")
+    for name in BUCKET_AGGREGATES
+}
+
+# How an existing summary_buckets row absorbs a new partial row for the same key
+_UPSERT_ASSIGNMENTS = {"min_latency": "MIN(COALESCE(min_latency, excluded.min_latency), "
+                                      "COALESCE(excluded.min_latency, min_latency))",
+                       "max_latency": "MAX(COALESCE(max_latency, excluded.max_latency), "
+                                      "COALESCE(excluded.max_latency, max_latency))",
+                       "last_timestamp": "MAX(last_timestamp, excluded.last_timestamp)",
+                       "latency_sketch": "merge_sketch_pair(latency_sketch, excluded.latency_sketch)",
+                       "cost_sketch": "merge_sketch_pair(cost_sketch, excluded.cost_sketch)"}
+# Add the prompt_logs rows selected by {where_clause} to the summary_buckets of one {resolution}
+UPSERT_BUCKETS_SQL = f"""
+INSERT INTO summary_buckets (resolution, bucket, category, model, {', '.join(BUCKET_AGGREGATES)})
+SELECT {{resolution}}, timestamp - timestamp % {{resolution}}, category, model,
+       {', '.join(BUCKET_AGGREGATES.values())}
+FROM prompt_logs
+{{where_clause}}
+GROUP BY 2, 3, 4
+ON CONFLICT (resolution, bucket, category, model) DO UPDATE SET
+{', '.join(f"{name} = {_UPSERT_ASSIGNMENTS.get(name, f'{name} + excluded.{name}')}" for name in BUCKET_AGGREGATES)}
+"""
+
+_STOP = object()
+
 
 class SQLiteRepository:
-    def __init__(self, db_path="data/prompt_logs.db"):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self._create_table_if_not_exists()
+    """
+    SQLite storage for prompt logs and run checkpoints. The database runs in WAL mode so
+    readers (e.g. the dashboard) never block the writer.
+
+    With `write_behind=True`, inserts only enqueue rows and return immediately; a dedicated
+    writer thread with its own connection writes them with executemany, committing every
+    `flush_rows` rows or `flush_interval` seconds, whichever comes first. Checkpoints go
+    through the same queue, so a checkpoint is never committed before its result row.
+    Reads see rows once they are flushed; call flush() to wait for pending rows and close()
+    at shutdown. A full queue (`max_queue` rows) blocks inserts until the writer catches up.
+
+    `text_storage` controls how new rows store their text (see text_storage.py). "plain"
+    keeps both strings in prompt_logs. "zlib" and "zstd" store each distinct prompt once in
+    the prompts table and compress responses. "hash" also interns prompts but keeps only a
+    hash and the length of each response. Reads rehydrate every mode transparently, so a
+    database may mix them.
+
+    `migrate=False` skips the schema migrations, for extra (e.g. per-thread read) connections
+    to a database that another repository has already opened and migrated.
+
+    Summaries read the summary_buckets index (per hour and per UTC day, category and model),
+    which rows are folded into by id from a watermark. Writers fold: the write-behind thread
+    after every batch, synchronous inserts every `flush_rows` rows. Reads never fold; they add
+    the rows after the watermark from prompt_logs. See fold_summary_index().
+
+    Usage:
+        repo = SQLiteRepository("data/prompt_logs.db", write_behind=True, text_storage="zlib")
+        repo.insert_result(result)  # returns without touching the disk
+        repo.close()                # flushes and stops the writer thread
+    """
+
+    def __init__(self, db_path="data/prompt_logs.db", write_behind=False, flush_rows=500, flush_interval=1.0,
+                 max_queue=100_000, text_storage="plain", migrate=True):
+        if text_storage not in TEXT_STORAGE_MODES:
+            raise ValueError(f"Unknown text_storage {text_storage!r}; expected one of {', '.join(TEXT_STORAGE_MODES)}")
+        if text_storage == "zstd":
+            import zstandard  # Fail at construction rather than on the first insert
+        self.text_storage = text_storage
+        self._known_prompts = set()
+        self.db_path = db_path
+        self.conn = self._connect()
+        self._index_lock = threading.Lock()
+        self._index_checked = migrate
+        if migrate:
+            self._create_table_if_not_exists()
+
+        self.write_behind = write_behind
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.last_error = None
+        self._unfolded_rows = 0
+        self._queue = None
+        self._writer = None
+        if write_behind:
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._writer = threading.Thread(target=self._writer_loop, name="anthrotrace-sqlite-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)  # Don't lose queued rows if the caller forgets close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Durable across application crashes; fsync only at checkpoints
+        conn.create_function("decode_response", 1, decode_response, deterministic=True)
+        conn.create_function("merge_sketch_pair", 2, _merge_sketch_pair, deterministic=True)
+        conn.create_aggregate("quantile_sketch", 1, _SketchAggregate)
+        conn.create_aggregate("merge_sketches", 1, _MergeSketchesAggregate)
+        return conn
 
     def _create_table_if_not_exists(self):
-        create_table_sql = """
-        CREATE TABLE IF NOT EXISTS prompt_logs (
-            category TEXT NOT NULL,
-            model TEXT NOT NULL,
-            prompt_text TEXT NOT NULL,
-            response TEXT,
-            input_tokens INTEGER,
-            output_tokens INTEGER,
-            duration REAL,
-            cost REAL,
-            timestamp TEXT NOT NULL
-        );
-        """
-        self.conn.execute(create_table_sql)
-        self.conn.commit()
+        apply_migrations(self.conn)
 
     def insert_log(self, category, model, prompt_text, response, input_tokens, output_tokens, duration, cost=0.0, timestamp=None):
+        if self.write_behind or self.text_storage != "plain":
+            self.insert_result({
+                "category": category, "model": model, "prompt_text": prompt_text, "response": response,
+                "input_tokens": input_tokens, "output_tokens": output_tokens, "duration": duration, "cost": cost,
+                "timestamp": timestamp
+            })
+            return
         insert_sql = """
         INSERT INTO prompt_logs (category, model, prompt_text, response, input_tokens, output_tokens, duration, cost, timestamp)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
         """
-        self.conn.execute(insert_sql, (category, model, prompt_text, response, input_tokens, output_tokens, duration, cost, timestamp))
+        self.conn.execute(insert_sql, (category, model, prompt_text, response, input_tokens, output_tokens, duration, cost,
+                                       to_epoch_ms(timestamp)))
+        self.conn.commit()
+        self._fold_after_write(1)
+
+    def insert_result(self, result):
+        """Insert a result dict as returned by the benchmark runners, including the extended columns."""
+        self.insert_results([result])
+
+    def insert_results(self, results):
+        """Bulk-insert runner result dicts with a single executemany and one commit."""
+        prompt_rows, rows = self._storage_rows(results)
+        if self.write_behind:
+            for row in prompt_rows:
+                self._enqueue(INSERT_PROMPT_SQL, row)
+            for row in rows:
+                self._enqueue(INSERT_RESULT_SQL, row)
+            return
+        if prompt_rows:
+            self.conn.executemany(INSERT_PROMPT_SQL, prompt_rows)
+        self.conn.executemany(INSERT_RESULT_SQL, rows)
         self.conn.commit()
+        self._fold_after_write(len(rows))
+
+    def _fold_after_write(self, rows):
+        # Synchronous writers fold the summary index themselves, in chunks of flush_rows rows
+        self._unfolded_rows += rows
+        if self._unfolded_rows < self.flush_rows:
+            return
+        self._unfolded_rows = 0
+        try:
+            self.fold_summary_index()
+        except Exception as e:
+            print(f"[SQLite] Summary Index Error: {e}")  # The next fold picks these rows up
+
+    def _storage_rows(self, results):
+        """(prompts rows not written yet, prompt_logs rows) for results in this repository's text_storage."""
+        prompt_rows, rows = [], []
+        for result in results:
+            row = _storage_row(result, self.text_storage)
+            key = row[-1]
+            if key is not None and key not in self._known_prompts:
+                self._known_prompts.add(key)
+                prompt_rows.append((key, result.get("prompt_text") or ""))
+            rows.append(row)
+        return prompt_rows, rows
+
+    def record_checkpoints(self, run_id, rows):
+        """Upsert (prompt_id, status, updated_at) checkpoint rows for a run in one transaction."""
+        checkpoint_rows = [(run_id, prompt_id, status, updated_at) for prompt_id, status, updated_at in rows]
+        if self.write_behind:
+            for row in checkpoint_rows:
+                self._enqueue(UPSERT_CHECKPOINT_SQL, row)
+            return
+        self.conn.executemany(UPSERT_CHECKPOINT_SQL, checkpoint_rows)
+        self.conn.commit()
+
+    def _enqueue(self, sql, row):
+        if self._writer is None:
+            raise RuntimeError("SQLiteRepository is closed.")
+        self._queue.put((sql, row))
+
+    def _writer_loop(self):
+        conn = self._connect()
+        pending = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    self._write_batch(conn, pending)
+                    pending, deadline = [], None
+                    item.set()  # flush() barrier: everything queued before it is committed
+                else:
+                    pending.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            if pending and (stopping or len(pending) >= self.flush_rows or time.monotonic() >= deadline):
+                self._write_batch(conn, pending)
+                pending, deadline = [], None
+        conn.close()
+
+    def _write_batch(self, conn, items):
+        if not items:
+            return
+        try:
+            # Consecutive rows for the same statement become one executemany; one commit per batch
+            start = 0
+            for index in range(1, len(items) + 1):
+                if index == len(items) or items[index][0] != items[start][0]:
+                    conn.executemany(items[start][0], [row for _, row in items[start:index]])
+                    start = index
+            conn.commit()
+            self.rows_written += len(items)
+        except Exception as e:
+            conn.rollback()
+            self._known_prompts.clear()  # Dropped rows may include first-seen prompts; re-insert them next time
+            self.last_error = e
+            print(f"[SQLite] Write Error: dropped {len(items)} rows: {e}")
+            return
+        try:
+            # Keep the summary index current while the batch is still in the page cache
+            _fold_summary_index(conn)
+        except Exception as e:
+            print(f"[SQLite] Summary Index Error: {e}")  # The next batch folds these rows instead
+
+    def flush(self):
+        """Block until every row queued so far is committed. A no-op without write_behind."""
+        if self._writer is None:
+            return
+        barrier = threading.Event()
+        self._queue.put(barrier)
+        barrier.wait()
+
+    def close(self):
+        """Flush pending rows, stop the writer thread and close the connection."""
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            self._queue.put(_STOP)
+            writer.join()
+            atexit.unregister(self.close)
+        self.conn.close()
+
+    def fetch_checkpoints(self, run_id):
+        """Return {prompt_id: status} for every checkpointed prompt of a run."""
+        cur = self.conn.execute("SELECT prompt_id, status FROM run_checkpoints WHERE run_id = ?", (run_id,))
+        return dict(cur.fetchall())
 
     def fetch_logs(self, category=None, model=None, start_time=None, end_time=None, limit=100):
-        conditions = []
-        params = []
-
-        if category:
-            conditions.append("category = ?")
-            params.append(category)
-        if model:
-            conditions.append("model = ?")
-            params.append(model)
-        if start_time:
-            conditions.append("timestamp >= ?")
-            params.append(start_time)
-        if end_time:
-            conditions.append("timestamp <= ?")
-            params.append(end_time)
-
-        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
-
-        query = f"""
-        SELECT category, model, prompt_text, response, input_tokens, output_tokens, duration, cost, timestamp
-        FROM prompt_logs
-        {where_clause}
-        ORDER BY timestamp DESC
-        LIMIT {limit}
-        """
         try:
-            cur = self.conn.cursor()
-            cur.execute(query, params)
-            columns = [col[0] for col in cur.description]
-            return [dict(zip(columns, row)) for row in cur.fetchall()]
+            return list(islice(self.iter_logs(category, model, start_time, end_time, batch_size=max(1, limit)), limit))
         except Exception as e:
             print(f"[SQLite] Fetch Error: {e}")
             return []
 
+    def iter_logs(self, category=None, model=None, start_time=None, end_time=None, batch_size=1000, columns=None):
+        """
+        Yield every log matching the filters as a dict, newest first, reading `batch_size` rows per
+        query. Pages continue from the last (timestamp, id) seen instead of using OFFSET, so each
+        page is an index range scan however deep the iteration goes, and rows inserted meanwhile
+        do not shift the pages. `columns` restricts the fetched columns (e.g. to leave out
+        prompt_text and response); "id" may be requested as well.
+        """
+        columns = projected_columns(columns, available=["id"] + ALL_COLUMNS)
+        where_clause, params = _filter_clause(category, model, start_time, end_time)
+        page_clause = f"{where_clause} {'AND' if where_clause else 'WHERE'} (timestamp, id) < (?, ?)"
+        select = f"SELECT timestamp, id, {', '.join(_select_expression(column) for column in columns)} FROM prompt_logs"
+        order = f"ORDER BY timestamp DESC, id DESC LIMIT {int(batch_size)}"
+        convert_timestamp = "timestamp" in columns
+
+        rows = self.conn.execute(f"{select} {where_clause} {order}", params).fetchall()
+        while rows:
+            for row in rows:
+                log = dict(zip(columns, row[2:]))
+                if convert_timestamp:
+                    log["timestamp"] = from_epoch_ms(log["timestamp"])
+                yield log
+            if len(rows) < batch_size:
+                return
+            rows = self.conn.execute(f"{select} {page_clause} {order}", params + list(rows[-1][:2])).fetchall()
+
+    def iter_logs_since(self, last_id=0, batch_size=1000):
+        """Yield every log with an id above `last_id`, with its id, in insertion order; for incremental copies."""
+        columns = ["id"] + ALL_COLUMNS
+        query = (f"SELECT {', '.join(_select_expression(column) for column in columns)} FROM prompt_logs "
+                 f"WHERE id > ? ORDER BY id LIMIT {int(batch_size)}")
+        while True:
+            rows = self.conn.execute(query, (last_id,)).fetchall()
+            for row in rows:
+                log = dict(zip(columns, row))
+                log["timestamp"] = from_epoch_ms(log["timestamp"])
+                yield log
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def fetch_logs_df(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None,
+                      batch_size=50_000):
+        """
+        Every log matching the filters (or the newest `limit`) as a pandas DataFrame with native
+        dtypes: INTEGER and REAL columns become int64/float64 arrays (float64 where NULLs occur),
+        timestamp becomes datetime64 UTC, and text columns become object/string columns. Rows
+        are decoded `batch_size` at a time straight into typed column chunks, never into
+        per-row dicts. `columns` may also name the derived boolean column "success".
+        """
+        import numpy as np
+        import pandas as pd
+
+        columns = projected_columns(columns, available=["id"] + ALL_COLUMNS + list(DERIVED_COLUMNS))
+        where_clause, params = _filter_clause(category, model, start_time, end_time)
+        select = ", ".join(_select_expression(column) for column in columns)
+        query = f"SELECT {select} FROM prompt_logs {where_clause} ORDER BY timestamp DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+
+        column_types = {row[1]: row[2].upper() for row in self.conn.execute("PRAGMA table_info(prompt_logs)")}
+        kinds = ["BOOLEAN" if column in DERIVED_COLUMNS else column_types.get(column, "TEXT") for column in columns]
+        chunks = [[] for _ in columns]
+        cursor = self.conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for index, values in enumerate(zip(*rows)):
+                chunks[index].append(_typed_chunk(kinds[index], values))
+
+        frame = pd.DataFrame({
+            column: np.concatenate(chunks[index]) if chunks[index] else _typed_chunk(kinds[index], ())
+            for index, column in enumerate(columns)
+        })
+        if "timestamp" in frame:
+            frame["timestamp"] = pd.to_datetime(frame["timestamp"], unit="ms", utc=True)
+        return frame
+
+    def fetch_logs_arrow(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        """fetch_logs_df as a pyarrow Table."""
+        import pyarrow as pa
+        frame = self.fetch_logs_df(category, model, start_time, end_time, columns=columns, limit=limit)
+        return pa.Table.from_pandas(frame, preserve_index=False)
+
+    def aggregate_summary(self, category=None, model=None, start_time=None, end_time=None):
+        """
+        Counts, totals, latency min/max and the latency_sketch/cost_sketch of every row matching
+        the filters (None if nothing matches), with latency_pXX_sec and cost_pXX_usd read from
+        the sketches. Keys match ClickHousePromptLogRepository.aggregate_summary. Served from
+        summary_buckets in one read-only query (see the class docstring).
+        """
+        try:
+            self._check_index()
+            query, params = self._summary_query(category, model, start_time, end_time)
+            with self._index_lock:
+                row = dict(zip(COMBINED_AGGREGATES, self.conn.execute(query, params).fetchone()))
+        except Exception as e:
+            print(f"[SQLite] Aggregation Error: {e}")
+            return None
+        if not row["total_runs"]:
+            return None
+        row["failure_count"] = row["total_runs"] - row["success_count"] - row["throttled_count"]
+        row["average_latency_sec"] = row["latency_sum"] / row["latency_count"] if row["latency_count"] else 0.0
+        row["last_timestamp"] = from_epoch_ms(row["last_timestamp"])
+        for name in ("latency_sketch", "cost_sketch"):
+            row[name] = QuantileSketch.from_bytes(row[name]) if row[name] else QuantileSketch()
+        return add_sketch_quantiles(row)
+
+    def _summary_query(self, category, model, start_time, end_time):
+        """
+        One statement (so one snapshot, consistent with the watermark it reads) that combines the
+        stored days and hours inside the window with the rows the index does not cover for it.
+        """
+        start_ms = to_epoch_ms(start_time) if start_time is not None else None
+        end_ms = to_epoch_ms(end_time) + 1 if end_time is not None else None  # Exclusive from here on
+        first_hour = -(-start_ms // HOUR_MS) * HOUR_MS if start_ms is not None else None
+        end_hour = end_ms - end_ms % HOUR_MS if end_ms is not None else None
+        first_day = -(-start_ms // DAY_MS) * DAY_MS if start_ms is not None else None
+        end_day = end_ms - end_ms % DAY_MS if end_ms is not None else None
+
+        stored, raw = [], []  # (resolution, first bucket, end bucket) / (start ms, end ms) ranges
+        if first_hour is not None and end_hour is not None and first_hour >= end_hour:
+            raw.append((start_ms, end_ms))  # Not a single whole hour: read every row
+        else:
+            if first_day is not None and end_day is not None and first_day >= end_day:
+                stored.append((HOUR_MS, first_hour, end_hour))
+            else:
+                stored.append((DAY_MS, first_day, end_day))
+                if first_day is not None and first_hour < first_day:
+                    stored.append((HOUR_MS, first_hour, first_day))
+                if end_day is not None and end_day < end_hour:
+                    stored.append((HOUR_MS, end_day, end_hour))
+            if first_hour is not None and start_ms < first_hour:
+                raw.append((start_ms, first_hour))
+            if end_hour is not None and end_hour < end_ms:
+                raw.append((end_hour, end_ms))
+
+        names = ", ".join(BUCKET_AGGREGATES)
+        raw_select = ", ".join(f"{expression} AS {name}" for name, expression in BUCKET_AGGREGATES.items())
+        watermark = "(SELECT COALESCE(MAX(last_id), 0) FROM summary_watermarks WHERE name = ?)"
+        parts, params = [], []
+        for resolution, first_bucket, end_bucket in stored:
+            conditions, part_params = _bucket_clause(category, model, first_bucket, end_bucket)
+            parts.append(f"SELECT {names} FROM summary_buckets WHERE resolution = ? {conditions}")
+            params += [resolution] + part_params
+        # Rows after the watermark anywhere in the window (by id range: there are few of them),
+        # then folded rows in the partial hours
+        where_clause, part_params = _filter_clause(category, model, start_time, end_time)
+        parts.append(f"SELECT {raw_select} FROM prompt_logs NOT INDEXED {where_clause} "
+                     f"{'AND' if where_clause else 'WHERE'} id > {watermark}")
+        params += part_params + [SUMMARY_INDEX_WATERMARK]
+        for low, high in raw:
+            where_clause, part_params = _filter_clause(category, model, low, high - 1)
+            parts.append(f"SELECT {raw_select} FROM prompt_logs {where_clause} AND id <= {watermark}")
+            params += part_params + [SUMMARY_INDEX_WATERMARK]
+        combined = ", ".join(f"{expression} AS {name}" for name, expression in COMBINED_AGGREGATES.items())
+        return f"SELECT {combined} FROM ({' UNION ALL '.join(parts)})", params
+
+    def fold_summary_index(self):
+        """
+        Fold rows inserted since the last fold into summary_buckets, e.g. to build the index of a
+        database from before it existed. Returns the number of rows folded (0 when another writer
+        holds the database; summaries read the unfolded rows from prompt_logs meanwhile).
+        """
+        self._check_index()
+        with self._index_lock:
+            return _fold_summary_index(self.conn)
+
+    def _check_index(self):
+        if self._index_checked:
+            return
+        with self._index_lock:
+            # Readers opened with migrate=False may face a database from before the index
+            if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'summary_buckets'").fetchone():
+                apply_migrations(self.conn)
+            self._index_checked = True
+
+    def log_days(self, end_time=None):
+        """UTC dates (datetime.date) that have rows before `end_time`, oldest first; one index seek per day."""
+        days = []
+        end_ms = to_epoch_ms(end_time) if end_time is not None else None
+        cursor_ms = None
+        while True:
+            if cursor_ms is None:
+                oldest = self.conn.execute("SELECT MIN(timestamp) FROM prompt_logs").fetchone()[0]
+            else:
+                oldest = self.conn.execute("SELECT MIN(timestamp) FROM prompt_logs WHERE timestamp >= ?",
+                                           (cursor_ms,)).fetchone()[0]
+            if oldest is None or (end_ms is not None and oldest >= end_ms):
+                return days
+            day = datetime.fromtimestamp(oldest / 1000, timezone.utc).date()
+            days.append(day)
+            cursor_ms = to_epoch_ms(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+
+    def delete_logs(self, start_time=None, end_time=None, max_id=None):
+        """Delete the rows in [start_time, end_time], only up to id `max_id` if given. Returns the count."""
+        self.flush()
+        where_clause, params = _filter_clause(start_time=start_time, end_time=end_time)
+        if max_id is not None:
+            where_clause += f" {'AND' if where_clause else 'WHERE'} id <= ?"
+            params.append(max_id)
+        with self._index_lock:
+            cursor = self.conn.execute(f"DELETE FROM prompt_logs {where_clause}", params)
+            if cursor.rowcount:
+                _rebuild_summary_index(self.conn, to_epoch_ms(start_time) if start_time is not None else None,
+                                       to_epoch_ms(end_time) if end_time is not None else None)
+            self.conn.commit()
+        return cursor.rowcount
+
+    def vacuum(self):
+        """Rebuild the database file so space freed by delete_logs goes back to the filesystem."""
+        self.flush()
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.execute("VACUUM")
+
     def get_all_logs(self):
         return self.fetch_logs(limit=100)
+
+
+def _typed_chunk(kind, values):
+    """One column of a fetchmany batch as a numpy array of the column's declared SQLite type."""
+    import numpy as np
+    if kind == "BOOLEAN":
+        return np.array(values, dtype=bool)
+    if kind == "INTEGER":
+        try:
+            return np.array(values, dtype=np.int64)
+        except TypeError:
+            return np.array(values, dtype=np.float64)  # NULLs become NaN
+    if kind == "REAL":
+        return np.array(values, dtype=np.float64)
+    chunk = np.empty(len(values), dtype=object)
+    chunk[:] = values
+    return chunk
+
+
+class _SketchAggregate:
+    """SQL aggregate quantile_sketch(value): the serialized QuantileSketch of the non-NULL values."""
+
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        self.values.append(value)
+
+    def finalize(self):
+        sketch = QuantileSketch()
+        sketch.add_many(self.values)
+        return sketch.to_bytes() if sketch.count else None
+
+
+class _MergeSketchesAggregate:
+    """SQL aggregate merge_sketches(blob): the merge of serialized sketches (NULLs are skipped)."""
+
+    def __init__(self):
+        self.blobs = []
+
+    def step(self, blob):
+        self.blobs.append(blob)
+
+    def finalize(self):
+        merged = merge_serialized(self.blobs)
+        return merged.to_bytes() if merged is not None else None
+
+
+def _merge_sketch_pair(first, second):
+    if not first or not second:
+        return first or second
+    return merge_serialized((first, second)).to_bytes()
+
+
+def _summary_watermark(conn):
+    row = conn.execute("SELECT last_id FROM summary_watermarks WHERE name = ?", (SUMMARY_INDEX_WATERMARK,)).fetchone()
+    return row[0] if row else 0
+
+
+def _fold_summary_index(conn):
+    """Fold the rows after the watermark into summary_buckets in one transaction; returns how many."""
+    if conn.in_transaction:
+        return 0  # Another caller's transaction is open on this connection
+    try:
+        conn.execute("BEGIN IMMEDIATE")  # One folder at a time across connections and processes
+    except sqlite3.OperationalError:
+        return 0
+    try:
+        watermark = _summary_watermark(conn)
+        last_id = conn.execute("SELECT MAX(id) FROM prompt_logs WHERE id > ?", (watermark,)).fetchone()[0]
+        if last_id is None:
+            conn.rollback()
+            return 0
+        for resolution in (HOUR_MS, DAY_MS):
+            conn.execute(UPSERT_BUCKETS_SQL.format(resolution=resolution, where_clause="WHERE id > ? AND id <= ?"),
+                         (watermark, last_id))
+        conn.execute("INSERT OR REPLACE INTO summary_watermarks (name, last_id) VALUES (?, ?)",
+                     (SUMMARY_INDEX_WATERMARK, last_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return last_id - watermark
+
+
+def _rollup_days(conn, first_day, end_day):
+    """Recompute the day rows in [first_day, end_day) (None: unbounded) from their hour rows."""
+    conditions, params = _bucket_clause(first_bucket=first_day, end_bucket=end_day)
+    conn.execute(f"DELETE FROM summary_buckets WHERE resolution = {DAY_MS} {conditions}", params)
+    conn.execute(f"""
+    INSERT INTO summary_buckets (resolution, bucket, category, model, {', '.join(COMBINED_AGGREGATES)})
+    SELECT {DAY_MS}, bucket - bucket % {DAY_MS}, category, model, {', '.join(COMBINED_AGGREGATES.values())}
+    FROM summary_buckets
+    WHERE resolution = {HOUR_MS} {conditions}
+    GROUP BY 2, 3, 4
+    """, params)
+
+
+def _rebuild_summary_index(conn, start_ms, end_ms):
+    """Recompute the stored hours and days overlapping [start_ms, end_ms] from their remaining folded rows."""
+    first_hour = start_ms - start_ms % HOUR_MS if start_ms is not None else None
+    end_hour = end_ms - end_ms % HOUR_MS + HOUR_MS if end_ms is not None else None
+    conditions, params = _bucket_clause(first_bucket=first_hour, end_bucket=end_hour)
+    conn.execute(f"DELETE FROM summary_buckets WHERE resolution = {HOUR_MS} {conditions}", params)
+    where_clause, params = _filter_clause(start_time=first_hour, end_time=end_hour - 1 if end_hour else None)
+    where_clause += f" {'AND' if where_clause else 'WHERE'} id <= ?"
+    conn.execute(UPSERT_BUCKETS_SQL.format(resolution=HOUR_MS, where_clause=where_clause),
+                 params + [_summary_watermark(conn)])
+    _rollup_days(conn, first_hour - first_hour % DAY_MS if first_hour is not None else None,
+                 end_hour - end_hour % DAY_MS + DAY_MS if end_hour is not None else None)
+
+
+def _bucket_clause(category=None, model=None, first_bucket=None, end_bucket=None):
+    """AND conditions over summary_buckets for buckets in [first_bucket, end_bucket)."""
+    conditions = []
+    params = []
+    if first_bucket is not None:
+        conditions.append("bucket >= ?")
+        params.append(first_bucket)
+    if end_bucket is not None:
+        conditions.append("bucket < ?")
+        params.append(end_bucket)
+    if category:
+        conditions.append("category = ?")
+        params.append(category)
+    if model:
+        conditions.append("model = ?")
+        params.append(model)
+    return "".join(f" AND {condition}" for condition in conditions), params
+
+
+def _filter_clause(category=None, model=None, start_time=None, end_time=None):
+    conditions = []
+    params = []
+    if category:
+        conditions.append("category = ?")
+        params.append(category)
+    if model:
+        conditions.append("model = ?")
+        params.append(model)
+    if start_time is not None:
+        conditions.append("timestamp >= ?")
+        params.append(to_epoch_ms(start_time))
+    if end_time is not None:
+        conditions.append("timestamp <= ?")
+        params.append(to_epoch_ms(end_time))
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+def _storage_row(result, text_storage="plain"):
+    """
+    Values for STORAGE_COLUMNS: result_row with the timestamp in epoch milliseconds and, unless
+    text_storage is "plain", the prompt replaced by its prompts key and the response encoded.
+    """
+    row = list(result_row(result))
+    row[TIMESTAMP_INDEX] = to_epoch_ms(row[TIMESTAMP_INDEX])
+    key = None
+    if text_storage != "plain":
+        key = prompt_key(row[PROMPT_TEXT_INDEX] or "")
+        row[PROMPT_TEXT_INDEX] = ""
+        row[RESPONSE_INDEX] = encode_response(row[RESPONSE_INDEX], text_storage)
+    return tuple(row) + (key,)
+
+
+def _select_expression(column):
+    expression = READ_EXPRESSIONS.get(column) or DERIVED_COLUMNS.get(column)
+    return f"{expression} AS {column}" if expression else column
@@ -0,0 +1,60 @@
+"""
+Compact storage of prompt and response text in SQLite.
+
+Prompts are interned in the prompts table under prompt_key(), the first 16 bytes of their
+SHA-256, and prompt_logs rows only reference that key. Non-empty responses are stored as a BLOB
+whose first byte names the encoding:
+
+    b"z" + zlib stream          (text_storage="zlib")
+    b"s" + zstd frame           (text_storage="zstd", needs the zstandard package)
+    b"h" + SHA-256 + length     (text_storage="hash": the body is dropped, only its identity kept)
+
+NULL and empty responses are never encoded, so the `response IS NOT NULL AND response != ''`
+success checks work unchanged on encoded rows. decode_response() turns any stored value back
+into text and passes plain text through, so old and new rows can share a table.
+"""
+
+import hashlib
+import zlib
+
+TEXT_STORAGE_MODES = ("plain", "zlib", "zstd", "hash")
+
+_ZLIB = b"z"
+_ZSTD = b"s"
+_HASH = b"h"
+
+
+def prompt_key(prompt_text):
+    """16-byte content key of a prompt in the prompts table."""
+    return hashlib.sha256(prompt_text.encode("utf-8")).digest()[:16]
+
+
+def encode_response(response, text_storage):
+    """Stored form of a response for a text_storage mode; NULL, empty and 'plain' values are kept as is."""
+    if not response or text_storage == "plain":
+        return response
+    data = response.encode("utf-8")
+    if text_storage == "zlib":
+        return _ZLIB + zlib.compress(data, 6)
+    if text_storage == "zstd":
+        import zstandard
+        return _ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
+    if text_storage == "hash":
+        return _HASH + hashlib.sha256(data).digest() + len(response).to_bytes(4, "big")
+    raise ValueError(f"Unknown text_storage {text_storage!r}; expected one of {', '.join(TEXT_STORAGE_MODES)}")
+
+
+def decode_response(value):
+    """Text of a stored response. Bodies kept only as a hash come back as a non-empty placeholder."""
+    if not isinstance(value, bytes):
+        return value
+    tag, payload = value[:1], value[1:]
+    if tag == _ZLIB:
+        return zlib.decompress(payload).decode("utf-8")
+    if tag == _ZSTD:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    if tag == _HASH:
+        digest, length = payload[:32], int.from_bytes(payload[32:], "big")
+        return f"[response not stored: {length} chars, sha256 {digest.hex()}]"
+    raise ValueError(f"Unknown stored response encoding {tag!r}")
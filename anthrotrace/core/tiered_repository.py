@@ -0,0 +1,107 @@
+"""
+Read-side view over a hot SQLiteRepository plus its ParquetArchive.
+
+archive_closed_partitions() moves whole days out of the hot store, so every row lives in
+exactly one tier and results can simply be combined: summaries add up the totals of both
+tiers, and row reads return hot rows first, then archived rows, both newest first.
+Writes go to the hot repository directly.
+"""
+
+from itertools import islice
+
+from anthrotrace.core.benchmark_summary_service import SUMMARY_FRAME_COLUMNS, reduce_frame
+from anthrotrace.core.prompt_log_schema import from_epoch_ms, projected_columns, to_epoch_ms
+from anthrotrace.core.quantile_sketch import add_sketch_quantiles, merge_sketches
+
+_SUMMED_TOTALS = ["total_runs", "success_count", "throttled_count", "cached_count", "failure_count",
+                  "input_tokens", "output_tokens", "cost", "duration_sum", "latency_sum", "latency_count"]
+
+
+class TieredPromptLogRepository:
+    """
+    Usage:
+        repo = TieredPromptLogRepository(SQLiteRepository("data/prompt_logs.db"), ParquetArchive("data/archive"))
+        BenchmarkSummaryService(repo).get_summary(category="Summarization")
+    """
+
+    def __init__(self, hot_repository, archive):
+        self.hot = hot_repository
+        self.archive = archive
+
+    def aggregate_summary(self, category=None, model=None, start_time=None, end_time=None):
+        filters = {"category": category, "model": model, "start_time": start_time, "end_time": end_time}
+        return combine_totals(self.hot.aggregate_summary(**filters), self._archive_totals(**filters))
+
+    def _archive_totals(self, **filters):
+        if not self.archive.files(filters["start_time"], filters["end_time"]):
+            return None
+        return reduce_frame(self.archive.read(columns=SUMMARY_FRAME_COLUMNS, **filters).to_pandas())
+
+    def fetch_logs_df(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        import pandas as pd
+        filters = {"category": category, "model": model, "start_time": start_time, "end_time": end_time}
+        hot = self.hot.fetch_logs_df(columns=columns, limit=limit, **filters)
+        if limit and len(hot) >= limit:
+            return hot
+        columns = projected_columns(columns, available=self.archive.column_names())
+        frames = [hot]
+        remaining = limit - len(hot) if limit else None
+        for table in self.archive.read_days(columns=columns, **filters):
+            if remaining is not None:
+                table = table.slice(0, remaining)
+                remaining -= table.num_rows
+            frames.append(table.to_pandas())
+            if remaining == 0:
+                break
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            return hot
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def fetch_logs_arrow(self, category=None, model=None, start_time=None, end_time=None, columns=None, limit=None):
+        import pyarrow as pa
+        frame = self.fetch_logs_df(category, model, start_time, end_time, columns=columns, limit=limit)
+        return pa.Table.from_pandas(frame, preserve_index=False)
+
+    def iter_logs(self, category=None, model=None, start_time=None, end_time=None, batch_size=1000, columns=None):
+        filters = {"category": category, "model": model, "start_time": start_time, "end_time": end_time}
+        yield from self.hot.iter_logs(batch_size=batch_size, columns=columns, **filters)
+        # Archived days are older than anything still hot
+        columns = projected_columns(columns, available=self.archive.column_names())
+        for table in self.archive.read_days(columns=columns, **filters):
+            for batch in table.to_batches(max_chunksize=batch_size):
+                for log in batch.to_pylist():
+                    if log.get("timestamp") is not None:
+                        log["timestamp"] = from_epoch_ms(to_epoch_ms(log["timestamp"]))
+                    yield log
+
+    def fetch_logs(self, category=None, model=None, start_time=None, end_time=None, limit=100):
+        return list(islice(self.iter_logs(category, model, start_time, end_time, batch_size=max(1, limit)), limit))
+
+    def get_all_logs(self):
+        return self.fetch_logs(limit=100)
+
+
+def combine_totals(*totals):
+    """
+    Merge aggregate_summary dicts of disjoint row sets (None entries are skipped). Latency min/max
+    and quantiles (from the merged latency and cost sketches) are kept when every entry has them.
+    """
+    totals = [entry for entry in totals if entry]
+    if not totals:
+        return None
+    if len(totals) == 1:
+        return totals[0]
+    combined = {key: sum(entry[key] for entry in totals) for key in _SUMMED_TOTALS}
+    combined["last_timestamp"] = from_epoch_ms(max(
+        (to_epoch_ms(entry["last_timestamp"]) for entry in totals if entry["last_timestamp"]), default=None))
+    combined["average_latency_sec"] = (combined["latency_sum"] / combined["latency_count"]
+                                       if combined["latency_count"] else 0.0)
+    for key, pick in (("min_latency", min), ("max_latency", max)):
+        if all(key in entry for entry in totals):
+            combined[key] = pick((entry[key] for entry in totals if entry[key] is not None), default=None)
+    if all("latency_sketch" in entry and "cost_sketch" in entry for entry in totals):
+        combined["latency_sketch"] = merge_sketches(entry["latency_sketch"] for entry in totals)
+        combined["cost_sketch"] = merge_sketches(entry["cost_sketch"] for entry in totals)
+        add_sketch_quantiles(combined)
+    return combined
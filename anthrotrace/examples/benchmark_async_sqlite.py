@@ -0,0 +1,21 @@
+from anthrotrace.core.yaml_prompt_loader import load_prompts_with_categories
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.async_anthropic_benchmark_runner import AsyncAnthropicBenchmarkRunner
+
+import os
+
+API_KEY = os.environ.get("ANTHROPIC_API_KEY")
+MAX_CONCURRENCY = 200
+
+prompts = load_prompts_with_categories("anthrotrace/data/anthrotrace_common_prompts.yaml")
+
+# One client, one connection pool and one repository shared by every in-flight request
+runner = AsyncAnthropicBenchmarkRunner(
+    api_key=API_KEY,
+    repository=SQLiteRepository(db_path="data/prompt_logs.db", write_behind=True),
+    max_concurrency=MAX_CONCURRENCY
+)
+results = runner.run(prompts, model="claude-sonnet-4-20250514")
+
+successes = sum(1 for result in results if result["response"])
+print(f"✅ Async Benchmarking to SQLite Completed: {successes}/{len(results)} succeeded.")
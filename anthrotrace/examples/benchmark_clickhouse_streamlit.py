@@ -1,6 +1,8 @@
 from anthrotrace.core.yaml_prompt_loader import load_prompts_with_categories
 from anthrotrace.core.clickhouse_prompt_log_repository import ClickHousePromptLogRepository
 from anthrotrace.core.anthropic_benchmark_sqlite_runner import AnthropicBenchmarkWithSQLite
+from anthrotrace.core.benchmark_results import build_failure_result
+from anthrotrace.core.result_pipeline import JsonlSink, RepositorySink, ResultPipeline
 from clickhouse_connect import get_client
 
 import concurrent.futures
@@ -15,50 +17,38 @@ PARALLEL_WORKERS = 5
 prompts = load_prompts_with_categories("anthrotrace/data/anthrotrace_common_prompts.yaml")
 random.shuffle(prompts)
 
-def run_prompt_to_clickhouse(prompt):
-    try:
-        # Per-thread ClickHouse client and repo
-        clickhouse_client = get_client(host="localhost", port=8123, username="default", password="")
-        clickhouse_repo = ClickHousePromptLogRepository(clickhouse_client)
+# One ClickHouse client and one spooled repository shared by every worker: rows are appended
+# to a local spool and replayed as a few large columnar inserts, so an outage loses nothing
+clickhouse_client = get_client(host="localhost", port=8123, username="default", password="")
+clickhouse_repo = ClickHousePromptLogRepository(clickhouse_client, spool_dir="data/spool/clickhouse", flush_rows=1000,
+                                                flush_interval=1.0)
+
+# Results are published once and fanned out to each sink; add sinks here rather than inserting by hand
+pipeline = ResultPipeline()
+pipeline.add_sink("clickhouse", RepositorySink(clickhouse_repo), batch_rows=1000)
+pipeline.add_sink("jsonl", JsonlSink("data/benchmark_results.jsonl"))
 
-        # Benchmark runner (per thread)
-        runner = AnthropicBenchmarkWithSQLite(
-            api_key=API_KEY,
-            metrics_exporter=None  # Optional if you want to disable Prometheus here
-        )
-        runner.sqlite_repo = None  # Disable SQLite insert
+# The Anthropic client is thread-safe, so the runner is shared too
+runner = AnthropicBenchmarkWithSQLite(
+    api_key=API_KEY,
+    metrics_exporter=None,  # Optional if you want to disable Prometheus here
+    pipeline=pipeline  # No SQLite file of its own
+)
 
+def run_prompt_to_clickhouse(prompt):
+    try:
         force_fail = random.random() < FORCE_FAILURE_RATE
         if force_fail:
             print(f"[FORCE-FAIL] {prompt['category']}")
-            clickhouse_repo.insert_log(
-                category=prompt["category"],
-                model="claude-sonnet-4-20250514",
-                prompt_text="!!! Intentional bad prompt for failure test !!!",
-                response=None,
-                input_tokens=0,
-                output_tokens=0,
-                duration=0.0,
-                cost=0.0
-            )
+            pipeline.publish(build_failure_result(prompt["category"], "claude-sonnet-4-20250514",
+                                                  "!!! Intentional bad prompt for failure test !!!"))
         else:
-            result = runner.run_and_return(
+            runner.run_and_return(  # Publishes the result to the pipeline
                 category=prompt["category"],
                 prompt_text=prompt["prompt_text"],
                 model="claude-sonnet-4-20250514"
             )
 
-            clickhouse_repo.insert_log(
-                category=result["category"],
-                model=result["model"],
-                prompt_text=result["prompt_text"],
-                response=result["response"],
-                input_tokens=result["input_tokens"],
-                output_tokens=result["output_tokens"],
-                duration=result["duration"],
-                cost=result["cost"]
-            )
-
         print(f"[SUCCESS] {prompt['category']} processed.")
 
     except Exception as e:
@@ -68,4 +58,6 @@ with concurrent.futures.ThreadPoolExecutor(max_workers=PARALLEL_WORKERS) as exec
     futures = [executor.submit(run_prompt_to_clickhouse, prompt) for prompt in prompts]
     concurrent.futures.wait(futures)
 
+pipeline.close()  # Drains every sink, then closes them (the ClickHouse repository replays its spool)
+
 print("✅ Parallel Benchmarking to ClickHouse Completed.")
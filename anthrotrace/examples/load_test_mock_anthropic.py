@@ -0,0 +1,35 @@
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.async_anthropic_benchmark_runner import AsyncAnthropicBenchmarkRunner
+from anthrotrace.core.mock_anthropic import LatencyDistribution, MockAnthropicBehavior, mock_async_anthropic_client
+
+import time
+
+REQUESTS = 20_000
+MAX_CONCURRENCY = 2_000
+CATEGORIES = ["Summarization", "Code Generation", "Bug Fixing", "Creative Writing"]
+
+# No network and no API key: every request is answered by the in-process mock transport.
+# Set time_scale=0 to drop the simulated latency and measure only our own pipeline's ceiling.
+behavior = MockAnthropicBehavior(
+    latency=LatencyDistribution.bimodal(fast_median=0.2, slow_median=1.5, slow_fraction=0.05),
+    output_tokens=(50, 400),
+    error_rates={429: 0.01, 500: 0.002, 529: 0.005},
+    time_scale=1.0,
+    seed=7
+)
+prompts = [
+    {"category": CATEGORIES[index % len(CATEGORIES)], "prompt_text": f"Load test prompt #{index}"}
+    for index in range(REQUESTS)
+]
+
+runner = AsyncAnthropicBenchmarkRunner(
+    client=mock_async_anthropic_client(behavior),
+    repository=SQLiteRepository(db_path="data/load_test_prompt_logs.db", write_behind=True),
+    max_concurrency=MAX_CONCURRENCY
+)
+start = time.perf_counter()
+results = runner.run(prompts)
+elapsed = time.perf_counter() - start
+
+print(f"✅ {len(results)} requests in {elapsed:.2f}s -> {len(results) / elapsed:.0f} requests/sec")
+print(f"Mock API replies by status: {behavior.stats()}")
@@ -1,51 +1,273 @@
-from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, start_http_server
+from collections import deque
+import os
 import threading
+import time
+
+from anthrotrace.core.benchmark_results import (
+    INTER_TOKEN_LATENCY_BUCKETS, OUTPUT_TOKENS_PER_SECOND_BUCKETS, TIME_TO_FIRST_TOKEN_BUCKETS
+)
+
+METRIC_TYPES = ("counter", "gauge", "histogram")
+
+# emit_result key -> (metric name, type, buckets); the names and types emit_result_metrics uses
+RESULT_METRICS = {
+    "tokens": ("prompt_total_tokens", "counter", None),
+    "cost": ("prompt_total_cost_usd", "counter", None),
+    "duration": ("prompt_avg_duration_seconds", "gauge", None),
+    "throttled": ("prompt_throttled_total", "counter", None),
+    "success": ("prompt_success_total", "counter", None),
+    "failure": ("prompt_failure_total", "counter", None),
+    "latency": ("prompt_latency_seconds", "histogram", None),
+    "cost_histogram": ("prompt_cost_per_run_usd", "histogram", None),
+    "tokens_histogram": ("prompt_total_tokens_histogram", "histogram", None),
+    "time_to_first_token": ("prompt_time_to_first_token_seconds", "histogram", TIME_TO_FIRST_TOKEN_BUCKETS),
+    "output_tokens_per_sec": ("prompt_output_tokens_per_second", "histogram", OUTPUT_TOKENS_PER_SECOND_BUCKETS),
+    "inter_token_latency": ("prompt_inter_token_latency_seconds", "histogram", INTER_TOKEN_LATENCY_BUCKETS),
+}
+
+
+def multiprocess_enabled():
+    """True when PROMETHEUS_MULTIPROC_DIR is set, i.e. several worker processes share one set of metrics."""
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+class _MetricFamilies:
+    """
+    One metric per name on a registry, with its label children cached. Queued runner results
+    are applied by flush(): once a second, before each scrape, and when `max_pending` are waiting.
+    """
+
+    def __init__(self, registry, flush_interval=1.0, max_pending=10_000):
+        self.registry = registry
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._families = {}
+        self._kinds = {}
+        self._children = {}
+        self._result_children = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = deque()
+        self._flusher = None
+        registry.register(_FlushOnCollect(self))  # Registered first, so it runs before the families are read
+
+    def child(self, name, labels, metric_type, buckets=None):
+        key = (name, tuple(labels.items()))
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                family = self._families.get(name)
+                if family is None:
+                    family = self._families[name] = self._create(name, list(labels), metric_type, buckets)
+                    self._kinds[name] = metric_type
+                child = family.labels(**labels) if labels else family
+                self._children[key] = child
+        return child
+
+    def kind(self, name):
+        return self._kinds.get(name)
+
+    def _create(self, name, label_names, metric_type, buckets):
+        from prometheus_client import Counter, Gauge, Histogram
+        if metric_type == "counter":
+            return Counter(name, f"{name} counter", label_names, registry=self.registry)
+        if metric_type == "gauge":
+            # In multiprocess mode a gauge is the sum over live workers
+            gauge_kwargs = {"multiprocess_mode": "livesum"} if multiprocess_enabled() else {}
+            return Gauge(name, f"{name} gauge", label_names, registry=self.registry, **gauge_kwargs)
+        if metric_type == "histogram":
+            return Histogram(name, f"{name} histogram", label_names, registry=self.registry,
+                             buckets=buckets or Histogram.DEFAULT_BUCKETS)
+        raise ValueError(f"Unknown metric type {metric_type!r}; expected one of {', '.join(METRIC_TYPES)}")
+
+    def record_result(self, entry):
+        self._pending.append(entry)
+        if self._flusher is None:
+            self._start_flusher()
+        if len(self._pending) >= self.max_pending:
+            self.flush()  # Back-pressure: the flusher is behind
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="anthrotrace-metrics-flush",
+                                                 daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[PROMETHEUS] Could not apply queued result metrics: {e}")
+
+    def flush(self):
+        """Apply every queued result to its metrics; returns the metric families this created."""
+        with self._flush_lock:
+            known = len(self._families)
+            batch = []
+            while self._pending:
+                batch.append(self._pending.popleft())
+            if batch:
+                self._apply_results(batch)
+            return list(self._families.values())[known:]
+
+    def _result_child(self, category, key):
+        children = self._result_children.get(category)
+        if children is None:
+            children = self._result_children[category] = {}
+        bound = children.get(key)
+        if bound is None:
+            name, metric_type, buckets = RESULT_METRICS[key]
+            if self.kind(name) not in (None, metric_type):
+                print(f"[PROMETHEUS] {name} is already a {self.kind(name)}; not recording it from results")
+                bound = children[key] = _DISCARDED
+            else:
+                bound = children[key] = self.child(name, {"category": category}, metric_type, buckets)
+        return bound
+
+    def _apply_results(self, batch):
+        totals = {}  # (category, key) -> counter increment
+        gauges = {}  # (category, key) -> last value
+        observations = {}  # (category, key) -> observed values
+        for category, outcome, total_tokens, cost, latency, time_to_first_token, output_tokens_per_sec, gaps in batch:
+            totals[category, "tokens"] = totals.get((category, "tokens"), 0) + total_tokens
+            totals[category, "cost"] = totals.get((category, "cost"), 0) + cost
+            totals[category, outcome] = totals.get((category, outcome), 0) + 1
+            observations.setdefault((category, "cost_histogram"), []).append(cost)
+            observations.setdefault((category, "tokens_histogram"), []).append(total_tokens)
+            if latency is not None:
+                gauges[category, "duration"] = latency
+                observations.setdefault((category, "latency"), []).append(latency)
+            if time_to_first_token is not None:
+                observations.setdefault((category, "time_to_first_token"), []).append(time_to_first_token)
+                if output_tokens_per_sec is not None:
+                    observations.setdefault((category, "output_tokens_per_sec"), []).append(output_tokens_per_sec)
+                if gaps:
+                    observations.setdefault((category, "inter_token_latency"), []).extend(gaps)
+        for (category, key), value in totals.items():
+            self._result_child(category, key).inc(value)
+        for (category, key), value in gauges.items():
+            self._result_child(category, key).set(value)
+        for (category, key), values in observations.items():
+            histogram = self._result_child(category, key)
+            for value in values:
+                histogram.observe(value)
+
+
+class _Discarded:
+    """Stands in for a result metric whose name is taken by a metric of another type."""
+
+    def inc(self, value=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+_DISCARDED = _Discarded()
+
+
+class _FlushOnCollect:
+    """Registry collector that applies queued results before a scrape reads the metrics."""
+
+    def __init__(self, families):
+        self.families = families
+
+    def collect(self):
+        # The registry listed its collectors before this ran, so families created by the flush go out here
+        for family in self.families.flush():
+            yield from family.collect()
 
 
 class PrometheusMetricsExporter:
+    """
+    Prometheus metrics on the exporter's own registry; exporters created without `registry` share
+    one process-wide registry. emit_result queues runner results until the next flush().
+    """
+
     _server_started = False
     _lock = threading.Lock()
+    _shared_families = None
 
-    def __init__(self, port=8000):
-        with PrometheusMetricsExporter._lock:
-            if not PrometheusMetricsExporter._server_started:
-                try:
-                    start_http_server(port)
-                    print(f"[PROMETHEUS] Metrics server started on http://localhost:{port}/metrics")
-                except OSError as e:
-                    print(f"[PROMETHEUS] Could not start metrics server on port {port}: {e}")
-                PrometheusMetricsExporter._server_started = True
-
-        self.registry = CollectorRegistry()
-        self.metrics = {}
-        self.histograms = {}
-        self.emitted_metrics_count = 0
-
-    def emit_metric(self, name, value, labels, metric_type="gauge"):
-        metric_key = (name, tuple(sorted(labels.items())))
+    def __init__(self, port=8000, start_server=True, registry=None):
+        from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+        if registry is None:
+            with PrometheusMetricsExporter._lock:
+                if PrometheusMetricsExporter._shared_families is None:
+                    PrometheusMetricsExporter._shared_families = _MetricFamilies(CollectorRegistry())
+            self._families = PrometheusMetricsExporter._shared_families
+        else:
+            self._families = _MetricFamilies(registry)
+        self.registry = self._families.registry
 
-        if metric_key not in self.metrics:
-            if metric_type == "counter":
-                self.metrics[metric_key] = Counter(name, f"{name} counter", labels.keys())
-            elif metric_type == "gauge":
-                self.metrics[metric_key] = Gauge(name, f"{name} gauge", labels.keys())
+        if start_server:
+            with PrometheusMetricsExporter._lock:
+                if not PrometheusMetricsExporter._server_started:
+                    try:
+                        if multiprocess_enabled():
+                            # Serve the values aggregated from every worker's files instead of this process only
+                            aggregate_registry = CollectorRegistry()
+                            multiprocess.MultiProcessCollector(aggregate_registry)
+                            start_http_server(port, registry=aggregate_registry)
+                        else:
+                            start_http_server(port, registry=self.registry)
+                        print(f"[PROMETHEUS] Metrics server started on http://localhost:{port}/metrics")
+                    except OSError as e:
+                        print(f"[PROMETHEUS] Could not start metrics server on port {port}: {e}")
+                    PrometheusMetricsExporter._server_started = True
 
-        metric = self.metrics[metric_key].labels(**labels)
+        self.emitted_metrics_count = 0
 
+    def emit_metric(self, name, value, labels, metric_type="gauge"):
+        """Set a gauge or increment a counter. A name first emitted as a gauge can also be incremented."""
+        child = self._families.child(name, labels, metric_type)
         if metric_type == "counter":
-            metric.inc(value)
-        elif metric_type == "gauge":
-            metric.set(value)
-
+            child.inc(value)
+        elif self._families.kind(name) == "counter":
+            raise ValueError(f"Metric {name!r} is a counter and cannot be set")
+        else:
+            child.set(value)
         self.emitted_metrics_count += 1
 
     def emit_histogram(self, name, value, buckets, labels):
-        metric_key = (name, tuple(sorted(labels.items())))
+        """Observe a value; `buckets` applies when the name is first emitted (None for the defaults)."""
+        self._families.child(name, labels, "histogram", buckets).observe(value)
+        self.emitted_metrics_count += 1
 
-        if metric_key not in self.histograms:
-            self.histograms[metric_key] = Histogram(
-                name, f"{name} histogram", labels.keys(), buckets=buckets
-            )
+    def emit_result(self, result, success=True):
+        """
+        Record the per-request metrics of one runner result, the same series that
+        benchmark_results.emit_result_metrics emits one call at a time.
+        """
+        if result.get("status") == "throttled":
+            # Rate limiting is a capacity signal, not a model failure; keep it out of the failure count
+            outcome = "throttled"
+        else:
+            outcome = "success" if success else "failure"
+        # Batch results and cache hits carry no API latency, so they stay out of the latency series
+        latency = result["duration"] if result.get("execution_mode") != "batch" and not result.get("cached") else None
+        time_to_first_token = result.get("time_to_first_token")
+        output_tokens_per_sec = result.get("output_tokens_per_sec")
+        gaps = result.get("inter_token_latencies") or ()
+        self._families.record_result((result["category"], outcome, result["input_tokens"] + result["output_tokens"],
+                                      result["cost"], latency, time_to_first_token, output_tokens_per_sec, gaps))
 
-        self.histograms[metric_key].labels(**labels).observe(value)
-        self.emitted_metrics_count += 1
+        emitted = 5 if latency is None else 7
+        if time_to_first_token is not None:
+            emitted += 1 + (output_tokens_per_sec is not None) + len(gaps)
+        self.emitted_metrics_count += emitted
+
+    def flush(self):
+        """Apply every result queued by emit_result now; runners call this before they return."""
+        self._families.flush()
+
+    def mark_process_dead(self, pid):
+        """Drop a finished worker's live gauges in multiprocess mode (counters and histograms are kept)."""
+        if multiprocess_enabled():
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(pid)
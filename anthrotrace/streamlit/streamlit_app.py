@@ -4,11 +4,15 @@ import pandas as pd
 from dateutil import tz
 import requests
 import time
+from itertools import islice
 
 from anthrotrace.core.benchmark_summary_service import BenchmarkSummaryService
 from anthrotrace.core.repository_adapter import RepositoryAdapter
 from anthrotrace.core.clickhouse_prompt_log_repository import ClickHousePromptLogRepository
 from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.parquet_archive import ParquetArchive
+from anthrotrace.core.tiered_repository import TieredPromptLogRepository
+from anthrotrace.core.prompt_log_schema import ALL_COLUMNS, TEXT_COLUMNS
 from clickhouse_connect import get_client
 from anthrotrace.metrics.prometheus_metrics_exporter import PrometheusMetricsExporter
 
@@ -42,6 +46,10 @@ if data_source == "ClickHouse":
         repo = None
 else:
     repo = SQLiteRepository(db_path="data/prompt_logs.db")
+    archive = ParquetArchive("data/archive")
+    if archive.partitions():
+        # Days moved out by anthrotrace.cli.archive_logs are still part of the history
+        repo = TieredPromptLogRepository(repo, archive)
 
 if repo is not None:
     adapter = RepositoryAdapter(repo)
@@ -69,7 +77,12 @@ start_date = st.sidebar.date_input("Start Date", value=local_now.date() - timede
 end_date = st.sidebar.date_input("End Date", value=local_now.date())
 
 bucket_options = ["1min", "5min", "15min", "30min"]
+BUCKET_SECONDS = {"1min": 60, "5min": 300, "15min": 900, "30min": 1800}
 selected_bucket = st.sidebar.selectbox("Aggregation Interval", bucket_options, index=0)
+drilldown_rows = st.sidebar.number_input("Drill-down Rows", min_value=100, max_value=1_000_000, value=1000, step=100)
+DRILLDOWN_COLUMNS = [column for column in ALL_COLUMNS if column not in TEXT_COLUMNS]
+CHART_COLUMNS = ["timestamp", "category", "model", "prompt_text", "input_tokens", "output_tokens", "duration", "cost",
+                 "success"]
 
 # ---- Filters ----
 if data_source == "ClickHouse":
@@ -102,6 +115,18 @@ if st.sidebar.button("Generate Summary"):
             col5.metric("Avg Output Tokens", summary["average_output_tokens"])
             col6.metric("Avg Cost (USD)", summary["average_cost_usd"])
 
+            if "latency_p50_sec" in summary:
+                # Merged from the repository's quantile sketches, not from the rows charted below
+                col7, col8, col9 = st.columns(3)
+                col7.metric("Latency p50 (sec)", summary["latency_p50_sec"])
+                col8.metric("Latency p90 (sec)", summary["latency_p90_sec"])
+                col9.metric("Latency p99 (sec)", summary["latency_p99_sec"])
+
+                col10, col11, col12 = st.columns(3)
+                col10.metric("Cost p50 (USD)", summary["cost_p50_usd"])
+                col11.metric("Cost p90 (USD)", summary["cost_p90_usd"])
+                col12.metric("Cost p99 (USD)", summary["cost_p99_usd"])
+
             st.markdown(f"**Last Run Timestamp:** {summary['last_run_timestamp']}")
 
             try:
@@ -111,34 +136,62 @@ if st.sidebar.button("Generate Summary"):
                 st.warning(f"Failed to emit Prometheus metrics: {e}")
 
             # ---- Charts ----
-            filtered_logs = adapter.query_logs(
-                category=None if selected_category == "All Categories" else selected_category,
-                model=None if selected_model == "All Models" else selected_model,
-                start_time=start_datetime,
-                end_time=end_datetime
-            )
-
-            if filtered_logs:
-                df = pd.DataFrame(filtered_logs)
-                st.dataframe(df, use_container_width=True)
+            filters = {
+                "category": None if selected_category == "All Categories" else selected_category,
+                "model": None if selected_model == "All Models" else selected_model,
+                "start_time": start_datetime,
+                "end_time": end_datetime,
+            }
+            if hasattr(repo, "fetch_logs_df"):
+                # Typed columns for the whole window; the response text is never fetched
+                df = repo.fetch_logs_df(columns=CHART_COLUMNS, **filters)
+            else:
+                df = pd.DataFrame(adapter.query_logs(**filters))
+                if not df.empty:
+                    df["success"] = df["response"].apply(lambda r: bool(r and str(r).strip()))
+
+            if not df.empty:
+                if hasattr(repo, "iter_logs"):
+                    # Stream just the rows shown, without the prompt/response text
+                    drilldown = pd.DataFrame(islice(repo.iter_logs(columns=DRILLDOWN_COLUMNS, **filters),
+                                                    int(drilldown_rows)))
+                    st.dataframe(drilldown, use_container_width=True)
+                else:
+                    st.dataframe(df, use_container_width=True)
 
                 df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, errors='coerce')
                 df["bucket"] = df["timestamp"].dt.floor(selected_bucket)
 
-                df["status"] = df["response"].apply(lambda r: "success" if r and str(r).strip() else "failure")
+                df["status"] = df["success"].map({True: "success", False: "failure"})
                 df["total_tokens"] = df["input_tokens"] + df["output_tokens"]
 
+                if hasattr(repo, "get_time_series"):
+                    # ClickHouse: charts are served from the per-minute rollup over the whole window
+                    series = pd.DataFrame(repo.get_time_series(bucket_seconds=BUCKET_SECONDS[selected_bucket], **filters))
+                    timeline = pd.DataFrame({
+                        "success": series["success_count"].values,
+                        "failure": (series["total_runs"] - series["success_count"]).values,
+                        "cost": series["cost"].values,
+                        "total_tokens": (series["input_tokens"] + series["output_tokens"]).values,
+                    }, index=pd.to_datetime(series["bucket_start"], utc=True)) if not series.empty else pd.DataFrame(
+                        columns=["success", "failure", "cost", "total_tokens"])
+                else:
+                    timeline = df.groupby(["bucket", "status"]).size().unstack(fill_value=0)
+                    timeline["cost"] = df.groupby("bucket")["cost"].sum()
+                    timeline["total_tokens"] = df.groupby("bucket")["total_tokens"].sum()
+                status_columns = [column for column in ("success", "failure") if column in timeline]
+
                 st.subheader(f"📈 Requests Over Time ({selected_bucket})")
-                st.line_chart(df.groupby(["bucket", "status"]).size().unstack(fill_value=0))
+                st.line_chart(timeline[status_columns])
 
                 st.subheader("💵 Total Cost Over Time")
-                st.line_chart(df.groupby("bucket")["cost"].sum())
+                st.line_chart(timeline["cost"])
 
                 st.subheader("🔢 Total Tokens Processed Over Time")
-                st.line_chart(df.groupby("bucket")["total_tokens"].sum())
+                st.line_chart(timeline["total_tokens"])
 
                 st.subheader("📊 Success vs Failure Percentage Over Time")
-                ratio = df.groupby(["bucket", "status"]).size().unstack(fill_value=0)
+                ratio = timeline[status_columns].copy()
                 ratio["total"] = ratio.sum(axis=1)
                 ratio["success_ratio"] = (ratio.get("success", 0) / ratio["total"]) * 100
                 ratio["failure_ratio"] = (ratio.get("failure", 0) / ratio["total"]) * 100
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from anthrotrace.core.anthropic_batch_runner import AnthropicBatchBenchmarkRunner
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+
+class FakeBatches:
+    """In-process stand-in for the Message Batches endpoint."""
+    def __init__(self, polls_until_ended=2):
+        self.batches = {}
+        self.polls_until_ended = polls_until_ended
+        self.polls = 0
+
+    def create(self, requests):
+        batch_id = f"msgbatch_{len(self.batches)}"
+        self.batches[batch_id] = requests
+        return SimpleNamespace(id=batch_id, processing_status="in_progress")
+
+    def retrieve(self, batch_id):
+        self.polls += 1
+        status = "ended" if self.polls % self.polls_until_ended == 0 else "in_progress"
+        return SimpleNamespace(id=batch_id, processing_status=status)
+
+    def results(self, batch_id):
+        for request in self.batches[batch_id]:
+            prompt = request["params"]["messages"][0]["content"]
+            if prompt == "bad":
+                yield SimpleNamespace(custom_id=request["custom_id"], result=SimpleNamespace(type="errored"))
+                continue
+            message = SimpleNamespace(
+                usage=SimpleNamespace(input_tokens=1000, output_tokens=2000),
+                content=[SimpleNamespace(text=f"answer to {prompt}")]
+            )
+            yield SimpleNamespace(custom_id=request["custom_id"], result=SimpleNamespace(type="succeeded", message=message))
+
+class TestAnthropicBatchBenchmarkRunner(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.repo = SQLiteRepository(db_path=self.db_path)
+        self.batches = FakeBatches()
+        client = SimpleNamespace(messages=SimpleNamespace(batches=self.batches))
+        self.runner = AnthropicBatchBenchmarkRunner(client=client, repository=self.repo, batch_size=2,
+                                                    poll_interval=0.001, insert_log_batch_size=2)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_run_splits_polls_and_stores(self):
+        prompts = [{'category': 'cat', 'prompt_text': p} for p in ['a', 'b', 'bad', 'c', 'd']]
+        results = self.runner.run(prompts)
+        self.assertEqual(len(self.batches.batches), 3)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(sum(1 for r in results if r['status'] == 'failure'), 1)
+        self.assertTrue(all(r['execution_mode'] == 'batch' for r in results))
+        full_price = (1000/1_000_000)*3.00 + (2000/1_000_000)*15.00
+        self.assertAlmostEqual(results[0]['cost'], full_price * 0.5)
+        logs = self.repo.fetch_logs(limit=10)
+        self.assertEqual(len(logs), 5)
+        self.assertEqual({log['execution_mode'] for log in logs}, {'batch'})
+
+    def test_unpriced_model_is_recorded_as_failure(self):
+        def cost_calculator(usage):
+            if usage['prompt_text'] == 'b':
+                raise ValueError('no pricing for model')
+            return 0.01
+        self.runner.cost_calculator = cost_calculator
+        prompts = [{'category': 'cat', 'prompt_text': p} for p in ['a', 'b', 'c']]
+        results = self.runner.run(prompts)
+        self.assertEqual([r['status'] for r in results], ['success', 'failure', 'success'])
+        self.assertEqual(results[1]['execution_mode'], 'batch')
+        self.assertEqual(len(self.repo.fetch_logs(limit=10)), 3)
+
+if __name__ == '__main__':
+    unittest.main()
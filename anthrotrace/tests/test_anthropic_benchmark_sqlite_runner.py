@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+from importlib.util import find_spec
+from types import SimpleNamespace
+from anthrotrace.core.anthropic_benchmark_sqlite_runner import AnthropicBenchmarkWithSQLite
+from anthrotrace.core.rate_governor import RateGovernor
+from anthrotrace.core.run_manifest import RunCheckpointer
+
+class RateLimited(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0"})
+
+class FakeRawMessages:
+    def __init__(self, throttle_first=0):
+        self.remaining_throttles = throttle_first
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.remaining_throttles:
+            self.remaining_throttles -= 1
+            raise RateLimited("rate limited")
+        response = SimpleNamespace(usage=SimpleNamespace(input_tokens=10, output_tokens=20),
+                                   content=[SimpleNamespace(text="answer")])
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+class FakeClient:
+    def __init__(self, throttle_first=0, fail_on=None):
+        raw = FakeRawMessages(throttle_first)
+        self.fail_on = fail_on
+        self.prompts = []
+        self.messages = SimpleNamespace(with_raw_response=raw, create=self._create)
+
+    def _create(self, **kwargs):
+        prompt = kwargs['messages'][-1]['content']
+        self.prompts.append(prompt)
+        if prompt == self.fail_on:
+            raise RuntimeError('boom')
+        return self.messages.with_raw_response.create(**kwargs).parse()
+
+class TestAnthropicBenchmarkWithSQLite(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+    def test_governor_retries_throttled_requests(self):
+        client = FakeClient(throttle_first=2)
+        governor = RateGovernor(base_backoff=0.001, max_backoff=0.001)
+        runner = AnthropicBenchmarkWithSQLite(None, db_path=self.db_path, client=client, governor=governor)
+        result = runner.run_and_return('cat', 'hello', run_id='run-1')
+        runner.close()
+        self.assertEqual(result['response'], 'answer')
+        self.assertEqual(client.messages.with_raw_response.calls, 3)
+        self.assertEqual(governor.throttle_events, 2)
+
+        governor = RateGovernor(max_retries=1, base_backoff=0.001, max_backoff=0.001)
+        runner = AnthropicBenchmarkWithSQLite(None, db_path=self.db_path, client=FakeClient(throttle_first=5),
+                                              governor=governor)
+        self.assertEqual(runner.run_and_return('cat', 'hello')['status'], 'throttled')
+        logs = runner.sqlite_repo.fetch_logs()
+        runner.close()
+        self.assertEqual([log['status'] for log in logs], ['throttled', 'success'])
+
+    def test_resume_only_retries_unfinished_prompts(self):
+        prompts = [{'category': 'cat', 'prompt_text': p} for p in ['p1', 'bad', 'p3']]
+        runner = AnthropicBenchmarkWithSQLite(None, db_path=self.db_path, client=FakeClient(fail_on='bad'),
+                                              write_behind=True)
+        checkpointer = RunCheckpointer(runner.sqlite_repo, run_id='run-2', flush_every=100)
+        results = runner.run(prompts, checkpointer=checkpointer)
+        self.assertEqual([result['status'] for result in results], ['success', 'failure', 'success'])
+        self.assertTrue(all(result['run_id'] == 'run-2' for result in results))
+        self.assertEqual(sorted(runner.sqlite_repo.fetch_checkpoints('run-2').values()),
+                         ['failure', 'success', 'success'])
+
+        client = FakeClient()
+        runner.client = client
+        resumed = runner.run(prompts, checkpointer=RunCheckpointer(runner.sqlite_repo, run_id='run-2'))
+        runner.close()
+        self.assertEqual(client.prompts, ['bad'])
+        self.assertEqual([result['status'] for result in resumed], ['success'])
+
+    @unittest.skipUnless(find_spec('anthropic') and find_spec('httpx'), 'anthropic is not installed')
+    def test_runs_against_the_mock_api(self):
+        from anthrotrace.core.mock_anthropic import LatencyDistribution, MockAnthropicBehavior, mock_anthropic_client
+        behavior = MockAnthropicBehavior(latency=LatencyDistribution.constant(0.0), output_tokens=5,
+                                         error_rates={500: 0.5}, seed=2)
+        runner = AnthropicBenchmarkWithSQLite(None, db_path=self.db_path, client=mock_anthropic_client(behavior))
+        results = [runner.run_and_return('cat', f'prompt {index}', run_id='run-1') for index in range(10)]
+        runner.stream = True
+        results.append(runner.run_and_return('cat', 'streamed', run_id='run-1'))
+        logs = runner.sqlite_repo.fetch_logs(limit=100)
+        runner.close()
+        statuses = {result['status'] for result in results}
+        self.assertEqual(statuses, {'success', 'failure'})
+        succeeded = [result for result in results if result['status'] == 'success']
+        self.assertTrue(all(result['output_tokens'] == 5 and result['run_id'] == 'run-1' for result in succeeded))
+        self.assertEqual(len(logs), 11)
+
+if __name__ == '__main__':
+    unittest.main()
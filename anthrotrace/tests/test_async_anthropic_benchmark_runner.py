@@ -0,0 +1,182 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from anthrotrace.core.async_anthropic_benchmark_runner import AsyncAnthropicBenchmarkRunner
+from anthrotrace.core.rate_governor import RateGovernor
+from anthrotrace.core.response_cache import ResponseCache
+
+class FakeMessages:
+    def __init__(self, fail_on=None):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_on = fail_on
+
+    async def create(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            prompt = kwargs["messages"][0]["content"]
+            if prompt == self.fail_on:
+                raise RuntimeError("boom")
+            return SimpleNamespace(
+                usage=SimpleNamespace(input_tokens=10, output_tokens=20),
+                content=[SimpleNamespace(text=f"answer to {prompt}")]
+            )
+        finally:
+            self.in_flight -= 1
+
+class RateLimited(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={})
+
+class FakeRawMessages:
+    def __init__(self, messages, throttle_first=1):
+        self.messages = messages
+        self.remaining_throttles = throttle_first
+
+    async def create(self, **kwargs):
+        if self.remaining_throttles:
+            self.remaining_throttles -= 1
+            raise RateLimited("rate limited")
+        response = await self.messages.create(**kwargs)
+        return SimpleNamespace(headers={"anthropic-ratelimit-requests-limit": "1000"}, parse=lambda: response)
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        await asyncio.sleep(0.01)
+        for chunk in self.chunks:
+            await asyncio.sleep(0.001)
+            yield chunk
+
+    async def get_final_message(self):
+        return SimpleNamespace(
+            usage=SimpleNamespace(input_tokens=10, output_tokens=len(self.chunks)),
+            content=[SimpleNamespace(text="".join(self.chunks))]
+        )
+
+class FakeAsyncClient:
+    def __init__(self, fail_on=None):
+        self.messages = FakeMessages(fail_on)
+        self.messages.with_raw_response = FakeRawMessages(self.messages)
+        self.messages.stream = lambda **kwargs: FakeStream(["Hello", " ", "world", "!"])
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+class RecordingRepo:
+    def __init__(self):
+        self.rows = []
+
+    def insert_result(self, result):
+        self.rows.append(result)
+
+class QueueingExporter:
+    """Queues results like PrometheusMetricsExporter.emit_result and applies them on flush()."""
+    def __init__(self):
+        self.queued = []
+        self.applied = []
+
+    def emit_result(self, result, success=True):
+        self.queued.append(result)
+
+    def flush(self):
+        self.applied.extend(self.queued)
+        self.queued = []
+
+class TestAsyncAnthropicBenchmarkRunner(unittest.TestCase):
+    def test_run_respects_concurrency_and_keeps_order(self):
+        client = FakeAsyncClient()
+        repo = RecordingRepo()
+        runner = AsyncAnthropicBenchmarkRunner(client=client, repository=repo, max_concurrency=4)
+        prompts = [{'category': 'cat', 'prompt_text': f'p{i}'} for i in range(20)]
+        results = runner.run(prompts)
+        self.assertEqual(len(results), 20)
+        self.assertEqual([r['prompt_text'] for r in results], [p['prompt_text'] for p in prompts])
+        self.assertEqual(client.messages.max_in_flight, 4)
+        self.assertEqual(len(repo.rows), 20)
+        # An injected client is the caller's to close
+        self.assertFalse(client.closed)
+        asyncio.run(runner.aclose())
+        self.assertTrue(client.closed)
+        with self.assertRaises(RuntimeError):
+            runner.run(prompts)
+        expected_cost = (10/1_000_000)*3.00 + (20/1_000_000)*15.00
+        self.assertAlmostEqual(results[0]['cost'], expected_cost)
+
+    def test_run_twice_persists_both_runs(self):
+        repo = RecordingRepo()
+        runner = AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(), repository=repo, max_concurrency=2)
+        first = runner.run([{'category': 'cat', 'prompt_text': f'p{i}'} for i in range(3)])
+        second = runner.run([{'category': 'cat', 'prompt_text': f'q{i}'} for i in range(4)])
+        self.assertEqual([r['status'] for r in first + second], ['success'] * 7)
+        self.assertEqual(sorted(row['prompt_text'] for row in repo.rows[3:]), [f'q{i}' for i in range(4)])
+        self.assertEqual(len(repo.rows), 7)
+
+    def test_run_flushes_queued_metrics(self):
+        exporter = QueueingExporter()
+        runner = AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(fail_on='p1'), metrics_exporter=exporter)
+        runner.run([{'category': 'cat', 'prompt_text': f'p{i}'} for i in range(3)])
+        self.assertEqual(exporter.queued, [])
+        self.assertEqual(len(exporter.applied), 3)
+
+    def test_failure_result(self):
+        runner = AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(fail_on='bad'), max_concurrency=2)
+        results = runner.run([{'category': 'cat', 'prompt_text': 'bad'}, {'category': 'cat', 'prompt_text': 'ok'}])
+        self.assertIsNone(results[0]['response'])
+        self.assertEqual(results[0]['input_tokens'], 0)
+        self.assertEqual(results[1]['response'], 'answer to ok')
+
+    def test_governor_retries_throttled_requests(self):
+        governor = RateGovernor(base_backoff=0.001, max_backoff=0.001)
+        runner = AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(), governor=governor)
+        results = runner.run([{'category': 'cat', 'prompt_text': 'p'}])
+        self.assertEqual(results[0]['status'], 'success')
+        self.assertEqual(governor.throttle_events, 1)
+        self.assertIsNotNone(governor.buckets['requests'])
+
+    def test_stream_mode_records_token_timing(self):
+        runner = AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(), stream=True)
+        result = runner.run([{'category': 'cat', 'prompt_text': 'p'}])[0]
+        self.assertEqual(result['response'], 'Hello world!')
+        self.assertEqual(result['output_tokens'], 4)
+        self.assertGreaterEqual(result['time_to_first_token'], 0.01)
+        self.assertLess(result['time_to_first_token'], result['duration'])
+        self.assertEqual(len(result['inter_token_latencies']), 3)
+        self.assertGreater(result['output_tokens_per_sec'], 0)
+
+    def test_response_cache_serves_repeated_prompts(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ResponseCache(os.path.join(tmpdir, 'cache.db'))
+            client = FakeAsyncClient()
+            calls = []
+            original_create = client.messages.create
+
+            async def counting_create(**kwargs):
+                calls.append(kwargs)
+                return await original_create(**kwargs)
+            client.messages.create = counting_create
+
+            AsyncAnthropicBenchmarkRunner(client=client, response_cache=cache).run([{'category': 'cat', 'prompt_text': 'p'}])
+            results = AsyncAnthropicBenchmarkRunner(client=client, response_cache=cache).run([{'category': 'cat', 'prompt_text': 'p'}])
+            cache.close()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[0]['cached'], 1)
+        self.assertEqual(results[0]['cost'], 0.0)
+        self.assertEqual(results[0]['response'], 'answer to p')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from types import SimpleNamespace
+from anthrotrace.core.benchmark_results import (
+    build_message_params, build_result, emit_result_metrics, streaming_stats, usage_counts
+)
+
+class RecordingExporter:
+    def __init__(self):
+        self.histograms = []
+        self.metrics = []
+
+    def emit_metric(self, name, value, labels, metric_type="gauge"):
+        self.metrics.append(name)
+
+    def emit_histogram(self, name, value, buckets, labels):
+        self.histograms.append((name, value))
+
+class TestBenchmarkResults(unittest.TestCase):
+    def test_streaming_stats(self):
+        stats = streaming_stats(10.0, [10.5, 10.6, 10.8, 11.5], 11.5, 10)
+        self.assertAlmostEqual(stats['time_to_first_token'], 0.5)
+        self.assertAlmostEqual(stats['output_tokens_per_sec'], 10.0)
+        self.assertAlmostEqual(stats['inter_token_latency_p50'], 0.2)
+        self.assertAlmostEqual(stats['inter_token_latency_max'], 0.7)
+        self.assertEqual(len(stats['inter_token_latencies']), 3)
+
+    def test_streaming_stats_without_chunks(self):
+        stats = streaming_stats(10.0, [], 11.0, 0)
+        self.assertIsNone(stats['time_to_first_token'])
+        self.assertEqual(stats['inter_token_latencies'], [])
+
+    def test_emit_streaming_histograms(self):
+        result = build_result('cat', 'model', 'prompt', 'resp', 1, 4, 1.5, 0.01)
+        result.update(streaming_stats(10.0, [10.5, 10.6, 10.8, 11.5], 11.5, 4))
+        exporter = RecordingExporter()
+        emit_result_metrics(exporter, result)
+        names = [name for name, _ in exporter.histograms]
+        self.assertIn('prompt_time_to_first_token_seconds', names)
+        self.assertIn('prompt_output_tokens_per_second', names)
+        self.assertEqual(names.count('prompt_inter_token_latency_seconds'), 3)
+        self.assertIn('prompt_success_total', exporter.metrics)
+
+    def test_build_message_params_with_prompt_caching(self):
+        prefix = [{'role': 'user', 'content': 'Example question'}, {'role': 'assistant', 'content': 'Example answer'}]
+        params = build_message_params('Real question', system_prompt='Long shared instructions',
+                                      prefix_messages=prefix, prompt_caching=True)
+        self.assertEqual(params['system'][0]['cache_control'], {'type': 'ephemeral'})
+        self.assertEqual(params['messages'][1]['content'][-1]['cache_control'], {'type': 'ephemeral'})
+        self.assertEqual(params['messages'][-1], {'role': 'user', 'content': 'Real question'})
+        self.assertEqual(prefix[1]['content'], 'Example answer')
+
+    def test_build_message_params_default(self):
+        params = build_message_params('Question')
+        self.assertEqual(params['system'], 'You are a helpful assistant.')
+        self.assertEqual(params['messages'], [{'role': 'user', 'content': 'Question'}])
+
+    def test_usage_counts(self):
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5, cache_creation_input_tokens=None, cache_read_input_tokens=900)
+        self.assertEqual(usage_counts(usage), {'input_tokens': 10, 'output_tokens': 5,
+                                               'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 900})
+        self.assertEqual(usage_counts(SimpleNamespace(input_tokens=1, output_tokens=2))['cache_read_input_tokens'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
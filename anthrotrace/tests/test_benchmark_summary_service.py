@@ -20,9 +20,44 @@ class TestBenchmarkSummaryService(unittest.TestCase):
         self.assertAlmostEqual(summary['average_output_tokens'], 7.5)
         self.assertAlmostEqual(summary['average_cost_usd'], 0.015)
         self.assertAlmostEqual(summary['average_latency_sec'], 1.35)
+        self.assertAlmostEqual(summary['latency_p50_sec'], 1.5, delta=0.02)
+        self.assertAlmostEqual(summary['latency_p99_sec'], 1.5, delta=0.02)
+        self.assertAlmostEqual(summary['cost_p99_usd'], 0.02, delta=0.0002)
         self.assertEqual(summary['category'], 'A')
         self.assertEqual(summary['model'], 'M1')
 
+    def test_throttled_runs_excluded_from_success_ratio(self):
+        class ThrottledRepo(DummyRepo):
+            def query_logs(self, **kwargs):
+                logs = DummyRepo.query_logs(self)
+                logs[0]['status'] = 'success'
+                logs.append({'category': 'A', 'model': 'M1', 'input_tokens': 0, 'output_tokens': 0, 'cost': 0.0, 'duration': 0.0, 'response': None, 'status': 'throttled', 'timestamp': '2024-06-03T00:00:00'})
+                return logs
+        summary = BenchmarkSummaryService(ThrottledRepo()).get_summary()
+        self.assertEqual(summary['total_runs'], 3)
+        self.assertEqual(summary['throttled_count'], 1)
+        self.assertEqual(summary['failure_count'], 1)
+        self.assertEqual(summary['success_ratio'], 50.0)
+
+    def test_uses_repository_aggregate_summary(self):
+        class AggregatingRepo:
+            def aggregate_summary(self, **filters):
+                self.filters = filters
+                return {'total_runs': 4, 'success_count': 2, 'failure_count': 1, 'throttled_count': 1,
+                        'cached_count': 1, 'input_tokens': 40, 'output_tokens': 20, 'cost': 0.04,
+                        'average_latency_sec': 1.234, 'last_timestamp': '2024-06-02T00:00:00.000+00:00'}
+            def query_logs(self, **filters):
+                raise AssertionError("rows should not be fetched")
+        repo = AggregatingRepo()
+        summary = BenchmarkSummaryService(repo).get_summary(category='A', start_time='2024-06-01T00:00:00')
+        self.assertEqual(repo.filters['category'], 'A')
+        self.assertEqual(repo.filters['start_time'], '2024-06-01T00:00:00')
+        self.assertEqual(summary['average_input_tokens'], 10.0)
+        self.assertEqual(summary['success_ratio'], 66.67)
+        self.assertEqual(summary['average_latency_sec'], 1.23)
+        self.assertEqual(summary['last_run_timestamp'], '2024-06-02T00:00:00')
+        self.assertNotIn('latency_p50_sec', summary)  # The repository reported no quantiles
+
 if __name__ == '__main__':
     yaml_path = os.path.join(os.path.dirname(__file__), "../data/anthrotrace_common_prompts.yaml")
     prompts = load_prompts_with_categories(yaml_path)
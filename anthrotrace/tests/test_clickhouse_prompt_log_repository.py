@@ -1,4 +1,10 @@
+import time
 import unittest
+import tempfile
+import shutil
+import json
+from datetime import datetime
+from importlib.util import find_spec
 from anthrotrace.core.clickhouse_prompt_log_repository import ClickHousePromptLogRepository
 
 class DummyClickHouseClient:
@@ -9,10 +15,299 @@ class DummyClickHouseClient:
             result_rows = []
         return Result()
 
+class RecordingClickHouseClient(DummyClickHouseClient):
+    def __init__(self, fail_inserts=0):
+        self.inserts = []
+        self.fail_inserts = fail_inserts
+
+    def insert(self, table, data, column_names=None, column_oriented=False, settings=None):
+        if self.fail_inserts:
+            self.fail_inserts -= 1
+            raise ConnectionError("ClickHouse unavailable")
+        self.inserts.append((table, data, column_names, column_oriented, settings))
+
+class QueryRecordingClient(DummyClickHouseClient):
+    def __init__(self):
+        self.commands = []
+        self.queries = []
+
+    def command(self, query, *args, **kwargs):
+        self.commands.append(query)
+
+    def query(self, query, *args, **kwargs):
+        self.queries.append(query)
+        return super().query(query, *args, **kwargs)
+
+class StreamingClickHouseClient(DummyClickHouseClient):
+    def __init__(self, rows):
+        self.rows = rows
+        self.stream_calls = []
+        self.closed = False
+
+    def query_row_block_stream(self, query, parameters=None, settings=None):
+        self.stream_calls.append((query, parameters, settings))
+        client = self
+
+        class Stream:
+            def __enter__(self):
+                size = settings['max_block_size']
+                return iter([client.rows[i:i + size] for i in range(0, len(client.rows), size)])
+            def __exit__(self, *exc_info):
+                client.closed = True
+        return Stream()
+
+class FrameClickHouseClient(DummyClickHouseClient):
+    def __init__(self):
+        self.frame_queries = []
+
+    def query_df(self, query, parameters=None):
+        self.frame_queries.append(('df', query, parameters))
+        return 'frame'
+
+    def query_arrow(self, query, parameters=None):
+        self.frame_queries.append(('arrow', query, parameters))
+        return 'table'
+
+class SpoolKeyClickHouseClient(RecordingClickHouseClient):
+    """Remembers inserted spool keys and answers the replayer's lookup of them."""
+    def __init__(self, fail_inserts=0):
+        super().__init__(fail_inserts)
+        self.commands = []
+
+    def command(self, query, *args, **kwargs):
+        self.commands.append(query)
+
+    def query(self, query, parameters=None, **kwargs):
+        class Result:
+            result_rows = []
+        if 'spool_key IN' in query:
+            stored = {key for _, data, column_names, _, _ in self.inserts for key in data[column_names.index('spool_key')]}
+            Result.result_rows = [(key,) for key in parameters[-1] if key in stored]
+        return Result()
+
+class ChdbClient:
+    """The parts of a clickhouse_connect client the repository uses, over an embedded chdb session."""
+    def __init__(self, path):
+        from chdb import session
+        self.session = session.Session(path)
+        self.session.query("CREATE DATABASE IF NOT EXISTS db ENGINE = Atomic")
+        self.session.query("USE db")
+
+    @staticmethod
+    def _literal(value):
+        if value is None:
+            return 'NULL'
+        if isinstance(value, datetime):
+            return f"'{value:%Y-%m-%d %H:%M:%S.%f}'"
+        if isinstance(value, str):
+            return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+        return repr(value)
+
+    def _bind(self, query, parameters):
+        return query % tuple(self._literal(value) for value in parameters) if parameters else query
+
+    def command(self, query, parameters=None, settings=None):
+        output = self.session.query(self._bind(query, parameters), 'TabSeparated').bytes().decode().strip()
+        return int(output) if output.isdigit() else output
+
+    def query(self, query, parameters=None, settings=None):
+        data = json.loads(self.session.query(self._bind(query, parameters), 'JSONCompact').bytes() or b'{"data": []}')
+        class Result:
+            result_rows = [tuple(row) for row in data['data']]
+        return Result()
+
+    def insert(self, table, data, column_names=None, column_oriented=False, settings=None):
+        rows = zip(*data) if column_oriented else data
+        values = ', '.join('(' + ', '.join(self._literal(value) for value in row) + ')' for row in rows)
+        self.session.query(f"INSERT INTO {table} ({', '.join(column_names)}) VALUES {values}")
+
+def make_result(index):
+    return {'category': 'cat', 'model': 'model', 'prompt_text': f'prompt {index}', 'response': 'resp',
+            'input_tokens': 1, 'output_tokens': 2, 'duration': 0.5, 'cost': 0.01,
+            'timestamp': '2024-06-01T00:00:00+00:00', 'status': 'success'}
+
 class TestClickHousePromptLogRepository(unittest.TestCase):
     def test_can_instantiate(self):
         repo = ClickHousePromptLogRepository(clickhouse_client=DummyClickHouseClient())
         self.assertIsInstance(repo, ClickHousePromptLogRepository)
 
+    def test_insert_results_is_one_columnar_insert(self):
+        client = RecordingClickHouseClient()
+        repo = ClickHousePromptLogRepository(clickhouse_client=client, async_insert=True)
+        repo.insert_results([make_result(index) for index in range(3)])
+        self.assertEqual(len(client.inserts), 1)
+        table, data, column_names, column_oriented, settings = client.inserts[0]
+        self.assertTrue(column_oriented)
+        self.assertEqual(data[column_names.index('prompt_text')], ['prompt 0', 'prompt 1', 'prompt 2'])
+        self.assertEqual(settings, {'async_insert': 1, 'wait_for_async_insert': 1})
+
+    def test_buffered_inserts_flush_by_size_and_on_demand(self):
+        client = RecordingClickHouseClient()
+        repo = ClickHousePromptLogRepository(clickhouse_client=client, buffered=True, flush_rows=5, flush_interval=3600)
+        for index in range(5):
+            repo.insert_result(make_result(index))
+        deadline = time.monotonic() + 5
+        while not client.inserts and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(client.inserts[0][1][0]), 5)
+        repo.insert_results([make_result(5), make_result(6)])
+        self.assertEqual(len(client.inserts), 1)  # Below flush_rows: still buffered
+        repo.record_checkpoints('run-1', [('p1', 'success', '2024-06-01T00:00:00')])  # Flushes results first
+        self.assertEqual([insert[0] for insert in client.inserts], ['prompt_logs', 'prompt_logs', 'run_checkpoints'])
+        repo.close()
+        self.assertEqual(repo.stats['rows_inserted'], 7)
+
+    def test_failed_flush_keeps_rows(self):
+        client = RecordingClickHouseClient(fail_inserts=1)
+        repo = ClickHousePromptLogRepository(clickhouse_client=client, buffered=True, flush_rows=100, flush_interval=3600)
+        repo.insert_results([make_result(index) for index in range(3)])
+        repo.flush()
+        self.assertEqual(client.inserts, [])
+        repo.close()
+        self.assertEqual(len(client.inserts[0][1][0]), 3)
+        self.assertEqual(repo.stats['insert_errors'], 1)
+
+    def test_spooled_rows_survive_an_outage_and_replay_exactly_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        client = SpoolKeyClickHouseClient(fail_inserts=1)
+        repo = ClickHousePromptLogRepository(clickhouse_client=client, spool_dir=directory, flush_rows=100,
+                                             flush_interval=3600)
+        self.assertTrue(any('spool_key' in command for command in client.commands))
+        repo.insert_results([make_result(index) for index in range(3)])
+        repo.flush()  # ClickHouse is down: nothing is lost, the rows wait on disk
+        self.assertEqual(client.inserts, [])
+        self.assertEqual(repo.spool.depth()['rows'], 3)
+        repo.flush()
+        self.assertEqual(len(client.inserts), 1)
+        self.assertEqual(repo.spool.depth()['rows'], 0)
+
+        # A crash after the insert but before the spool commit: the next process skips the rows that landed
+        repo.insert_results([make_result(index) for index in range(3, 5)])
+        def crash(position, rows):
+            raise OSError('crashed')
+        repo.spool.commit = crash
+        repo.flush()
+        repo.close()
+        self.assertEqual(len(client.inserts), 2)
+        repo = ClickHousePromptLogRepository(clickhouse_client=client, spool_dir=directory, flush_rows=100,
+                                             flush_interval=3600)
+        repo.close()
+        self.assertEqual(repo.stats['rows_deduplicated'], 2)
+        keys = [key for _, data, column_names, _, _ in client.inserts for key in data[column_names.index('spool_key')]]
+        self.assertEqual(len(keys), 5)
+        self.assertEqual(len(set(keys)), 5)
+        with self.assertRaises(ValueError):
+            ClickHousePromptLogRepository(clickhouse_client=client, buffered=True, spool_dir=directory)
+
+    def test_rollup_is_created_and_backfilled(self):
+        client = QueryRecordingClient()
+        repo = ClickHousePromptLogRepository(clickhouse_client=client)
+        self.assertTrue(repo.rollup_enabled)
+        self.assertTrue(any('AggregatingMergeTree' in command for command in client.commands))
+        self.assertIn('TRUNCATE TABLE prompt_logs_rollup_1m', client.commands)
+        view = next(command for command in client.commands if 'MATERIALIZED VIEW' in command)
+        backfill = next(command for command in client.commands if command.startswith('INSERT INTO prompt_logs_rollup_1m'))
+        # The view and the backfill split the rows at one cutoff, so none is counted by both
+        self.assertIn('WHERE timestamp >= toDateTime64(', view)
+        self.assertIn('WHERE timestamp < %s', backfill)
+        # Then the view drops the cutoff, so rows inserted later with older timestamps still reach the rollup
+        modify = client.commands[client.commands.index(backfill) + 1]
+        self.assertTrue(modify.startswith('ALTER TABLE prompt_logs_rollup_1m_mv MODIFY QUERY'))
+        self.assertNotIn('WHERE', modify)
+
+    @unittest.skipUnless(find_spec('chdb'), 'chdb is not installed')
+    def test_rollup_matches_raw_rows(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        repo = ClickHousePromptLogRepository(clickhouse_client=ChdbClient(directory))
+        # Backdated rows inserted after the rollup was built, one of them exactly on the window's end
+        for minute in range(5):
+            repo.insert_log('cat', 'model', f'p{minute}', 'ok', 10, 5, 1.0 + minute, 0.01,
+                            timestamp=datetime(2024, 6, 1, 0, minute))
+        window = {'start_time': '2024-06-01T00:01:00', 'end_time': '2024-06-01T00:03:00'}
+        self.assertTrue(repo._uses_rollup(**window))
+        from_rollup = repo.aggregate_summary(**window)
+        series = repo.get_time_series(bucket_seconds=60, **window)
+        repo.rollup_enabled = False
+        from_raw = repo.aggregate_summary(**window)
+        self.assertEqual(from_rollup['total_runs'], 3)
+        for name in ('total_runs', 'input_tokens', 'duration_sum', 'latency_count', 'last_timestamp'):
+            self.assertEqual(from_rollup[name], from_raw[name])
+        self.assertEqual(series, repo.get_time_series(bucket_seconds=60, **window))
+
+    def test_queries_read_rollup_when_window_allows(self):
+        client = QueryRecordingClient()
+        repo = ClickHousePromptLogRepository(clickhouse_client=client)
+        repo.get_aggregated_stats(start_time='2024-06-01T00:00:00', end_time='2024-06-02T00:00:00')
+        repo.get_time_series(bucket_seconds=300)
+        self.assertIsNone(repo.aggregate_summary(category='cat'))
+        self.assertTrue(all('FROM prompt_logs_rollup_1m' in query for query in client.queries))
+
+        client.queries.clear()
+        repo.get_aggregated_stats(start_time='2024-06-01T00:00:30')
+        repo.get_time_series(bucket_seconds=30)
+        self.assertTrue(all('FROM prompt_logs\n' in query for query in client.queries))
+
+    def test_iter_logs_streams_blocks_of_projected_columns(self):
+        client = StreamingClickHouseClient([('cat', 0.01 * i) for i in range(5)])
+        repo = ClickHousePromptLogRepository(clickhouse_client=client)
+        logs = list(repo.iter_logs(category='cat', batch_size=2, columns=['category', 'cost']))
+        self.assertEqual([log['cost'] for log in logs], [0.01 * i for i in range(5)])
+        query, parameters, settings = client.stream_calls[0]
+        self.assertIn('SELECT category, cost', query)
+        self.assertEqual(parameters, ['cat'])
+        self.assertEqual(settings, {'max_block_size': 2})
+        self.assertTrue(client.closed)
+        with self.assertRaises(ValueError):
+            next(repo.iter_logs(columns=['no_such_column']))
+
+    def test_columnar_fetch_uses_native_result_formats(self):
+        client = FrameClickHouseClient()
+        repo = ClickHousePromptLogRepository(clickhouse_client=client)
+        self.assertEqual(repo.fetch_logs_df(model='m', columns=['timestamp', 'cost', 'success'], limit=10), 'frame')
+        self.assertEqual(repo.fetch_logs_arrow(), 'table')
+        kind, query, parameters = client.frame_queries[0]
+        self.assertIn("SELECT timestamp, cost, CAST(response != '' AS Bool) AS success FROM prompt_logs WHERE model = %s", query)
+        self.assertTrue(query.endswith('LIMIT 10'))
+        self.assertEqual(parameters, ['m'])
+        self.assertEqual(client.frame_queries[1][0], 'arrow')
+        with self.assertRaises(ValueError):
+            repo.fetch_logs_df(columns=['1; DROP TABLE prompt_logs'])
+
+    def test_text_columns_use_low_cardinality_and_zstd(self):
+        client = QueryRecordingClient()
+        repo = ClickHousePromptLogRepository(clickhouse_client=client)
+        create = next(command for command in client.commands if 'CREATE TABLE IF NOT EXISTS prompt_logs ' in command)
+        self.assertIn('prompt_text LowCardinality(String) CODEC(ZSTD(3))', create)
+        self.assertIn('response String CODEC(ZSTD(3))', create)
+        client.commands.clear()
+        repo.compact_text_columns()
+        self.assertIn('ALTER TABLE prompt_logs MODIFY COLUMN category LowCardinality(String)', client.commands)
+
+    def test_category_summaries_merge_tdigest_quantiles_server_side(self):
+        class SummaryClient(QueryRecordingClient):
+            def command(self, query, *args, **kwargs):
+                super().command(query)
+                return 1 if query == 'EXISTS TABLE prompt_logs_rollup_1m_mv' else 0
+
+            def query(self, query, *args, **kwargs):
+                self.queries.append(query)
+                class Result:
+                    result_rows = [('cat', 4, 3, 1, 0, 40, 80, 0.4, 6.0, 6.0, 3, '2024-06-01 00:00:00',
+                                    [1.0, 2.0, 2.5, 3.0], [0.1, 0.1, 0.2, 0.2])]
+                return Result()
+
+        client = SummaryClient()
+        repo = ClickHousePromptLogRepository(clickhouse_client=client)
+        # The view exists, so the rollup is kept as it is
+        self.assertFalse(any(command.startswith(('TRUNCATE', 'INSERT INTO')) for command in client.commands))
+        [summary] = repo.get_category_summaries(start_time='2024-06-01T00:00:00')
+        self.assertEqual(summary['category'], 'cat')
+        self.assertEqual(summary['latency_p90_sec'], 2.0)
+        self.assertEqual(summary['cost_p99_usd'], 0.2)
+        self.assertIn('quantilesTDigestMerge(0.5, 0.9, 0.95, 0.99)(cost_quantiles)', client.queries[-1])
+        self.assertIn('GROUP BY category', client.queries[-1])
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
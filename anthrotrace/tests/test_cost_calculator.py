@@ -30,6 +30,32 @@ class TestCostCalculator(unittest.TestCase):
         cost = calculate_cost(context)
         self.assertEqual(cost, 0.0)
 
+    def test_calculate_cost_batch_discount(self):
+        context = {
+            'model': 'claude-sonnet-4-20250514',
+            'input_tokens': 1000,
+            'output_tokens': 2000,
+            'batch': True
+        }
+        expected = ((1000/1_000_000)*3.00 + (2000/1_000_000)*15.00) * 0.5
+        self.assertAlmostEqual(calculate_cost(context), expected)
+
+    def test_calculate_cost_prompt_cache_tokens(self):
+        context = {
+            'model': 'claude-sonnet-4-20250514',
+            'input_tokens': 100,
+            'output_tokens': 200,
+            'cache_creation_input_tokens': 1000,
+            'cache_read_input_tokens': 10000
+        }
+        expected = (100/1_000_000)*3.00 + (200/1_000_000)*15.00 + (1000/1_000_000)*3.75 + (10000/1_000_000)*0.30
+        self.assertAlmostEqual(calculate_cost(context), expected)
+
+    def test_make_cost_calculator_default_cache_rates(self):
+        my_cost_fn = make_cost_calculator({'my-model': {'input': 2.0, 'output': 4.0}})
+        context = {'model': 'my-model', 'cache_creation_input_tokens': 1_000_000, 'cache_read_input_tokens': 1_000_000}
+        self.assertAlmostEqual(my_cost_fn(context), 2.0 * 1.25 + 2.0 * 0.1)
+
     def test_make_cost_calculator(self):
         my_pricing = {
             'my-model': {'input': 2.0, 'output': 4.0}
@@ -0,0 +1,115 @@
+import unittest
+from importlib.util import find_spec
+from anthrotrace.core.in_memory_repository import InMemoryPromptLogRepository
+
+def result(i, category='Summarization', model='claude-3-haiku', status='success', execution_mode='standard', cached=0):
+    return {
+        'category': category, 'model': model, 'prompt_text': f'prompt {i % 3}',
+        'response': '' if status != 'success' else f'answer {i}', 'input_tokens': 10, 'output_tokens': 20,
+        'duration': float(i), 'cost': 0.5, 'timestamp': f'2024-06-15T08:00:{i:02d}', 'status': status,
+        'execution_mode': execution_mode, 'cached': cached,
+    }
+
+class TestInMemoryPromptLogRepository(unittest.TestCase):
+    def setUp(self):
+        self.repo = InMemoryPromptLogRepository()
+        self.repo.insert_results([result(i) for i in range(1, 6)])
+        self.repo.insert_result(result(6, category='Code Generation', status='throttled'))
+        self.repo.insert_result(result(7, model='claude-3-opus', execution_mode='batch'))
+
+    def test_fetch_logs_filters_newest_first(self):
+        logs = self.repo.fetch_logs(category='Summarization', model='claude-3-haiku', limit=3)
+        self.assertEqual([log['duration'] for log in logs], [5.0, 4.0, 3.0])
+        self.assertEqual(logs[0]['timestamp'], '2024-06-15T08:00:05.000+00:00')
+        self.assertEqual(logs[0]['prompt_text'], 'prompt 2')
+        self.assertIsNone(logs[0]['time_to_first_token'])
+        window = self.repo.fetch_logs(start_time='2024-06-15T08:00:02', end_time='2024-06-15T08:00:03')
+        self.assertEqual([log['duration'] for log in window], [3.0, 2.0])
+        self.assertEqual(self.repo.fetch_logs(category='Unknown'), [])
+
+    def test_iter_logs_projects_columns(self):
+        logs = list(self.repo.iter_logs(batch_size=2, columns=['id', 'category']))
+        self.assertEqual(len(logs), 7)
+        self.assertEqual(logs[0], {'id': 7, 'category': 'Summarization'})
+        self.assertEqual(logs[1], {'id': 6, 'category': 'Code Generation'})
+
+    def test_insert_log_matches_repository_signature(self):
+        self.repo.insert_log('Bug Fixing', 'claude-3-haiku', 'fix it', 'done', 1, 2, 0.3, cost=0.01,
+                             timestamp='2024-06-15T09:00:00')
+        self.assertEqual(self.repo.fetch_logs(limit=1)[0]['category'], 'Bug Fixing')
+        self.assertEqual(len(self.repo), 8)
+
+    def test_max_rows_evicts_oldest(self):
+        repo = InMemoryPromptLogRepository(max_rows=4)
+        for i in range(1, 21):
+            repo.insert_result(result(i % 60))
+        self.assertLessEqual(len(repo), 5)
+        self.assertGreaterEqual(len(repo), 4)
+        self.assertEqual(repo.fetch_logs(limit=1)[0]['duration'], 20.0)
+
+    def test_eviction_compacts_interned_values(self):
+        repo = InMemoryPromptLogRepository(max_rows=10)
+        for i in range(100):
+            repo.insert_result(dict(result(i % 60), prompt_text=f'unique {i}', category=f'category {i // 20}'))
+        # Only the values of remaining rows (and NULL) stay interned
+        self.assertEqual(len(repo._dictionaries['prompt_text']), len(repo) + 1)
+        self.assertEqual(repo._dictionaries['category'], [None, 'category 4'])
+        newest = repo.fetch_logs(category='category 4', limit=1)[0]
+        self.assertEqual(newest['prompt_text'], 'unique 99')
+        self.assertEqual(newest['status'], 'success')
+        self.assertEqual(repo.fetch_logs(category='category 0'), [])
+
+    def test_checkpoints(self):
+        self.repo.record_checkpoints('run-1', [('a', 'success', '2024-06-15T08:00:02'),
+                                              ('b', 'failure', '2024-06-15T08:00:02')])
+        # An older checkpoint does not overwrite a newer one
+        self.repo.record_checkpoints('run-1', [('a', 'failure', '2024-06-15T08:00:01'),
+                                              ('b', 'success', '2024-06-15T08:00:03')])
+        self.assertEqual(self.repo.fetch_checkpoints('run-1'), {'a': 'success', 'b': 'success'})
+        self.assertEqual(self.repo.fetch_checkpoints('run-2'), {})
+
+    @unittest.skipUnless(find_spec('numpy'), 'numpy is not installed')
+    def test_aggregate_summary(self):
+        summary = self.repo.aggregate_summary()
+        self.assertEqual(summary['total_runs'], 7)
+        self.assertEqual(summary['success_count'], 6)
+        self.assertEqual(summary['throttled_count'], 1)
+        self.assertEqual(summary['failure_count'], 0)
+        self.assertEqual(summary['input_tokens'], 70)
+        self.assertEqual(summary['cost'], 3.5)
+        self.assertEqual(summary['last_timestamp'], '2024-06-15T08:00:07.000+00:00')
+        # The batch row is left out of latency
+        self.assertEqual(summary['latency_count'], 6)
+        self.assertEqual(summary['average_latency_sec'], 3.5)
+        self.assertEqual(summary['latency_p50_sec'], 4.0)
+        self.assertEqual(summary['latency_p99_sec'], 6.0)
+        filtered = self.repo.aggregate_summary(category='Summarization', end_time='2024-06-15T08:00:02')
+        self.assertEqual(filtered['total_runs'], 2)
+        self.assertIsNone(self.repo.aggregate_summary(model='unknown'))
+        self.assertIsNone(self.repo.aggregate_summary(end_time=0))
+
+    @unittest.skipUnless(find_spec('numpy'), 'numpy is not installed')
+    def test_aggregated_stats_per_category(self):
+        self.assertEqual(self.repo.get_aggregated_stats(),
+                         [('Code Generation', 30, 0.5, 6.0), ('Summarization', 180, 3.0, 3.67)])
+        self.assertEqual(self.repo.get_aggregated_stats(start_time='2024-06-15T08:00:07'),
+                         [('Summarization', 30, 0.5, 7.0)])
+        self.assertEqual(self.repo.get_aggregated_stats(end_time=0), [])
+
+    @unittest.skipUnless(find_spec('numpy'), 'numpy is not installed')
+    def test_time_series_buckets(self):
+        series = self.repo.get_time_series(bucket_seconds=4)
+        self.assertEqual([stats['total_runs'] for stats in series], [3, 4])
+        self.assertEqual(series[1]['bucket_start'].isoformat(), '2024-06-15T08:00:04+00:00')
+        self.assertEqual(series[1]['throttled_count'], 1)
+
+    @unittest.skipUnless(find_spec('pandas'), 'pandas is not installed')
+    def test_fetch_logs_df(self):
+        frame = self.repo.fetch_logs_df(category='Summarization', columns=['id', 'success', 'cost', 'timestamp'],
+                                        limit=2)
+        self.assertEqual(list(frame['id']), [7, 5])
+        self.assertTrue(frame['success'].all())
+        self.assertEqual(str(frame['timestamp'].dt.tz), 'UTC')
+
+if __name__ == '__main__':
+    unittest.main()
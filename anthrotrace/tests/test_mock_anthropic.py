@@ -0,0 +1,70 @@
+import json
+import random
+import unittest
+import urllib.error
+import urllib.request
+from anthrotrace.core.mock_anthropic import LatencyDistribution, MockAnthropicBehavior, MockAnthropicServer
+
+PARAMS = {'model': 'claude-test', 'max_tokens': 100, 'messages': [{'role': 'user', 'content': 'hello'}]}
+
+
+def post(url, params):
+    request = urllib.request.Request(url, data=json.dumps(params).encode('utf-8'),
+                                     headers={'content-type': 'application/json'}, method='POST')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers, response.read().decode('utf-8')
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, error.read().decode('utf-8')
+
+
+class TestMockAnthropic(unittest.TestCase):
+    def test_latency_distributions(self):
+        rng = random.Random(1)
+        self.assertEqual(LatencyDistribution.constant(0.5).sample(rng), 0.5)
+        samples = sorted(LatencyDistribution.lognormal(0.2, 0.5).sample(rng) for _ in range(2000))
+        self.assertAlmostEqual(samples[1000], 0.2, delta=0.03)
+        bimodal = [LatencyDistribution.bimodal(0.1, 5.0, slow_fraction=0.2).sample(rng) for _ in range(2000)]
+        self.assertAlmostEqual(sum(1 for sample in bimodal if sample > 1.0) / 2000, 0.2, delta=0.04)
+
+    def test_reply_is_reproducible_and_honors_max_tokens(self):
+        first = MockAnthropicBehavior(output_tokens=(10, 500), seed=3).reply(PARAMS)
+        second = MockAnthropicBehavior(output_tokens=(10, 500), seed=3).reply(PARAMS)
+        self.assertEqual(first.body['usage'], second.body['usage'])
+        self.assertEqual(first.delay, second.delay)
+        self.assertLessEqual(first.body['usage']['output_tokens'], 100)
+
+    def test_error_rates(self):
+        behavior = MockAnthropicBehavior(error_rates={429: 0.5, 529: 0.5}, seed=1)
+        statuses = {behavior.reply(PARAMS).status for _ in range(50)}
+        self.assertEqual(statuses, {429, 529})
+        reply = MockAnthropicBehavior(error_rates={429: 1.0}).reply(PARAMS)
+        self.assertEqual(reply.body['error']['type'], 'rate_limit_error')
+        self.assertEqual(reply.headers['retry-after'], '1')
+
+    def test_stream_chunks(self):
+        behavior = MockAnthropicBehavior(output_tokens=10, tokens_per_chunk=4,
+                                         chunk_interval=LatencyDistribution.constant(0.01))
+        reply = behavior.reply(dict(PARAMS, stream=True))
+        deltas = [(gap, event) for gap, event in reply.events if b'content_block_delta' in event]
+        self.assertEqual([gap for gap, _ in deltas], [0.0, 0.01, 0.01])
+        self.assertTrue(reply.events[0][1].startswith(b'event: message_start'))
+        self.assertTrue(reply.events[-1][1].startswith(b'event: message_stop'))
+
+    def test_server_round_trip(self):
+        behavior = MockAnthropicBehavior(latency=LatencyDistribution.constant(0.0), output_tokens=5)
+        with MockAnthropicServer(behavior) as server:
+            status, _, body = post(server.base_url + '/v1/messages', PARAMS)
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)['usage']['output_tokens'], 5)
+
+            status, headers, body = post(server.base_url + '/v1/messages', dict(PARAMS, stream=True))
+            self.assertEqual(headers['content-type'], 'text/event-stream')
+            self.assertEqual(body.count('event: content_block_delta'), 2)
+
+            status, _, _ = post(server.base_url + '/v1/complete', PARAMS)
+            self.assertEqual(status, 404)
+        self.assertEqual(behavior.stats(), {200: 2, 404: 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import tempfile
+import os
+import shutil
+from datetime import date
+from importlib.util import find_spec
+from anthrotrace.core.benchmark_summary_service import BenchmarkSummaryService
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.tiered_repository import TieredPromptLogRepository
+
+
+@unittest.skipUnless(find_spec('pyarrow') and find_spec('pandas'), "pyarrow and pandas are not installed")
+class TestParquetArchive(unittest.TestCase):
+    def setUp(self):
+        from anthrotrace.core.parquet_archive import ParquetArchive
+        self.directory = tempfile.mkdtemp()
+        self.repo = SQLiteRepository(db_path=os.path.join(self.directory, 'prompt_logs.db'))
+        self.archive = ParquetArchive(os.path.join(self.directory, 'archive'))
+        for index, timestamp in enumerate(['2024-05-01T10:00:00', '2024-05-01T23:30:00', '2024-05-02T05:00:00',
+                                           '2024-06-14T09:00:00', '2024-06-15T08:00:00']):
+            self.repo.insert_log('A' if index % 2 else 'B', 'model', f'p{index}', '' if index == 2 else f'r{index}',
+                                 10, 20, 1.0 + index, 0.01, timestamp)
+
+    def tearDown(self):
+        self.repo.close()
+        shutil.rmtree(self.directory)
+
+    def archive_old_days(self):
+        from anthrotrace.core.parquet_archive import archive_closed_partitions
+        return archive_closed_partitions(self.repo, self.archive, retain_days=30, now='2024-06-15T12:00:00')
+
+    def test_archive_moves_closed_days_out_of_the_hot_store(self):
+        archived = self.archive_old_days()
+        self.assertEqual(archived, {date(2024, 5, 1): 2, date(2024, 5, 2): 1})
+        self.assertEqual(self.archive.partitions(), [date(2024, 5, 1), date(2024, 5, 2)])
+        self.assertEqual(len(self.repo.fetch_logs()), 2)
+        self.assertEqual(self.archive_old_days(), {})  # Nothing left to move
+
+        # Partitions outside the window are never opened
+        self.assertEqual(len(self.archive.files('2024-05-02T00:00:00', '2024-05-02T23:00:00')), 1)
+        table = self.archive.read(category='A', start_time='2024-05-01T12:00:00')
+        self.assertEqual(table.column('prompt_text').to_pylist(), ['p1'])
+        self.assertEqual(self.archive.read(columns=['success']).column('success').to_pylist(), [True, True, False])
+
+    def test_retried_pass_rewrites_its_part(self):
+        delete_logs = self.repo.delete_logs
+        def crash(**kwargs):
+            raise RuntimeError('crashed before the hot rows were deleted')
+        self.repo.delete_logs = crash
+        with self.assertRaises(RuntimeError):
+            self.archive_old_days()
+        self.repo.delete_logs = delete_logs
+        # A row that arrives between the crash and the retry is archived once, with the others
+        self.repo.insert_log('A', 'model', 'late', 'r', 10, 20, 1.0, 0.01, '2024-05-01T12:00:00')
+        self.assertEqual(self.archive_old_days(), {date(2024, 5, 1): 3, date(2024, 5, 2): 1})
+        self.assertEqual(len(self.archive.files()), 2)
+        self.assertEqual(self.archive.read().num_rows, 4)
+
+        # Rows that reach an archived day later go into a new part
+        self.repo.insert_log('A', 'model', 'later', 'r', 10, 20, 1.0, 0.01, '2024-05-01T13:00:00')
+        self.assertEqual(self.archive_old_days(), {date(2024, 5, 1): 1})
+        self.assertEqual(len(self.archive.files()), 3)
+        self.assertEqual(self.archive.read().num_rows, 5)
+
+    def test_tiered_reads_match_the_unarchived_store(self):
+        service = BenchmarkSummaryService(self.repo)
+        before = [service.get_summary(), service.get_summary(category='A'),
+                  service.get_summary(start_time='2024-05-01T12:00:00', end_time='2024-06-14T12:00:00')]
+        logs = self.repo.fetch_logs()
+        self.archive_old_days()
+
+        tiered = TieredPromptLogRepository(self.repo, self.archive)
+        service = BenchmarkSummaryService(tiered)
+        self.assertEqual([service.get_summary(), service.get_summary(category='A'),
+                          service.get_summary(start_time='2024-05-01T12:00:00', end_time='2024-06-14T12:00:00')],
+                         before)
+        self.assertEqual(tiered.fetch_logs(), logs)
+        self.assertEqual(tiered.fetch_logs(limit=3), logs[:3])
+        frame = tiered.fetch_logs_df(columns=['prompt_text', 'timestamp'])
+        self.assertEqual(list(frame['prompt_text']), ['p4', 'p3', 'p2', 'p1', 'p0'])
+        self.assertEqual(len(tiered.fetch_logs_df(limit=3)), 3)
+
+if __name__ == '__main__':
+    unittest.main()
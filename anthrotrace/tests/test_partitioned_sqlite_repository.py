@@ -0,0 +1,107 @@
+import unittest
+import tempfile
+import shutil
+import os
+from importlib.util import find_spec
+from anthrotrace.core.partitioned_sqlite_repository import PartitionedSQLiteRepository
+from anthrotrace.core.repository_adapter import RepositoryAdapter
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+
+def result(day, hour, category='Summarization', status='success'):
+    return {
+        'category': category, 'model': 'claude-3-haiku', 'prompt_text': f'prompt {day}-{hour}',
+        'response': 'ok' if status == 'success' else '', 'input_tokens': 10, 'output_tokens': 20,
+        'duration': float(hour), 'cost': 0.25, 'timestamp': f'2024-06-{day:02d}T{hour:02d}:30:00', 'status': status,
+    }
+
+RESULTS = [result(day, hour, category='Summarization' if hour == 5 else 'Code Generation',
+                  status='throttled' if hour == 5 else 'success')
+           for day in (10, 11, 17) for hour in (1, 5, 9)]
+
+class TestPartitionedSQLiteRepository(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.repo = PartitionedSQLiteRepository(self.directory, partition='day', max_workers=2)
+        self.repo.insert_results(RESULTS)
+
+    def tearDown(self):
+        self.repo.close()
+        shutil.rmtree(self.directory)
+
+    def test_rows_land_in_one_file_per_day(self):
+        self.assertEqual(list(self.repo.partitions()), ['2024-06-10', '2024-06-11', '2024-06-17'])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'prompt_logs_2024-06-11.db')))
+        low, high = self.repo.partitions()['2024-06-10']
+        self.assertLessEqual(low, 1717983000000)  # 2024-06-10T01:30:00Z
+        self.assertGreaterEqual(high, 1718011800000)  # 2024-06-10T09:30:00Z
+
+    def test_time_filters_prune_partitions(self):
+        self.assertEqual(list(self.repo.partitions(start_time='2024-06-11T09:00:00', end_time='2024-06-16T00:00:00')),
+                         ['2024-06-11'])
+        # Epoch 0 is a bound, not a missing one
+        self.assertEqual(self.repo.partitions(end_time=0), {})
+
+    def test_aggregate_summary_matches_single_file(self):
+        single_path = os.path.join(self.directory, 'single.db')
+        single = SQLiteRepository(single_path)
+        single.insert_results(RESULTS)
+        for filters in ({}, {'category': 'Code Generation'}, {'start_time': '2024-06-11T04:00:00'}):
+            self.assertEqual(self.repo.aggregate_summary(**filters), single.aggregate_summary(**filters))
+        single.close()
+        self.assertIsNone(self.repo.aggregate_summary(start_time='2024-07-01T00:00:00'))
+
+    def test_summaries_do_not_fold_partitions(self):
+        path = self.repo.partition_path('2024-06-10')
+        watermark = "SELECT COALESCE(MAX(last_id), 0) FROM summary_watermarks WHERE name = 'summary_buckets'"
+        reader = SQLiteRepository(path, migrate=False)
+        self.assertEqual(reader.conn.execute(watermark).fetchone()[0], 0)  # Fewer rows than flush_rows so far
+        self.assertEqual(self.repo.aggregate_summary()['total_runs'], 9)
+        self.assertEqual(reader.conn.execute(watermark).fetchone()[0], 0)
+        self.assertEqual(self.repo.fold_summary_index(), 9)
+        self.assertEqual(reader.conn.execute(watermark).fetchone()[0], 3)
+        self.assertEqual(self.repo.aggregate_summary()['total_runs'], 9)
+        reader.close()
+
+    def test_fetch_logs_newest_first_across_partitions(self):
+        logs = self.repo.fetch_logs(limit=4)
+        self.assertEqual([log['prompt_text'] for log in logs], ['prompt 17-9', 'prompt 17-5', 'prompt 17-1',
+                                                                'prompt 11-9'])
+        logs = list(self.repo.iter_logs(category='Summarization', batch_size=1, columns=['prompt_text']))
+        self.assertEqual(logs, [{'prompt_text': 'prompt 17-5'}, {'prompt_text': 'prompt 11-5'},
+                                {'prompt_text': 'prompt 10-5'}])
+
+    def test_drop_partitions_deletes_files(self):
+        self.assertEqual(self.repo.drop_partitions(before='2024-06-12T00:00:00'), ['2024-06-10', '2024-06-11'])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'prompt_logs_2024-06-10.db')))
+        self.assertEqual(self.repo.aggregate_summary()['total_runs'], 3)
+
+    def test_catalog_and_checkpoints_survive_reopen(self):
+        self.repo.record_checkpoints('run-1', [('a', 'success', '2024-06-17T10:00:00')])
+        self.repo.close()
+        os.unlink(os.path.join(self.directory, 'prompt_logs_2024-06-10.db'))
+        self.repo = PartitionedSQLiteRepository(self.directory, partition='day')
+        self.assertEqual(list(self.repo.partitions()), ['2024-06-11', '2024-06-17'])
+        self.assertEqual(self.repo.fetch_checkpoints('run-1'), {'a': 'success'})
+
+    def test_week_partitions_and_adapter(self):
+        directory = tempfile.mkdtemp()
+        repo = PartitionedSQLiteRepository(directory, partition='week', write_behind=True)
+        repo.insert_results(RESULTS)
+        repo.flush()
+        self.assertEqual(list(repo.partitions()), ['2024-W24', '2024-W25'])
+        adapter = RepositoryAdapter(repo)
+        self.assertEqual(len(adapter.query_logs(category='Summarization')), 3)
+        self.assertEqual(adapter.aggregate_summary()['throttled_count'], 3)
+        repo.close()
+        shutil.rmtree(directory)
+
+    @unittest.skipUnless(find_spec('pandas'), 'pandas is not installed')
+    def test_fetch_logs_df_concatenates_partitions(self):
+        frame = self.repo.fetch_logs_df(columns=['prompt_text', 'timestamp'], limit=5)
+        self.assertEqual(list(frame['prompt_text']), ['prompt 17-9', 'prompt 17-5', 'prompt 17-1', 'prompt 11-9',
+                                                      'prompt 11-5'])
+        self.assertEqual(len(self.repo.fetch_logs_df(columns=['cost'])), 9)
+        self.assertEqual(len(self.repo.fetch_logs_df(start_time='2024-08-01T00:00:00')), 0)
+
+if __name__ == '__main__':
+    unittest.main()
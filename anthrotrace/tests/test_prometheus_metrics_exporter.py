@@ -0,0 +1,146 @@
+import unittest
+from importlib.util import find_spec
+from anthrotrace.core.benchmark_results import emit_result_metrics
+from anthrotrace.metrics.prometheus_metrics_exporter import _MetricFamilies
+
+def result(category='Summarization', **overrides):
+    result = {
+        'category': category, 'input_tokens': 30, 'output_tokens': 12, 'cost': 0.02, 'duration': 1.5,
+        'status': 'success', 'execution_mode': 'stream', 'cached': 0, 'time_to_first_token': 0.2,
+        'output_tokens_per_sec': 40.0, 'inter_token_latencies': [0.01, 0.03],
+    }
+    result.update(overrides)
+    return result
+
+class CallByCall:
+    """Hides emit_result, so emit_result_metrics goes through emit_metric/emit_histogram."""
+    def __init__(self, exporter):
+        self.exporter = exporter
+    def emit_metric(self, *args, **kwargs):
+        self.exporter.emit_metric(*args, **kwargs)
+    def emit_histogram(self, *args):
+        self.exporter.emit_histogram(*args)
+
+class FakeMetric:
+    """A metric family and its own label child, recording what the queued results applied."""
+    def __init__(self, metric_type):
+        self.metric_type = metric_type
+        self.children = {}
+        self.value = 0
+        self.observed = []
+
+    def labels(self, **labels):
+        return self.children.setdefault(tuple(labels.items()), FakeMetric(self.metric_type))
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, value=1):
+        self.value += value
+
+    def observe(self, value):
+        self.observed.append(value)
+
+    def collect(self):
+        return [self]
+
+class FakeRegistry:
+    def __init__(self):
+        self.collectors = []
+
+    def register(self, collector):
+        self.collectors.append(collector)
+
+class FakeFamilies(_MetricFamilies):
+    def _create(self, name, label_names, metric_type, buckets):
+        return FakeMetric(metric_type)
+
+def queued(category='Summarization', outcome='success', tokens=42, cost=0.02, latency=1.5):
+    return category, outcome, tokens, cost, latency, 0.2, 40.0, [0.01, 0.03]
+
+class TestResultQueue(unittest.TestCase):
+    def child(self, families, name, category='Summarization'):
+        return families._families[name].children[(('category', category),)]
+
+    def test_flush_applies_queued_results(self):
+        families = FakeFamilies(FakeRegistry(), flush_interval=3600)
+        families.record_result(queued())
+        families.record_result(queued(latency=None, tokens=10))
+        self.assertEqual(families._families, {})
+        created = families.flush()
+        self.assertEqual(len(created), len(families._families))
+        self.assertEqual(self.child(families, 'prompt_latency_seconds').observed, [1.5])
+        self.assertEqual(self.child(families, 'prompt_total_tokens_histogram').observed, [42, 10])
+        self.assertEqual(self.child(families, 'prompt_inter_token_latency_seconds').observed, [0.01, 0.03] * 2)
+        self.assertEqual(self.child(families, 'prompt_total_tokens').value, 52)
+        self.assertEqual(self.child(families, 'prompt_success_total').value, 2)
+        self.assertEqual(families.flush(), [])
+
+    def test_scrape_and_back_pressure_flush(self):
+        registry = FakeRegistry()
+        families = FakeFamilies(registry, flush_interval=3600, max_pending=3)
+        families.record_result(queued())
+        collected = list(registry.collectors[0].collect())  # A scrape applies the queue first
+        self.assertEqual(len(collected), len(families._families))
+        self.assertEqual(len(self.child(families, 'prompt_latency_seconds').observed), 1)
+        for _ in range(3):
+            families.record_result(queued('Coding'))
+        self.assertEqual(len(families._pending), 0)
+        self.assertEqual(len(self.child(families, 'prompt_latency_seconds', 'Coding').observed), 3)
+
+@unittest.skipUnless(find_spec('prometheus_client'), 'prometheus_client is not installed')
+class TestPrometheusMetricsExporter(unittest.TestCase):
+    def exporter(self):
+        from prometheus_client import CollectorRegistry
+        from anthrotrace.metrics.prometheus_metrics_exporter import PrometheusMetricsExporter
+        return PrometheusMetricsExporter(start_server=False, registry=CollectorRegistry())
+
+    def samples(self, exporter):
+        return {(sample.name, tuple(sorted(sample.labels.items())), sample.value)
+                for metric in exporter.registry.collect() for sample in metric.samples
+                if not sample.name.endswith('_created')}
+
+    def test_new_label_value_reuses_the_metric(self):
+        exporter = self.exporter()
+        exporter.emit_metric('queue_depth', 3, {'category': 'a'})
+        exporter.emit_metric('queue_depth', 5, {'category': 'b'})
+        exporter.emit_metric('requests_total', 2, {'category': 'b'}, metric_type='counter')
+        exporter.emit_metric('requests_total', 1, {'category': 'b'}, metric_type='counter')
+        self.assertEqual(exporter.registry.get_sample_value('queue_depth', {'category': 'a'}), 3)
+        self.assertEqual(exporter.registry.get_sample_value('queue_depth', {'category': 'b'}), 5)
+        self.assertEqual(exporter.registry.get_sample_value('requests_total', {'category': 'b'}), 3)
+        with self.assertRaises(ValueError):
+            exporter.emit_metric('requests_total', 1, {'category': 'b'})
+
+    def test_exporters_without_registry_share_metrics(self):
+        from anthrotrace.metrics.prometheus_metrics_exporter import PrometheusMetricsExporter
+        first = PrometheusMetricsExporter(start_server=False)
+        second = PrometheusMetricsExporter(start_server=False)
+        first.emit_metric('shared_gauge', 1, {'session': 'one'})
+        second.emit_metric('shared_gauge', 2, {'session': 'two'})
+        self.assertIs(first.registry, second.registry)
+        self.assertEqual(first.registry.get_sample_value('shared_gauge', {'session': 'two'}), 2)
+
+    def test_emit_result_matches_call_by_call_metrics(self):
+        fast, slow = self.exporter(), self.exporter()
+        results = [(result(), True), (result('Coding', status='throttled', time_to_first_token=None), False),
+                   (result(execution_mode='batch', inter_token_latencies=[]), False), (result(duration=0.4), True)]
+        for entry, success in results:
+            emit_result_metrics(fast, entry, success=success)
+            emit_result_metrics(CallByCall(slow), entry, success=success)
+        # A scrape applies the queued results first
+        self.assertEqual(self.samples(fast), self.samples(slow))
+        self.assertEqual(fast.emitted_metrics_count, slow.emitted_metrics_count)
+        self.assertEqual(fast.registry.get_sample_value('prompt_latency_seconds_count',
+                                                        {'category': 'Summarization'}), 2)
+
+    def test_emit_result_skips_a_name_taken_by_another_type(self):
+        exporter = self.exporter()
+        exporter.emit_metric('prompt_total_tokens', 100, {'category': 'Summarization'})
+        exporter.emit_result(result(), success=False)
+        exporter.flush()
+        self.assertEqual(exporter.registry.get_sample_value('prompt_total_tokens', {'category': 'Summarization'}), 100)
+        self.assertEqual(exporter.registry.get_sample_value('prompt_failure_total', {'category': 'Summarization'}), 1)
+
+if __name__ == '__main__':
+    unittest.main()
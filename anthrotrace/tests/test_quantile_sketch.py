@@ -0,0 +1,52 @@
+import unittest
+import random
+from anthrotrace.core.quantile_sketch import QuantileSketch, add_sketch_quantiles, merge_serialized, merge_sketches
+
+class TestQuantileSketch(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.values = [rng.lognormvariate(0, 1) for _ in range(20000)]
+
+    def test_quantiles_are_within_relative_accuracy(self):
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        sketch.add_many(self.values)
+        ordered = sorted(self.values)
+        for level in (0.0, 0.5, 0.9, 0.99, 1.0):
+            exact = ordered[min(len(ordered) - 1, int(level * len(ordered)))]
+            self.assertAlmostEqual(sketch.quantile(level) / exact, 1.0, delta=0.0101)
+        self.assertEqual(sketch.count, 20000)
+
+    def test_merge_equals_sketch_of_all_values(self):
+        first, second, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        first.add_many(self.values[:5000])
+        second.add_many(self.values[5000:])
+        whole.add_many(self.values)
+        self.assertEqual(merge_sketches([first, None, second]), whole)
+        self.assertIsNone(merge_sketches([None]))
+        self.assertEqual(merge_serialized([first.to_bytes(), None, second.to_bytes()]), whole)
+        self.assertEqual(merge_serialized([whole.to_bytes()] * 50).count, 1000000)
+        self.assertIsNone(merge_serialized([None]))
+        with self.assertRaises(ValueError):
+            whole.merge(QuantileSketch(relative_accuracy=0.05))
+
+    def test_zero_values_and_serialization(self):
+        sketch = QuantileSketch()
+        sketch.add_many([0.0, 0.0, None, float('nan'), 2.0])
+        self.assertEqual(sketch.count, 3)
+        self.assertEqual(sketch.quantiles([0.5, 1.0])[0], 0.0)
+        self.assertAlmostEqual(sketch.quantile(1.0), 2.0, delta=0.02)
+        restored = QuantileSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored, sketch)
+        self.assertEqual(restored.count, 3)
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+    def test_add_sketch_quantiles_names_each_level(self):
+        latency = QuantileSketch()
+        latency.add_many([1.0, 2.0, 3.0])
+        totals = add_sketch_quantiles({'latency_sketch': latency, 'cost_sketch': QuantileSketch()})
+        self.assertAlmostEqual(totals['latency_p50_sec'], 2.0, delta=0.02)
+        self.assertEqual(totals['cost_p99_usd'], 0.0)
+        self.assertIn('latency_p95_sec', totals)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from anthrotrace.core.rate_governor import (
+    AIMDConcurrencyLimiter, RateGovernor, RateLimitExhausted, TokenBucket, is_throttle_error
+)
+
+class ThrottleError(Exception):
+    def __init__(self, status_code=429, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+class TestRateGovernor(unittest.TestCase):
+    def test_is_throttle_error(self):
+        self.assertTrue(is_throttle_error(ThrottleError(429)))
+        self.assertTrue(is_throttle_error(ThrottleError(529)))
+        self.assertFalse(is_throttle_error(ThrottleError(500)))
+        self.assertFalse(is_throttle_error(ValueError("nope")))
+
+    def test_aimd_limiter(self):
+        async def scenario():
+            limiter = AIMDConcurrencyLimiter(initial_limit=8, cooldown=60)
+            await limiter.acquire()
+            await limiter.release(throttled=True)
+            self.assertEqual(limiter.limit, 4)
+            # A second 429 inside the cool-down window is the same congestion event
+            await limiter.acquire()
+            await limiter.release(throttled=True)
+            self.assertEqual(limiter.limit, 4)
+            await limiter.acquire()
+            await limiter.release()
+            self.assertAlmostEqual(limiter.limit, 4.25)
+        asyncio.run(scenario())
+
+    def test_execute_retries_throttles_then_succeeds(self):
+        attempts = []
+
+        async def send():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ThrottleError(429, {"retry-after": "0"})
+            return SimpleNamespace(headers={})
+
+        governor = RateGovernor(base_backoff=0.001, max_backoff=0.001)
+        asyncio.run(governor.execute(send))
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(governor.throttle_events, 2)
+        self.assertEqual(governor.retries, 2)
+
+    def test_execute_gives_up_and_passes_real_errors_through(self):
+        async def throttled():
+            raise ThrottleError(529)
+
+        async def broken():
+            raise ValueError("bad request")
+
+        governor = RateGovernor(max_retries=1, base_backoff=0.001, max_backoff=0.001)
+        with self.assertRaises(RateLimitExhausted):
+            asyncio.run(governor.execute(throttled))
+        with self.assertRaises(ValueError):
+            asyncio.run(governor.execute(broken))
+        self.assertEqual(governor.throttle_events, 2)
+
+    def test_headers_create_and_drain_buckets(self):
+        governor = RateGovernor()
+        governor.observe_headers({
+            "anthropic-ratelimit-requests-limit": "50",
+            "anthropic-ratelimit-requests-remaining": "10",
+            "anthropic-ratelimit-input-tokens-limit": "40000",
+        })
+        self.assertAlmostEqual(governor.buckets["requests"].capacity, 50)
+        self.assertLessEqual(governor.buckets["requests"].tokens, 10.01)
+        self.assertAlmostEqual(governor.buckets["input-tokens"].capacity, 40000)
+        self.assertIsNone(governor.buckets["output-tokens"])
+
+    def test_token_bucket_adjust(self):
+        bucket = TokenBucket(600)
+        asyncio.run(bucket.acquire(500))
+        bucket.adjust(200)
+        self.assertLess(bucket.tokens, 0)
+
+if __name__ == '__main__':
+    unittest.main()
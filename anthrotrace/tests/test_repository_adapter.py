@@ -1,4 +1,7 @@
 import unittest
+from datetime import datetime
+from anthrotrace.core.benchmark_summary_service import BenchmarkSummaryService
+from anthrotrace.core.mock_repository import MockRepository
 from anthrotrace.core.repository_adapter import RepositoryAdapter
 
 class DummyRepo:
@@ -16,5 +19,30 @@ class TestRepositoryAdapter(unittest.TestCase):
         self.assertEqual(logs[0]['model'], 'M1')
         self.assertEqual(logs[0]['response'], 'ok')
 
+    def test_aggregate_summary_reduces_rows_without_repository_support(self):
+        summary = RepositoryAdapter(DummyRepo()).aggregate_summary(category='A')
+        self.assertEqual(summary['total_runs'], 1)
+        self.assertEqual(summary['success_count'], 1)
+        self.assertEqual(summary['failure_count'], 0)
+
+    def test_repository_without_filters(self):
+        repo = MockRepository()
+        repo.insert_log('A', 'p1', 'ok', 10, 5, 1.0, cost=0.01, timestamp=datetime(2024, 6, 1))
+        repo.insert_log('A', 'p2', '', 20, 10, 2.0, cost=0.02, timestamp=datetime(2024, 6, 2))
+        repo.insert_log('B', 'p3', 'ok', 30, 15, 3.0, cost=0.03, timestamp=datetime(2024, 6, 3))
+        adapter = RepositoryAdapter(repo)
+        self.assertEqual([log['prompt_text'] for log in adapter.query_logs(category='A')], ['p1', 'p2'])
+        self.assertEqual([log['prompt_text'] for log in adapter.query_logs(start_time=datetime(2024, 6, 2))],
+                         ['p2', 'p3'])
+        self.assertEqual(len(adapter.query_logs(start_time=0)), 3)
+
+        summary = BenchmarkSummaryService(adapter).get_summary(category='A')
+        self.assertEqual(summary['total_runs'], 2)
+        self.assertEqual(summary['failure_count'], 1)
+        # Passed directly, without an adapter
+        summary = BenchmarkSummaryService(repo).get_summary(end_time=datetime(2024, 6, 2))
+        self.assertEqual(summary['total_runs'], 2)
+        self.assertEqual(summary['success_count'], 1)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
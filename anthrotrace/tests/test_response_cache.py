@@ -0,0 +1,62 @@
+import os
+import tempfile
+import time
+import unittest
+from anthrotrace.core.response_cache import ResponseCache
+
+PARAMS = {
+    'model': 'claude-sonnet-4-20250514', 'max_tokens': 300, 'temperature': 0,
+    'system': 'You are a helpful assistant.', 'messages': [{'role': 'user', 'content': 'hi'}]
+}
+
+class RecordingExporter:
+    def __init__(self):
+        self.metrics = []
+
+    def emit_metric(self, name, value, labels, metric_type="gauge"):
+        self.metrics.append((name, value))
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.tmpdir.name, 'cache.db'), max_entries=10)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_key_is_stable_and_content_addressed(self):
+        self.assertEqual(ResponseCache.make_key(PARAMS), ResponseCache.make_key(dict(reversed(list(PARAMS.items())))))
+        self.assertNotEqual(ResponseCache.make_key(PARAMS), ResponseCache.make_key(dict(PARAMS, model='other')))
+
+    def test_lookup_hit_and_miss(self):
+        exporter = RecordingExporter()
+        key, entry = self.cache.lookup(PARAMS, exporter)
+        self.assertIsNone(entry)
+        self.cache.put(key, 'hello', 5, 7)
+        key, entry = self.cache.lookup(PARAMS, exporter)
+        self.assertEqual(entry, {'response': 'hello', 'input_tokens': 5, 'output_tokens': 7})
+        self.assertEqual([name for name, _ in exporter.metrics], ['response_cache_misses_total', 'response_cache_hits_total'])
+        self.assertEqual(self.cache.stats()['hit_ratio'], 0.5)
+
+    def test_non_deterministic_requests_are_not_cached(self):
+        self.assertEqual(self.cache.lookup(dict(PARAMS, temperature=0.7)), (None, None))
+
+    def test_ttl_and_size_eviction(self):
+        for i in range(15):
+            self.cache.put(f'k{i}', 'r', 1, 1)
+        self.assertLessEqual(self.cache.stats()['entries'], 10)
+        self.assertIsNotNone(self.cache.get('k14'))
+        self.assertIsNone(self.cache.get('k0'))
+        self.cache.ttl_seconds = 0.001
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.get('k14'))
+
+    def test_overwriting_a_key_does_not_grow_the_entry_count(self):
+        for i in range(20):
+            self.cache.put('k', f'r{i}', 1, 1)
+        self.assertEqual(self.cache.stats()['entries'], 1)
+        self.assertEqual(self.cache.get('k')['response'], 'r19')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from anthrotrace.core.benchmark_results import DEFAULT_MODEL
+from anthrotrace.core.result_pipeline import JsonlSink, RepositorySink, ResultPipeline
+from anthrotrace.core.run_manifest import RunCheckpointer
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.async_anthropic_benchmark_runner import AsyncAnthropicBenchmarkRunner
+from anthrotrace.tests.test_async_anthropic_benchmark_runner import FakeAsyncClient
+
+class RecordingSink:
+    def __init__(self, fail_batches=0, gate=None):
+        self.batches = []
+        self.fail_batches = fail_batches
+        self.gate = gate
+        self.closed = False
+
+    def write_batch(self, results):
+        if self.gate is not None:
+            self.gate.wait()
+        if self.fail_batches:
+            self.fail_batches -= 1
+            raise ConnectionError("sink unavailable")
+        self.batches.append(list(results))
+
+    def close(self):
+        self.closed = True
+
+def make_result(index):
+    return {'category': 'cat', 'model': 'model', 'prompt_text': f'prompt {index}', 'response': 'resp',
+            'input_tokens': 1, 'output_tokens': 2, 'duration': 0.5, 'cost': 0.01,
+            'timestamp': '2024-06-01T00:00:00+00:00', 'status': 'success'}
+
+class TestResultPipeline(unittest.TestCase):
+    def test_every_sink_gets_every_result_in_batches(self):
+        pipeline = ResultPipeline()
+        first = pipeline.add_sink('first', RecordingSink(), batch_rows=2, flush_interval=3600)
+        second = pipeline.add_sink('second', RecordingSink(), batch_rows=10, flush_interval=3600)
+        pipeline.insert_results([make_result(index) for index in range(5)])
+        pipeline.flush()
+        self.assertEqual([len(batch) for batch in first.batches], [2, 2, 1])
+        self.assertEqual(sum(len(batch) for batch in second.batches), 5)
+        pipeline.close()
+        self.assertTrue(first.closed and second.closed)
+        self.assertEqual(pipeline.stats()['first'], {'written': 5, 'dropped': 0, 'errors': 0, 'pending': 0})
+        with self.assertRaises(RuntimeError):
+            pipeline.publish(make_result(5))
+
+    def test_slow_and_failing_sinks_are_isolated(self):
+        gate = threading.Event()
+        pipeline = ResultPipeline()
+        slow = pipeline.add_sink('slow', RecordingSink(gate=gate), batch_rows=1, max_pending=2, overflow='drop')
+        failing = pipeline.add_sink('failing', RecordingSink(fail_batches=100), flush_interval=0.01, max_retries=1)
+        healthy = pipeline.add_sink('healthy', RecordingSink())
+        for index in range(6):
+            pipeline.publish(make_result(index))  # Never waits for the stuck sink
+        pipeline._workers['healthy'].flush()
+        self.assertEqual(sum(len(batch) for batch in healthy.batches), 6)
+        gate.set()
+        pipeline.close()
+        self.assertGreater(pipeline.stats()['slow']['dropped'], 0)
+        self.assertEqual(slow.batches[-1][0]['prompt_text'], 'prompt 5')  # The oldest results were dropped
+        self.assertEqual(failing.batches, [])
+        self.assertEqual(pipeline.stats()['failing']['dropped'], 6)
+        with self.assertRaises(ValueError):
+            pipeline.add_sink('healthy', RecordingSink())
+
+    def test_runner_publishes_to_repository_and_file_sinks(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        repo = SQLiteRepository(db_path=os.path.join(directory, 'prompt_logs.db'))
+        pipeline = ResultPipeline()
+        pipeline.add_sink('sqlite', RepositorySink(repo))
+        pipeline.add_sink('jsonl', JsonlSink(os.path.join(directory, 'results.jsonl')))
+        prompts = [{'category': 'cat', 'prompt_text': p} for p in ['p1', 'p2', 'p3']]
+        checkpointer = RunCheckpointer(pipeline, run_id='run-1')
+        AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(), repository=pipeline).run(prompts, checkpointer=checkpointer)
+        self.assertEqual(len(repo.fetch_logs()), 3)
+        self.assertEqual(len(pipeline.fetch_checkpoints('run-1')), 3)
+        pipeline.close()
+        with open(os.path.join(directory, 'results.jsonl')) as handle:
+            self.assertEqual(len(handle.readlines()), 3)
+
+    def test_results_a_sink_dropped_are_not_checkpointed(self):
+        class DownRepositorySink(RepositorySink):
+            def write_batch(self, results):
+                raise ConnectionError("sink unavailable")
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        down = SQLiteRepository(db_path=os.path.join(directory, 'down.db'))
+        up = SQLiteRepository(db_path=os.path.join(directory, 'up.db'))
+        pipeline = ResultPipeline()
+        pipeline.add_sink('down', DownRepositorySink(down), flush_interval=0.01, max_retries=1)
+        pipeline.add_sink('up', RepositorySink(up))
+        prompts = [{'category': 'cat', 'prompt_text': p} for p in ['p1', 'p2', 'p3']]
+        checkpointer = RunCheckpointer(pipeline, run_id='run-1')
+        AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(), repository=pipeline).run(prompts, checkpointer=checkpointer)
+        self.assertEqual(pipeline.stats()['down']['dropped'], 3)
+        self.assertEqual(down.fetch_checkpoints('run-1'), {})
+        self.assertEqual(len(up.fetch_checkpoints('run-1')), 3)
+        # Resuming from the sink that lost the rows runs them again
+        self.assertEqual(len(RunCheckpointer(pipeline, run_id='run-1').pending(prompts, DEFAULT_MODEL)), 3)
+        pipeline.close()
+
+if __name__ == '__main__':
+    unittest.main()
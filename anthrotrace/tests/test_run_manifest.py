@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+from anthrotrace.core.run_manifest import RunCheckpointer, make_prompt_id, new_run_id
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.async_anthropic_benchmark_runner import AsyncAnthropicBenchmarkRunner
+from anthrotrace.tests.test_async_anthropic_benchmark_runner import FakeAsyncClient
+
+class TestRunManifest(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.repo = SQLiteRepository(db_path=self.db_path)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_prompt_id_is_stable(self):
+        self.assertEqual(make_prompt_id('cat', 'text', 'model'), make_prompt_id('cat', 'text', 'model'))
+        self.assertNotEqual(make_prompt_id('cat', 'text', 'model'), make_prompt_id('cat', 'text', 'other'))
+        self.assertTrue(new_run_id().startswith('run-'))
+
+    def test_checkpoints_are_batched(self):
+        checkpointer = RunCheckpointer(self.repo, run_id='run-1', flush_every=3, flush_interval=3600)
+        checkpointer.record('a', 'success')
+        checkpointer.record('b', 'failure')
+        self.assertEqual(self.repo.fetch_checkpoints('run-1'), {})
+        checkpointer.record('c', 'success')
+        self.assertEqual(self.repo.fetch_checkpoints('run-1'), {'a': 'success', 'b': 'failure', 'c': 'success'})
+        self.assertEqual(RunCheckpointer(self.repo, run_id='run-1').completed_prompt_ids(), {'a', 'c'})
+
+    def test_resume_only_retries_unfinished_prompts(self):
+        prompts = [{'category': 'cat', 'prompt_text': p} for p in ['p1', 'bad', 'p3']]
+        checkpointer = RunCheckpointer(self.repo, run_id='run-2', flush_every=100)
+        first = AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(fail_on='bad'), repository=self.repo)
+        results = first.run(prompts, checkpointer=checkpointer)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(result['run_id'] == 'run-2' for result in results))
+
+        resumed = AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(), repository=self.repo)
+        retried = resumed.run(prompts, checkpointer=RunCheckpointer(self.repo, run_id='run-2'))
+        self.assertEqual([result['prompt_text'] for result in retried], ['bad'])
+        self.assertEqual(retried[0]['status'], 'success')
+        logs = self.repo.fetch_logs(limit=10)
+        self.assertEqual(len(logs), 4)
+        self.assertEqual({log['prompt_id'] for log in logs}, {make_prompt_id('cat', p, 'claude-sonnet-4-20250514') for p in ['p1', 'bad', 'p3']})
+
+if __name__ == '__main__':
+    unittest.main()
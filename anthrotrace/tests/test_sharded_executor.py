@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+from importlib.util import find_spec
+from anthrotrace.core.async_anthropic_benchmark_runner import AsyncAnthropicBenchmarkRunner
+from anthrotrace.core.benchmark_results import build_result, emit_result_metrics
+from anthrotrace.core.sharded_executor import merge_shards, run_shard, shard_db_path, shard_prompts
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.yaml_prompt_loader import load_prompts_with_categories
+from anthrotrace.tests.test_async_anthropic_benchmark_runner import FakeAsyncClient
+
+PROMPTS_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'anthrotrace_common_prompts.yaml')
+
+
+def fake_runner_factory(repository, api_key=None, max_concurrency=100, metrics_exporter=None):
+    return AsyncAnthropicBenchmarkRunner(client=FakeAsyncClient(), repository=repository, max_concurrency=max_concurrency)
+
+
+class EmittingRunner:
+    """Emits a result per prompt without flushing the exporter, as a runner cut short would."""
+    def __init__(self, metrics_exporter):
+        self.metrics_exporter = metrics_exporter
+
+    def run(self, prompts, model=None, checkpointer=None):
+        for prompt in prompts:
+            emit_result_metrics(self.metrics_exporter, build_result(prompt['category'], model, prompt['prompt_text'],
+                                                                    'answer', 10, 20, 0.5, 0.01))
+
+
+class TestShardedExecutor(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_shards_are_deterministic_and_complete(self):
+        prompts = load_prompts_with_categories(PROMPTS_PATH)
+        shards = shard_prompts(prompts, 4)
+        self.assertEqual(shards, shard_prompts(list(prompts), 4))
+        self.assertEqual(sum(len(shard) for shard in shards), len(prompts))
+        self.assertTrue(all(shards))
+
+    def test_run_and_merge_shards(self):
+        prompts = load_prompts_with_categories(PROMPTS_PATH)
+        paths = [run_shard(PROMPTS_PATH, index, 3, output_dir=self.output_dir, run_id='run-1',
+                           runner_factory=fake_runner_factory) for index in range(3)]
+        self.assertEqual(paths[1], shard_db_path(self.output_dir, 1, 3))
+
+        # Re-running a finished shard with the same run id resumes it and adds nothing
+        run_shard(PROMPTS_PATH, 0, 3, output_dir=self.output_dir, run_id='run-1', runner_factory=fake_runner_factory)
+
+        target = SQLiteRepository(db_path=os.path.join(self.output_dir, 'main.db'))
+        self.assertEqual(merge_shards(paths, target), len(prompts))
+        logs = target.fetch_logs(limit=1000)
+        self.assertEqual(len(logs), len(prompts))
+        self.assertEqual({log['run_id'] for log in logs}, {'run-1'})
+        self.assertEqual(len(target.fetch_checkpoints('run-1')), len(prompts))
+
+        # Merging again (e.g. a retried merge) adds nothing
+        self.assertEqual(merge_shards(paths, target), 0)
+        self.assertEqual(len(target.fetch_logs(limit=1000)), len(prompts))
+
+    def test_merge_normalized_shards(self):
+        class ListRepository:
+            def __init__(self):
+                self.rows = []
+            def insert_results(self, results):
+                self.rows.extend(results)
+
+        prompts = load_prompts_with_categories(PROMPTS_PATH)
+        paths = [run_shard(PROMPTS_PATH, index, 2, output_dir=self.output_dir, runner_factory=fake_runner_factory,
+                           text_storage='zlib') for index in range(2)]
+        target = SQLiteRepository(db_path=os.path.join(self.output_dir, 'main.db'))
+        self.assertEqual(merge_shards(paths, target), len(prompts))
+        logs = target.fetch_logs(limit=1000)
+        self.assertEqual(sorted(log['prompt_text'] for log in logs), sorted(p['prompt_text'] for p in prompts))
+        self.assertTrue(all(isinstance(log['response'], str) for log in logs))
+
+        other = ListRepository()
+        self.assertEqual(merge_shards(paths, other, batch_size=7), len(prompts))
+        self.assertEqual(sorted(row['prompt_text'] for row in other.rows), sorted(p['prompt_text'] for p in prompts))
+        self.assertEqual(merge_shards(paths, other, batch_size=7), 0)
+        self.assertEqual(merge_shards(paths, other, target_name='another-target'), len(prompts))
+        # Merge progress is kept apart from the shard's own summary index
+        shard = SQLiteRepository(db_path=paths[0])
+        self.assertEqual(shard.conn.execute("SELECT COUNT(*) FROM summary_watermarks "
+                                            "WHERE name LIKE 'merged_into:%'").fetchone()[0], 0)
+        self.assertIn('another-target', {row[0] for row in shard.conn.execute("SELECT target FROM merge_watermarks")})
+        shard.close()
+
+    def test_invalid_shard_index(self):
+        with self.assertRaises(ValueError):
+            run_shard(PROMPTS_PATH, 3, 3, output_dir=self.output_dir, runner_factory=fake_runner_factory)
+
+    @unittest.skipUnless(find_spec('prometheus_client'), 'prometheus_client is not installed')
+    def test_worker_flushes_result_metrics(self):
+        exporters = []
+
+        def emitting_runner_factory(repository, api_key=None, max_concurrency=100, metrics_exporter=None):
+            exporters.append(metrics_exporter)
+            return EmittingRunner(metrics_exporter)
+
+        run_shard(PROMPTS_PATH, 0, 2, output_dir=self.output_dir, runner_factory=emitting_runner_factory,
+                  export_metrics=True)
+        self.assertEqual(len(exporters[0]._families._pending), 0)
+        shard = shard_prompts(load_prompts_with_categories(PROMPTS_PATH), 2)[0]
+        categories = {prompt['category'] for prompt in shard}
+        successes = sum(exporters[0].registry.get_sample_value('prompt_success_total', {'category': category}) or 0
+                        for category in categories)
+        self.assertGreaterEqual(successes, len(shard))
+
+if __name__ == '__main__':
+    unittest.main()
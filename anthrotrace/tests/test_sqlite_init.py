@@ -1,7 +1,9 @@
 import unittest
 import tempfile
 import os
+import sqlite3
 from anthrotrace.core.sqlite_init import initialize_db
+from anthrotrace.core.sqlite_migrations import LATEST_VERSION, current_version
 
 class TestSQLiteInit(unittest.TestCase):
     def test_initialize_db(self):
@@ -14,6 +16,10 @@ class TestSQLiteInit(unittest.TestCase):
             sqlite_init_mod.DB_PATH = db_path
             initialize_db()
             self.assertTrue(os.path.exists(db_path))
+            conn = sqlite3.connect(db_path)
+            self.assertEqual(current_version(conn), LATEST_VERSION)
+            conn.close()
+            initialize_db()  # Running it again is a no-op
             sqlite_init_mod.DB_PATH = old_db_path
         finally:
             os.unlink(db_path)
@@ -0,0 +1,83 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from anthrotrace.core.sqlite_migrations import LATEST_VERSION, apply_migrations, current_version
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+
+class TestSQLiteMigrations(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+    def test_fresh_database(self):
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(apply_migrations(conn), list(range(1, LATEST_VERSION + 1)))
+        self.assertEqual(apply_migrations(conn), [])
+        self.assertEqual(current_version(conn), LATEST_VERSION)
+        columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(prompt_logs)")}
+        self.assertEqual(columns['timestamp'], 'INTEGER')
+        self.assertIn('id', columns)
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(prompt_logs)")}
+        self.assertTrue({'idx_prompt_logs_timestamp', 'idx_prompt_logs_category_timestamp',
+                         'idx_prompt_logs_model_timestamp'} <= indexes)
+        conn.close()
+
+    def test_legacy_text_timestamps_are_converted(self):
+        # Layout written by SQLiteRepository before migrations existed
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+        CREATE TABLE prompt_logs (category TEXT NOT NULL, model TEXT NOT NULL, prompt_text TEXT NOT NULL,
+            response TEXT, input_tokens INTEGER, output_tokens INTEGER, duration REAL, cost REAL,
+            timestamp TEXT NOT NULL, status TEXT)
+        """)
+        conn.executemany("INSERT INTO prompt_logs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            ('cat', 'model', 'a', 'resp', 1, 2, 0.5, 0.01, '2024-06-01T00:00:00+00:00', 'success'),
+            ('cat', 'model', 'b', 'resp', 1, 2, 0.5, 0.01, '2024-06-02 12:00:00', 'success'),
+            ('cat', 'model', 'c', None, 0, 0, 0.0, 0.0, '2024-06-03T00:00:00Z', 'failure'),
+        ])
+        conn.commit()
+        conn.close()
+
+        repo = SQLiteRepository(db_path=self.db_path)
+        logs = repo.fetch_logs(limit=10)
+        self.assertEqual([log['prompt_text'] for log in logs], ['c', 'b', 'a'])
+        self.assertEqual(logs[1]['timestamp'], '2024-06-02T12:00:00.000+00:00')
+        self.assertEqual(logs[0]['status'], 'failure')
+        stored = repo.conn.execute("SELECT timestamp FROM prompt_logs ORDER BY id").fetchall()
+        self.assertEqual(stored[0][0], 1717200000000)
+
+        filtered = repo.fetch_logs(start_time='2024-06-02T00:00:00', end_time='2024-06-02T23:59:59')
+        self.assertEqual([log['prompt_text'] for log in filtered], ['b'])
+
+    def test_merge_watermarks_move_out_of_the_summary_index(self):
+        # A version 6 shard kept its merge progress next to the summary index watermark
+        repo = SQLiteRepository(db_path=self.db_path)
+        repo.conn.executescript("""
+        DROP TABLE merge_watermarks;
+        DELETE FROM schema_version WHERE version = 7;
+        INSERT INTO summary_watermarks (name, last_id) VALUES ('merged_into:main.db', 42), ('summary_buckets', 50);
+        """)
+        repo.close()
+
+        repo = SQLiteRepository(db_path=self.db_path)
+        self.assertEqual(repo.conn.execute("SELECT target, last_id FROM merge_watermarks").fetchall(),
+                         [('main.db', 42)])
+        self.assertEqual(repo.conn.execute("SELECT name FROM summary_watermarks").fetchall(), [('summary_buckets',)])
+        repo.close()
+
+    def test_dashboard_queries_use_indexes(self):
+        repo = SQLiteRepository(db_path=self.db_path)
+        plan = repo.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM prompt_logs WHERE category = ? AND timestamp >= ? "
+            "ORDER BY timestamp DESC LIMIT 100", ('cat', 0)
+        ).fetchall()
+        self.assertIn('idx_prompt_logs_category_timestamp', ' '.join(str(row[-1]) for row in plan))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
 import unittest
+import sqlite3
 import tempfile
 import os
+import time
+from importlib.util import find_spec
+from anthrotrace.core.benchmark_summary_service import SUMMARY_FRAME_COLUMNS, reduce_frame
 from anthrotrace.core.sqlite_repository import SQLiteRepository
 
 class TestSQLiteRepository(unittest.TestCase):
@@ -10,7 +14,9 @@ class TestSQLiteRepository(unittest.TestCase):
 
     def tearDown(self):
         os.close(self.db_fd)
-        os.unlink(self.db_path)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
 
     def test_insert_and_fetch(self):
         self.repo.insert_log('cat', 'model', 'prompt', 'resp', 1, 2, 0.5, 0.01, '2024-06-01T00:00:00')
@@ -20,11 +26,239 @@ class TestSQLiteRepository(unittest.TestCase):
         self.assertEqual(logs[0]['model'], 'model')
         self.assertEqual(logs[0]['prompt_text'], 'prompt')
         self.assertEqual(logs[0]['response'], 'resp')
+        # Epoch 0 is a bound, not a missing one
+        self.assertEqual(self.repo.fetch_logs(end_time=0), [])
+        self.assertIsNone(self.repo.aggregate_summary(end_time=0))
+        self.assertEqual(len(self.repo.fetch_logs(start_time=0)), 1)
+
+    def test_insert_result(self):
+        self.repo.insert_result({
+            'category': 'cat', 'model': 'model', 'prompt_text': 'prompt', 'response': None,
+            'input_tokens': 0, 'output_tokens': 0, 'duration': 0.0, 'cost': 0.0,
+            'timestamp': '2024-06-01T00:00:00', 'status': 'throttled'
+        })
+        logs = self.repo.fetch_logs()
+        self.assertEqual(logs[0]['status'], 'throttled')
 
     def test_get_all_logs(self):
         self.repo.insert_log('cat', 'model', 'prompt', 'resp', 1, 2, 0.5, 0.01, '2024-06-01T00:00:00')
         logs = self.repo.get_all_logs()
         self.assertEqual(len(logs), 1)
 
+    def test_aggregate_summary_covers_every_row(self):
+        results = [
+            {'category': 'cat', 'model': 'model', 'prompt_text': f'p{i}', 'response': 'resp', 'input_tokens': 10,
+             'output_tokens': 20, 'duration': 1.0, 'cost': 0.01, 'timestamp': f'2024-06-01T00:{i % 60:02d}:00'}
+            for i in range(150)
+        ]
+        results.append({'category': 'cat', 'model': 'model', 'prompt_text': 'cached', 'response': 'resp',
+                        'input_tokens': 10, 'output_tokens': 20, 'duration': 0.0, 'cost': 0.0, 'cached': True,
+                        'timestamp': '2024-06-02T00:00:00'})
+        results.append({'category': 'cat', 'model': 'model', 'prompt_text': 'throttled', 'response': None,
+                        'input_tokens': 0, 'output_tokens': 0, 'duration': 0.0, 'cost': 0.0,
+                        'status': 'throttled', 'timestamp': '2024-06-01T00:00:00'})
+        self.repo.insert_results(results)
+        summary = self.repo.aggregate_summary(category='cat')
+        self.assertEqual(summary['total_runs'], 152)
+        self.assertEqual(summary['success_count'], 151)
+        self.assertEqual(summary['throttled_count'], 1)
+        self.assertEqual(summary['failure_count'], 0)
+        self.assertEqual(summary['cached_count'], 1)
+        self.assertEqual(summary['input_tokens'], 1510)
+        self.assertEqual(summary['latency_count'], 151)
+        self.assertAlmostEqual(summary['latency_sum'], 150.0)
+        self.assertEqual(summary['last_timestamp'], '2024-06-02T00:00:00.000+00:00')
+        self.assertIsNone(self.repo.aggregate_summary(category='other'))
+
+    def test_iter_logs_pages_by_timestamp_and_id(self):
+        # Ties on timestamp straddle page boundaries; keyset paging must neither skip nor repeat them
+        self.repo.insert_results([
+            {'category': 'cat', 'model': 'model', 'prompt_text': f'p{i}', 'response': 'resp', 'input_tokens': i,
+             'output_tokens': 0, 'duration': 0.5, 'cost': 0.0, 'timestamp': 1717200000000 + i // 4}
+            for i in range(25)
+        ])
+        logs = list(self.repo.iter_logs(category='cat', batch_size=3, columns=['id', 'input_tokens', 'timestamp']))
+        self.assertEqual(len(logs), 25)
+        self.assertEqual(sorted(log['input_tokens'] for log in logs), list(range(25)))
+        self.assertEqual(set(logs[0]), {'id', 'input_tokens', 'timestamp'})
+        self.assertEqual(logs[0]['timestamp'], '2024-06-01T00:00:00.006+00:00')
+        keys = [(log['timestamp'], log['id']) for log in logs]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertEqual(len(self.repo.fetch_logs(limit=10)), 10)
+        with self.assertRaises(ValueError):
+            next(self.repo.iter_logs(columns=['cost; DROP TABLE prompt_logs']))
+
+    @unittest.skipUnless(find_spec('pandas'), "pandas is not installed")
+    def test_fetch_logs_df_builds_typed_columns(self):
+        self.repo.insert_results([
+            {'category': 'cat', 'model': 'model', 'prompt_text': f'p{i}', 'response': 'resp' if i % 3 else '',
+             'input_tokens': i, 'output_tokens': 2, 'duration': 0.5, 'cost': 0.01, 'cached': i == 4,
+             'timestamp': 1717200000000 + i}
+            for i in range(7)
+        ])
+        self.repo.insert_log('cat', 'model', 'legacy', 'resp', None, None, 0.5)  # NULL token counts
+        df = self.repo.fetch_logs_df(category='cat', columns=['timestamp', 'input_tokens', 'cost', 'success'],
+                                     batch_size=3)
+        self.assertEqual(len(df), 8)
+        self.assertEqual(str(df['timestamp'].dtype), 'datetime64[ms, UTC]')
+        self.assertEqual(str(df['input_tokens'].dtype), 'float64')
+        self.assertEqual(str(df['cost'].dtype), 'float64')
+        self.assertEqual(str(df['success'].dtype), 'bool')
+        self.assertEqual(int(df['success'].sum()), 5)
+        self.assertEqual(list(self.repo.fetch_logs_df(limit=1).columns), list(self.repo.fetch_logs()[0]))
+        self.assertEqual(len(self.repo.fetch_logs_df(category='other', columns=['cost'])), 0)
+
+        summary = self.repo.aggregate_summary()
+        reduced = reduce_frame(self.repo.fetch_logs_df(columns=SUMMARY_FRAME_COLUMNS))
+        for key in ('total_runs', 'success_count', 'failure_count', 'cached_count', 'latency_count',
+                    'input_tokens'):
+            self.assertEqual(reduced[key], summary[key], key)
+
+    def test_normalized_text_storage_round_trips(self):
+        for mode in ('zlib', 'hash'):
+            db_path = f'{self.db_path}.{mode}'
+            repo = SQLiteRepository(db_path=db_path, text_storage=mode)
+            try:
+                response = 'OpenTelemetry is an observability framework. ' * 20
+                repo.insert_results([
+                    {'category': 'cat', 'model': 'model', 'prompt_text': 'Summarize OpenTelemetry.',
+                     'response': response if i else None, 'input_tokens': 1, 'output_tokens': 2,
+                     'duration': 0.5, 'cost': 0.01, 'timestamp': 1717200000000 + i}
+                    for i in range(5)
+                ])
+                repo.insert_log('cat', 'model', 'What is tracing?', 'Tracing tracks requests.', 1, 2, 0.5)
+                self.assertEqual(repo.conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0], 2)
+                self.assertEqual(repo.conn.execute("SELECT COUNT(*) FROM prompt_logs WHERE prompt_text = ''").fetchone()[0], 6)
+                logs = repo.fetch_logs(limit=10)
+                self.assertEqual(logs[0]['prompt_text'], 'What is tracing?')
+                self.assertEqual(logs[1]['prompt_text'], 'Summarize OpenTelemetry.')
+                self.assertIsNone(logs[-1]['response'])
+                if mode == 'zlib':
+                    self.assertEqual(logs[1]['response'], response)
+                else:
+                    self.assertTrue(logs[1]['response'].startswith(f'[response not stored: {len(response)} chars'))
+                self.assertEqual(repo.aggregate_summary()['success_count'], 5)
+            finally:
+                repo.close()
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(db_path + suffix):
+                        os.unlink(db_path + suffix)
+        with self.assertRaises(ValueError):
+            SQLiteRepository(db_path=self.db_path, text_storage='gzip')
+
+    def test_log_days_and_delete_logs_for_retention(self):
+        for index, timestamp in enumerate(['2024-06-01T23:59:59', '2024-06-01T08:00:00', '2024-06-03T00:00:00',
+                                           '2024-06-05T12:00:00']):
+            self.repo.insert_log('cat', 'model', f'p{index}', 'resp', 1, 2, 0.5, 0.01, timestamp)
+        self.assertEqual([day.isoformat() for day in self.repo.log_days()], ['2024-06-01', '2024-06-03', '2024-06-05'])
+        self.assertEqual(len(self.repo.log_days(end_time='2024-06-05T00:00:00')), 2)
+
+        # Only rows up to max_id go, so rows written after an export survive its delete
+        self.assertEqual(self.repo.delete_logs('2024-06-01T00:00:00', '2024-06-01T23:59:59.999', max_id=1), 1)
+        self.assertEqual(self.repo.delete_logs('2024-06-01T00:00:00', '2024-06-01T23:59:59.999'), 1)
+        self.repo.vacuum()
+        self.assertEqual([log['prompt_text'] for log in self.repo.fetch_logs()], ['p3', 'p2'])
+
+    def test_quantiles_come_from_folded_hourly_sketches(self):
+        results = [
+            {'category': 'cat', 'model': 'model', 'prompt_text': f'p{i}', 'response': 'resp', 'input_tokens': 1,
+             'output_tokens': 2, 'duration': float(i + 1), 'cost': 0.001 * (i + 1),
+             'timestamp': f'2024-06-01T{i // 10:02d}:{i % 10 * 6:02d}:00'}
+            for i in range(100)
+        ]
+        self.repo.insert_results(results[:60])
+        self.assertEqual(self.repo.fold_summary_index(), 60)
+        self.assertEqual(self.repo.fold_summary_index(), 0)
+        self.repo.insert_results(results[60:])  # Not folded yet; summaries scan these rows
+
+        summary = self.repo.aggregate_summary()
+        self.assertAlmostEqual(summary['latency_p50_sec'], 51.0, delta=0.6)
+        self.assertAlmostEqual(summary['latency_p99_sec'], 100.0, delta=1.0)
+        self.assertAlmostEqual(summary['cost_p90_usd'], 0.091, delta=0.001)
+        # Partial hours at the window edges are read from the rows
+        window = self.repo.aggregate_summary(start_time='2024-06-01T01:30:00', end_time='2024-06-01T03:30:00')
+        self.assertEqual(window['latency_sketch'].count, 21)
+        self.assertAlmostEqual(window['latency_p50_sec'], 26.0, delta=0.3)
+
+        # Deleting rows recomputes the stored hours they touched
+        self.repo.delete_logs(end_time='2024-06-01T04:30:00')
+        summary = self.repo.aggregate_summary()
+        self.assertEqual(summary['latency_sketch'].count, 54)
+        self.assertAlmostEqual(summary['latency_p50_sec'], 74.0, delta=0.8)
+
+    def test_writers_fold_and_summaries_only_read(self):
+        repo = SQLiteRepository(db_path=self.db_path, flush_rows=10)
+        for index in range(25):
+            repo.insert_log('cat', 'model', f'p{index}', 'resp', 1, 2, 0.5, 0.01, f'2024-06-01T00:{index:02d}:00')
+        watermark = "SELECT last_id FROM summary_watermarks WHERE name = 'summary_buckets'"
+        self.assertEqual(repo.conn.execute(watermark).fetchone()[0], 20)  # Folded every 10 rows
+        # A summary while another connection holds the write lock neither waits for it nor folds
+        other = sqlite3.connect(self.db_path, timeout=0)
+        other.execute("BEGIN IMMEDIATE")
+        started = time.monotonic()
+        self.assertEqual(repo.aggregate_summary()['total_runs'], 25)
+        self.assertLess(time.monotonic() - started, 1.0)
+        other.rollback()
+        other.close()
+        self.assertEqual(repo.conn.execute(watermark).fetchone()[0], 20)
+        repo.close()
+
+    def test_summary_index_matches_a_scan_for_any_window(self):
+        # Three rows a day for 40 days, two models, one batch row per day without latency
+        results = [
+            {'category': 'cat' if day % 3 else 'other', 'model': f'model-{slot % 2}', 'prompt_text': f'p{day}-{slot}',
+             'response': '' if slot == 1 else 'resp', 'input_tokens': day, 'output_tokens': slot,
+             'duration': 0.5 + day + slot / 10, 'cost': 0.001 * (day + 1), 'execution_mode': 'batch' if slot == 2 else None,
+             'timestamp': f'2024-{5 + day // 30:02d}-{day % 30 + 1:02d}T{slot * 8 + 3:02d}:{slot * 20:02d}:00'}
+            for day in range(40) for slot in range(3)
+        ]
+        self.repo.insert_results(results)
+        self.repo.fold_summary_index()
+        windows = [(None, None), ('2024-05-03T00:00:00', '2024-06-07T23:59:59.999'),
+                   ('2024-05-02T05:00:00', '2024-05-20T12:30:00'), ('2024-05-04T10:10:00', '2024-05-04T19:00:00')]
+        for start_time, end_time in windows:
+            for category, model in ((None, None), ('cat', None), ('other', 'model-1')):
+                indexed = self.repo.aggregate_summary(category, model, start_time, end_time)
+                rows = [result for result in results if result['category'] == (category or result['category'])
+                        and result['model'] == (model or result['model'])
+                        and (start_time is None or start_time <= result['timestamp'] <= end_time)]
+                if not rows:
+                    self.assertIsNone(indexed)
+                    continue
+                latencies = [row['duration'] for row in rows if row['execution_mode'] != 'batch']
+                self.assertEqual(indexed['total_runs'], len(rows))
+                self.assertEqual(indexed['failure_count'], sum(1 for row in rows if not row['response']))
+                self.assertEqual(indexed['input_tokens'], sum(row['input_tokens'] for row in rows))
+                self.assertAlmostEqual(indexed['cost'], sum(row['cost'] for row in rows))
+                self.assertEqual(indexed['latency_count'], len(latencies))
+                self.assertEqual((indexed['min_latency'], indexed['max_latency']), (min(latencies), max(latencies)))
+                self.assertEqual(indexed['cost_sketch'].count, len(rows))
+    def test_write_behind_flushes_on_demand(self):
+        repo = SQLiteRepository(db_path=self.db_path, write_behind=True, flush_rows=1000, flush_interval=3600)
+        for index in range(10):
+            repo.insert_log('cat', 'model', f'prompt {index}', 'resp', 1, 2, 0.5, 0.01, '2024-06-01T00:00:00')
+        repo.record_checkpoints('run-1', [('p1', 'success', '2024-06-01T00:00:00')])
+        self.assertEqual(repo.fetch_logs(limit=100), [])
+        repo.flush()
+        self.assertEqual(len(repo.fetch_logs(limit=100)), 10)
+        self.assertEqual(repo.fold_summary_index(), 0)  # The writer folded its batch into the summary index
+        self.assertEqual(repo.fetch_checkpoints('run-1'), {'p1': 'success'})
+        repo.close()
+
+    def test_write_behind_flushes_by_row_count_and_on_close(self):
+        repo = SQLiteRepository(db_path=self.db_path, write_behind=True, flush_rows=5, flush_interval=3600)
+        repo.insert_results([{
+            'category': 'cat', 'model': 'model', 'prompt_text': f'prompt {index}', 'response': 'resp',
+            'timestamp': '2024-06-01T00:00:00'
+        } for index in range(7)])
+        deadline = time.monotonic() + 5
+        while len(repo.fetch_logs(limit=100)) < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(repo.fetch_logs(limit=100)), 5)  # Two rows wait for the next batch
+        repo.close()
+        with self.assertRaises(RuntimeError):
+            repo.insert_result({'category': 'cat'})
+        self.assertEqual(len(SQLiteRepository(db_path=self.db_path).fetch_logs(limit=100)), 7)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
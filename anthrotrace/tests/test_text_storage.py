@@ -0,0 +1,32 @@
+import unittest
+from anthrotrace.core.text_storage import decode_response, encode_response, prompt_key
+
+class TestTextStorage(unittest.TestCase):
+    def test_zlib_round_trip(self):
+        text = "Tracing tracks requests across services. " * 50
+        stored = encode_response(text, "zlib")
+        self.assertIsInstance(stored, bytes)
+        self.assertLess(len(stored), len(text) // 5)
+        self.assertEqual(decode_response(stored), text)
+
+    def test_hash_keeps_identity_only(self):
+        stored = encode_response("résumé", "hash")
+        self.assertEqual(len(stored), 1 + 32 + 4)
+        self.assertTrue(decode_response(stored).startswith("[response not stored: 6 chars, sha256 "))
+
+    def test_empty_and_plain_values_are_untouched(self):
+        for mode in ("plain", "zlib", "hash"):
+            self.assertIsNone(encode_response(None, mode))
+            self.assertEqual(encode_response("", mode), "")
+        self.assertEqual(encode_response("ok", "plain"), "ok")
+        self.assertEqual(decode_response("ok"), "ok")
+        with self.assertRaises(ValueError):
+            encode_response("ok", "gzip")
+
+    def test_prompt_key_is_stable(self):
+        self.assertEqual(prompt_key("What is tracing?"), prompt_key("What is tracing?"))
+        self.assertEqual(len(prompt_key("What is tracing?")), 16)
+        self.assertNotEqual(prompt_key("a"), prompt_key("b"))
+
+if __name__ == '__main__':
+    unittest.main()
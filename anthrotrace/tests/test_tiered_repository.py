@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from importlib.util import find_spec
+from anthrotrace.core.in_memory_repository import InMemoryPromptLogRepository
+from anthrotrace.core.sqlite_repository import SQLiteRepository
+from anthrotrace.core.tiered_repository import TieredPromptLogRepository, combine_totals
+
+def totals(runs, latency_sum, latency_count, last_timestamp):
+    return {
+        'total_runs': runs, 'success_count': runs - 1, 'throttled_count': 1, 'cached_count': 0, 'failure_count': 0,
+        'input_tokens': 10 * runs, 'output_tokens': 20 * runs, 'cost': 0.5, 'duration_sum': latency_sum,
+        'latency_sum': latency_sum, 'latency_count': latency_count, 'last_timestamp': last_timestamp,
+        'average_latency_sec': latency_sum / latency_count,
+    }
+
+class DummyHot:
+    def iter_logs(self, **kwargs):
+        yield {'prompt_text': 'hot', 'timestamp': '2024-06-15T08:00:00.000+00:00'}
+
+class DummyArchive:
+    class Table:
+        def __init__(self, rows):
+            self.rows = rows
+        def to_batches(self, max_chunksize):
+            class Batch:
+                def __init__(self, rows):
+                    self.rows = rows
+                def to_pylist(self):
+                    return self.rows
+            return [Batch(self.rows[i:i + max_chunksize]) for i in range(0, len(self.rows), max_chunksize)]
+
+    def column_names(self):
+        return ['prompt_text', 'timestamp']
+    def read_days(self, **kwargs):
+        yield self.Table([{'prompt_text': 'day 2', 'timestamp': '2024-05-02T01:00:00'}])
+        yield self.Table([{'prompt_text': 'day 1', 'timestamp': '2024-05-01T01:00:00'}])
+
+class TestTieredRepository(unittest.TestCase):
+    def test_combine_totals_adds_disjoint_tiers(self):
+        combined = combine_totals(totals(4, 4.0, 2, '2024-06-15T08:00:00.000+00:00'), None,
+                                  totals(6, 2.0, 2, '2024-05-02T01:00:00'))
+        self.assertEqual(combined['total_runs'], 10)
+        self.assertEqual(combined['throttled_count'], 2)
+        self.assertEqual(combined['average_latency_sec'], 1.5)
+        self.assertEqual(combined['last_timestamp'], '2024-06-15T08:00:00.000+00:00')
+        self.assertIsNone(combine_totals(None, None))
+
+    @unittest.skipUnless(find_spec('numpy'), 'numpy is not installed')
+    def test_combine_in_memory_and_sqlite_summaries(self):
+        def result(index, hour):
+            return {'category': 'cat', 'model': 'm', 'prompt_text': f'p{index}', 'response': 'ok', 'input_tokens': 1,
+                    'output_tokens': 2, 'duration': float(index), 'cost': 0.01 * index,
+                    'timestamp': f'2024-06-15T{hour:02d}:00:{index:02d}'}
+
+        memory = InMemoryPromptLogRepository()
+        memory.insert_results([result(index, 8) for index in range(1, 11)])
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite = SQLiteRepository(db_path=os.path.join(directory, 'cold.db'))
+            sqlite.insert_results([result(index, 7) for index in range(11, 21)])
+            combined = combine_totals(memory.aggregate_summary(), sqlite.aggregate_summary())
+            sqlite.close()
+        self.assertEqual(combined['total_runs'], 20)
+        self.assertEqual((combined['min_latency'], combined['max_latency']), (1.0, 20.0))
+        self.assertAlmostEqual(combined['latency_p50_sec'], 11.0, delta=0.2)
+        self.assertAlmostEqual(combined['latency_p99_sec'], 20.0, delta=0.4)
+        self.assertAlmostEqual(combined['cost_p90_usd'], 0.19, delta=0.004)
+
+    def test_rows_come_from_the_hot_store_then_archived_days(self):
+        repo = TieredPromptLogRepository(DummyHot(), DummyArchive())
+        logs = repo.fetch_logs(limit=2)
+        self.assertEqual([log['prompt_text'] for log in logs], ['hot', 'day 2'])
+        self.assertEqual(logs[1]['timestamp'], '2024-05-02T01:00:00.000+00:00')
+        self.assertEqual(len(repo.get_all_logs()), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,12 @@ setup(
         "clickhouse-connect",
         # Add any other dependencies here
     ],
+    extras_require={
+        "zstd": ["zstandard"],
+        "arrow": ["pyarrow", "numpy"],
+        "archive": ["pyarrow"],
+        "all": ["zstandard", "pyarrow", "numpy"],
+    },
     python_requires=">=3.8",
     include_package_data=True,
 ) 
\ No newline at end of file